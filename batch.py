@@ -0,0 +1,163 @@
+# batch.py
+#
+# Runs many independent .vlx scripts across a pool of worker processes.
+#
+# Starting a Python process per script pays for interpreter startup and for
+# importing the lexer, parser and engines every time. A batch instead runs
+# scripts in a ProcessPoolExecutor whose workers import everything once and
+# keep one cache.Cache for their whole life, so parsed and compiled artifacts
+# are shared between workers and between batches through the cache directory.
+# Scripts are handed to workers in chunks to keep the cost of inter-process
+# communication small next to the cost of running them.
+#
+# Every script gets its own output buffer and error, so their output never
+# interleaves; results come back in the order the scripts were given.
+#
+# Usage: python batch.py DIRECTORY|MANIFEST|SCRIPT ... [-j WORKERS]
+#
+# A manifest is a text file listing one script per line, relative to the
+# manifest's directory; blank lines and lines starting with # are ignored.
+
+import argparse
+import collections
+import concurrent.futures
+import contextlib
+import io
+import os
+import sys
+import time
+
+import cache
+import jit
+import lexer
+import optimizer
+import output
+import parser
+import runtime
+import transpiler
+
+# The outcome of one script: everything it printed, its error message or
+# None, and how long it took in seconds.
+Result = collections.namedtuple('Result', 'path output error seconds')
+
+# The per-process state of a worker, set up by initialize_worker.
+_worker = {'cache': None, 'compiled': False, 'optimize': 0}
+
+
+def collect_scripts(target):
+    """Return the scripts named by a directory, manifest or script path."""
+    if os.path.isdir(target):
+        scripts = []
+        for directory, subdirectories, files in os.walk(target):
+            subdirectories[:] = sorted(name for name in subdirectories if name != cache.CACHE_DIRECTORY_NAME)
+            scripts.extend(os.path.join(directory, name) for name in sorted(files) if name.endswith('.vlx'))
+        return scripts
+    if target.endswith('.vlx'):
+        return [target]
+    base = os.path.dirname(target)
+    with open(target) as manifest:
+        return [os.path.join(base, line.strip()) for line in manifest
+                if line.strip() and not line.lstrip().startswith('#')]
+
+
+def initialize_worker(cache_directory=None, use_cache=True, compiled=False, optimize=0):
+    """Prepare a process to run scripts."""
+    if use_cache:
+        _worker['cache'] = cache.Cache(cache_directory) if cache_directory else cache.default_cache()
+    else:
+        _worker['cache'] = None
+    _worker['compiled'] = compiled
+    _worker['optimize'] = optimize
+
+
+def run_script(path):
+    """Run one script in this process and return its Result."""
+    buffer = io.StringIO()
+    error = None
+    start = time.perf_counter()
+    # Parsers report syntax errors with print, so stdout is redirected to
+    # the same buffer as the script's own output.
+    with contextlib.redirect_stdout(buffer):
+        try:
+            with open(path) as source:
+                text = source.read()
+            execute(text, path, output.StreamSink(buffer, line_buffered=False))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    return Result(path, buffer.getvalue(), error, time.perf_counter() - start)
+
+
+def execute(text, path, sink):
+    """Run source text with the worker's settings, printing to sink."""
+    artifacts, optimize = _worker['cache'], _worker['optimize']
+    if _worker['compiled']:
+        engine = transpiler.CompiledRuntime(sink)
+        if artifacts is not None:
+            engine.run_code(artifacts.python_code(text, path, optimize))
+            return
+    else:
+        engine = runtime.Runtime(sink, jit_threshold=jit.HOT_LOOP)
+    if artifacts is not None:
+        ast = artifacts.parse(text, path)
+    else:
+        ast = parser.Parser(lexer.Lexer(text).stream(), text).parse()
+    engine.run(optimizer.optimize(ast, optimize))
+
+
+def _run_chunk(paths):
+    return [run_script(path) for path in paths]
+
+
+def run_batch(paths, workers=None, cache_directory=None, use_cache=True, compiled=False, optimize=0):
+    """Run scripts in worker processes and yield their Results in order.
+
+    workers defaults to the number of CPUs; with workers=0 the scripts run
+    one after another in this process.
+    """
+    settings = (cache_directory, use_cache, compiled, optimize)
+    if workers == 0:
+        initialize_worker(*settings)
+        for path in paths:
+            yield run_script(path)
+        return
+
+    workers = workers or os.cpu_count() or 1
+    # Several chunks per worker keep them all busy when run times vary.
+    size = max(1, len(paths) // (workers * 4))
+    chunks = [paths[start:start + size] for start in range(0, len(paths), size)]
+    with concurrent.futures.ProcessPoolExecutor(workers, initializer=initialize_worker,
+                                                initargs=settings) as executor:
+        for results in executor.map(_run_chunk, chunks):
+            yield from results
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description='Run many Velox scripts')
+    argument_parser.add_argument('targets', nargs='+', metavar='target',
+                                 help='a directory of .vlx files, a manifest listing scripts, or a script')
+    argument_parser.add_argument('-j', '--workers', type=int, default=None,
+                                 help='number of worker processes (default: one per CPU; 0 runs in-process)')
+    argument_parser.add_argument('--compile', action='store_true',
+                                 help='compile programs to Python code objects before running them')
+    argument_parser.add_argument('--no-cache', action='store_true',
+                                 help='do not read or write cached parse and compile results')
+    argument_parser.add_argument('--cache-dir', default=None,
+                                 help='directory shared by all workers for cached artifacts')
+    argument_parser.add_argument('-O', dest='optimize', action='count', default=0,
+                                 help='optimize programs before running them; -OO also hoists loop invariants')
+    args = argument_parser.parse_args()
+
+    paths = [path for target in args.targets for path in collect_scripts(target)]
+    failed = 0
+    start = time.perf_counter()
+    for result in run_batch(paths, args.workers, args.cache_dir, not args.no_cache, args.compile, args.optimize):
+        sys.stdout.write(f"==> {result.path} <==\n{result.output}")
+        if result.error is not None:
+            failed += 1
+            print(f"{result.path}: {result.error}", file=sys.stderr)
+    print(f"{len(paths)} scripts, {failed} failed, {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
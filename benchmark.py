@@ -0,0 +1,925 @@
+# benchmark.py
+#
+# Performance benchmarks for the Velox execution engines.
+#
+# Usage: python benchmark.py [name ...] [-n ITERATIONS]
+
+import argparse
+import asyncio
+import collections
+import contextlib
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import batch
+import cache
+import dependencies
+import incremental
+import interpreter
+import jit
+import lexer
+import optimizer
+import output
+import parser
+import pool
+import profiler
+import runtime
+import scheduler
+import specialize
+import tracing
+import transpiler
+import values
+import velox
+import vm
+
+
+def parse_source(source):
+    """Tokenize and parse Velox source into the tuple AST."""
+    return parser.Parser(lexer.Lexer(source).stream(), source).parse()
+
+
+def counted_loop_source(iterations):
+    """An example.vlx style counting loop scaled to the given size."""
+    return (
+        "x = 0;\n"
+        f"while (x < {iterations}) {{\n"
+        "    y = \"x is \" + x;\n"
+        "    x = x + 1;\n"
+        "}\n"
+        "print(\"Loop completed\");\n"
+    )
+
+
+def timed(function, repeat=1):
+    """Return the best wall clock time of several runs of function."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def report(title, results):
+    """Print timings relative to the first entry."""
+    print(title)
+    baseline = results[0][1]
+    for name, seconds in results:
+        print(f"  {name:<28} {seconds:10.4f}s  {baseline / seconds:6.2f}x")
+
+
+def bench_vm(iterations):
+    """Compare runtime.Runtime with the bytecode VM on a counted loop."""
+    ast = parse_source(counted_loop_source(iterations))
+    silent = lambda value: None
+
+    def run_runtime():
+        engine = runtime.Runtime()
+        engine.print_value = silent
+        engine.run(ast)
+
+    def run_vm():
+        engine = vm.VM()
+        engine.print_value = silent
+        engine.run(ast)
+
+    report(f"vm: counted loop, {iterations} iterations", [
+        ('runtime.Runtime', timed(run_runtime)),
+        ('vm.VM', timed(run_vm)),
+    ])
+
+
+def bench_compile(iterations):
+    """Compare runtime.Runtime with programs compiled to Python code."""
+    ast = parse_source(counted_loop_source(iterations))
+
+    def run(engine_class):
+        engine = engine_class()
+        engine.print_value = lambda value: None
+        engine.run(ast)
+
+    report(f"compile: counted loop, {iterations} iterations", [
+        ('runtime.Runtime', timed(lambda: run(runtime.Runtime))),
+        ('vm.VM', timed(lambda: run(vm.VM))),
+        ('CompiledRuntime', timed(lambda: run(transpiler.CompiledRuntime))),
+    ])
+
+
+def counted_loop_interpreter_ast(iterations):
+    """The counted loop expressed in interpreter.Interpreter's AST."""
+    x = ('IDENTIFIER', 'x')
+    return [
+        ('VAR_DECL', 'x', ('NUMBER', '0')),
+        ('FUNCTION', 'step', ['n'], [('RETURN', ('BINARY', ('IDENTIFIER', 'n'), '+', ('NUMBER', '1')))]),
+        ('WHILE', ('BINARY', x, '<', ('NUMBER', str(iterations))), [
+            ('IF', ('BINARY', x, '>=', ('NUMBER', '0')), [
+                ('ASSIGN', 'x', ('CALL', 'step', [x])),
+            ]),
+        ]),
+    ]
+
+
+def bench_closures(iterations):
+    """Compare the tree-walking interpreter with the closure compiler."""
+    ast = counted_loop_interpreter_ast(iterations)
+
+    report(f"closures: counted loop with calls, {iterations} iterations", [
+        ('Interpreter()', timed(lambda: interpreter.Interpreter().interpret(ast))),
+        ('Interpreter(compiled=True)', timed(lambda: interpreter.Interpreter(compiled=True).interpret(ast))),
+    ])
+
+
+def variable_heavy_source(iterations):
+    """A loop that reads and writes several variables per iteration."""
+    return (
+        "i = 0; a = 1; b = 2; c = 3; d = 4;\n"
+        f"while (i < {iterations}) {{\n"
+        "    a = b - a; b = c - b; c = d - c; d = a + d;\n"
+        "    i = i + 1;\n"
+        "}\n"
+    )
+
+
+def variable_heavy_interpreter_ast(iterations):
+    """A loop calling a function with several locals, in Interpreter's AST."""
+    def name(identifier):
+        return ('IDENTIFIER', identifier)
+
+    def binary(left, operator, right):
+        return ('BINARY', left, operator, right)
+
+    i = name('i')
+    return [
+        ('VAR_DECL', 'i', ('NUMBER', '0')),
+        ('FUNCTION', 'mix', ['a', 'b'], [
+            ('VAR_DECL', 't', binary(name('a'), '+', name('b'))),
+            ('VAR_DECL', 'u', binary(name('t'), '-', name('a'))),
+            ('ASSIGN', 't', binary(name('t'), '+', name('u'))),
+            ('RETURN', binary(binary(name('t'), '-', name('b')), '-', name('u'))),
+        ]),
+        ('WHILE', binary(i, '<', ('NUMBER', str(iterations))), [
+            ('ASSIGN', 'i', binary(('CALL', 'mix', [i, ('NUMBER', '1')]), '+', ('NUMBER', '1'))),
+        ]),
+    ]
+
+
+def bench_slots(iterations):
+    """Time variable-heavy loops and calls on slot-resolved frames."""
+    ast = parse_source(variable_heavy_source(iterations))
+    calls = variable_heavy_interpreter_ast(iterations // 4)
+
+    report(f"slots: variable-heavy loop, {iterations} iterations; {iterations // 4} calls", [
+        ('runtime.Runtime', timed(lambda: runtime.Runtime().run(ast))),
+        ('vm.VM', timed(lambda: vm.VM().run(ast))),
+        ('Interpreter()', timed(lambda: interpreter.Interpreter().interpret(calls))),
+        ('Interpreter(compiled=True)', timed(lambda: interpreter.Interpreter(compiled=True).interpret(calls))),
+    ])
+
+
+def bench_optimize(iterations):
+    """Time a loop with constant and loop-invariant expressions, optimized."""
+    source = (
+        "prefix = name + \" item\"; limit = 0 + 1 - 1; x = 0;\n"
+        f"while (x < {iterations}) {{\n"
+        "    y = prefix + \" #\" + x;\n"
+        "    if (limit > 0) {\n"
+        "        print(y);\n"
+        "    }\n"
+        "    x = x + 2 - 1;\n"
+        "}\n"
+    )
+    ast = parse_source(source)
+
+    results = []
+    for level in (0, 1, 2):
+        optimized = optimizer.optimize(ast, level)
+        results.append((f"runtime.Runtime -O{level}", timed(lambda: runtime.Runtime().run(optimized))))
+    report(f"optimize: loop with invariant expressions, {iterations} iterations", results)
+
+
+def bench_output(iterations):
+    """Compare printing with the built-in print and through output sinks."""
+    ast = parse_source(
+        "x = 0;\n"
+        f"while (x < {iterations}) {{\n"
+        "    print(\"x is \" + x);\n"
+        "    x = x + 1;\n"
+        "}\n"
+    )
+
+    def run(make_engine, buffering):
+        with open(os.devnull, 'w', buffering=buffering) as stream:
+            with contextlib.redirect_stdout(stream):
+                make_engine().run(ast)
+
+    def builtin_print():
+        engine = vm.VM()
+        engine.print_value = print
+        return engine
+
+    # Line buffering makes the stream flush on every newline, as Python
+    # does for a terminal or with -u.
+    report(f"output: a print per iteration, {iterations} iterations", [
+        ('print, line-buffered', timed(lambda: run(builtin_print, 1), repeat=3)),
+        ('print, block-buffered', timed(lambda: run(builtin_print, -1), repeat=3)),
+        ('StreamSink', timed(lambda: run(vm.VM, 1), repeat=3)),
+        ('CaptureSink', timed(lambda: vm.VM(output.CaptureSink()).run(ast), repeat=3)),
+    ])
+
+
+def bench_cache(iterations):
+    """Compare parsing a script on every start with loading cached artifacts."""
+    lines = max(iterations // 100, 1)
+    source = ''.join(f'v{i} = {i} + v{i - 1} - 1;\nif (v{i} > 3) {{\n    print("v" + v{i});\n}}\n'
+                     for i in range(lines))
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'script.vlx')
+        artifacts = cache.Cache()
+        artifacts.parse(source, path)
+        artifacts.python_code(source, path)
+
+        report(f"cache: startup of a {4 * lines} line script", [
+            ('lex + parse', timed(lambda: parse_source(source), repeat=5)),
+            ('cached AST', timed(lambda: artifacts.parse(source, path), repeat=5)),
+            ('lex + parse + compile', timed(lambda: transpiler.compile_source.__wrapped__(
+                transpiler.Transpiler().transpile(parse_source(source))), repeat=5)),
+            ('cached Python code', timed(lambda: artifacts.python_code(source, path), repeat=5)),
+        ])
+
+
+# Size of the source the lexer benchmark tokenizes.
+LEXER_MEGABYTES = 8
+
+# The list-building lexer that lexer.Lexer.stream replaced, kept as the
+# baseline for the lexer benchmark.
+LEGACY_TOKEN_RE = re.compile('|'.join(f'(?P<{name}>{pattern})' for name, pattern in [
+    ("LESS", r'<'), ("GREATER", r'>'), ("NUMBER", r'\d+(\.\d+)?'), ("STRING", r'"(.*?)"'),
+    ("IDENTIFIER", r'[a-zA-Z_]\w*'), ("PLUS", r'\+'), ("MINUS", r'-'), ("EQUAL", r'='),
+    ("LPAREN", r'\('), ("RPAREN", r'\)'), ("LBRACE", r'{'), ("RBRACE", r'}'),
+    ("SEMICOLON", r';'), ("NEWLINE", r'\n'), ("WHITESPACE", r'\s+'),
+]))
+
+
+def legacy_tokenize(source):
+    tokens = []
+    position = 0
+    while position < len(source):
+        match = LEGACY_TOKEN_RE.match(source, position)
+        type_ = match.lastgroup
+        value = match.group(type_)
+        if type_ == 'WHITESPACE':
+            pass
+        elif type_ == 'NEWLINE':
+            tokens.append(('NEWLINE', None))
+        else:
+            tokens.append((type_, value))
+        position = match.end()
+    return tokens
+
+
+class LegacyDataclassLexer(velox.Lexer):
+    """velox.Lexer as it was before TokenBuffer: one Token per token, with
+    numbers and identifiers built a character at a time."""
+
+    def read_number(self):
+        result = ''
+        start_column = self.column
+        while self.current_char and (self.current_char.isdigit() or self.current_char == '.'):
+            result += self.current_char
+            self.advance()
+        return velox.Token(velox.TokenType.NUMBER, result, self.line, start_column)
+
+    def read_identifier(self):
+        result = ''
+        start_column = self.column
+        while self.current_char and (self.current_char.isalnum() or self.current_char == '_'):
+            result += self.current_char
+            self.advance()
+        kind = velox.TokenType.PRINT if result == 'print' else velox.TokenType.IDENTIFIER
+        return velox.Token(kind, result, self.line, start_column)
+
+    def tokenize(self):
+        tokens = []
+        while self.current_char is not None:
+            if self.current_char.isspace():
+                self.skip_whitespace()
+                continue
+            if self.current_char.isdigit():
+                tokens.append(self.read_number())
+                continue
+            if self.current_char.isalpha():
+                tokens.append(self.read_identifier())
+                continue
+            kind = velox.TOKEN_TYPES_BY_VALUE[velox.SINGLE_CHARACTER_TOKENS[self.current_char]]
+            tokens.append(velox.Token(kind, self.current_char, self.line, self.column))
+            self.advance()
+        tokens.append(velox.Token(velox.TokenType.EOF, None, self.line, self.column))
+        return tokens
+
+
+def legacy_add(x, y):
+    """The '+' operator from before ints, converting every number to float."""
+    if isinstance(x, str) or isinstance(y, str):
+        return str(x) + str(y)
+    return float(x) + float(y)
+
+
+class LegacyConditionRuntime(runtime.Runtime):
+    """runtime.Runtime evaluating conditions as before they were compiled.
+
+    Overriding evaluate_condition also keeps while loops on the generic path.
+    """
+
+    def evaluate_condition(self, condition):
+        op, left, right = condition
+        left_value = self.evaluate_expression(left)
+        right_value = self.evaluate_expression(right)
+        operators = {
+            '==': lambda x, y: x == y,
+            '<': lambda x, y: x < y,
+            '>': lambda x, y: x > y,
+            '<=': lambda x, y: x <= y,
+            '>=': lambda x, y: x >= y,
+            '!=': lambda x, y: x != y
+        }
+        if op in operators:
+            return operators[op](left_value, right_value)
+        raise ValueError(f"Unknown operator: {op}")
+
+
+def generated_source(lines):
+    """A generated program of roughly 18 bytes and 6 tokens per line."""
+    return ''.join(f'v{i} = {i} + v{i - 1} - 1;\nif (v{i} > 3) {{\n    print("v" + v{i});\n}}\n'
+                   for i in range(lines // 4))
+
+
+def peak_memory(function):
+    """Return the peak traced memory allocated while running function."""
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def sized_source(megabytes):
+    """A generated program of about the given size."""
+    lines = 4000
+    for _ in range(2):  # Lines get longer as the numbers in them grow
+        lines = int(lines * megabytes * 1e6 / len(generated_source(lines)))
+    return generated_source(lines)
+
+
+def bench_lexer(iterations, megabytes=LEXER_MEGABYTES):
+    """Compare the legacy list-building lexer with the streaming lexer.
+
+    Both tokenize megabytes of source, whatever the iteration count.
+    """
+    source = sized_source(megabytes)
+    consume = lambda tokens: collections.deque(tokens, maxlen=0)
+
+    report(f"lexer: {len(source) / 1e6:.1f} MB of source", [
+        ('legacy tokenize', timed(lambda: legacy_tokenize(source), repeat=3)),
+        ('Lexer.stream', timed(lambda: consume(lexer.Lexer(source).stream()), repeat=3)),
+    ])
+
+    # Both parses build the same AST; the difference is the token list.
+    source = generated_source(max(iterations // 10, 4))
+    listed = peak_memory(lambda: parser.Parser(list(lexer.Lexer(source).stream()), source).parse())
+    streamed = peak_memory(lambda: parser.Parser(lexer.Lexer(source).stream(), source).parse())
+    print(f"  peak memory parsing {len(source) / 1e6:.1f} MB, token list: {listed / 1e6:8.2f} MB")
+    print(f"  peak memory parsing {len(source) / 1e6:.1f} MB, stream:     {streamed / 1e6:8.2f} MB")
+
+
+def bench_tokens(iterations):
+    """Compare the Token-per-token velox lexer with the TokenBuffer one."""
+    lines = max(iterations // 10, 1)
+    source = ''.join(f'x{i} = {i} + y * 2.5 print x{i} / 3\n' for i in range(lines))
+
+    print(f"tokens: velox.Lexer on {lines} lines, {len(source) / 1e6:.1f} MB")
+    for name, lexer_class in (('list of Tokens', LegacyDataclassLexer), ('TokenBuffer', velox.Lexer)):
+        seconds = timed(lambda: lexer_class(source).tokenize(), repeat=3)
+        tracemalloc.start()
+        tokens = lexer_class(source).tokenize()
+        stored = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"  {name:<16} {len(tokens) / seconds:12,.0f} tokens/s  {stored / len(tokens):8.1f} bytes/token")
+        del tokens
+
+
+def bench_incremental(iterations):
+    """Compare re-parsing a whole file with incremental edits."""
+    lines = max(iterations // 20, 100)
+    source = generated_source(lines)
+    document = incremental.Document(source)
+    generator = random.Random(0)
+
+    def type_characters(count=100):
+        # Type and then delete a number at a random place, as an editor would.
+        for _ in range(count // 2):
+            offset = document.start(generator.randrange(1, len(document.chunks))) + 4
+            document.edit(offset, 0, '7')
+            document.edit(offset, 1, '')
+
+    full = timed(lambda: parse_source(source), repeat=3)
+    edit = timed(type_characters, repeat=3) / 100
+    print(f"incremental: {lines} line document")
+    print(f"  full re-parse:        {full * 1e3:10.3f} ms")
+    print(f"  one-character edit:   {edit * 1e3:10.3f} ms  ({full / edit:,.0f}x)")
+
+
+def bench_trace(iterations):
+    """Measure what tracing costs a runtime.Runtime, on and off."""
+    ast = parse_source(counted_loop_source(iterations))
+
+    def run(tracer=None, detach=False):
+        engine = runtime.Runtime(output.CaptureSink())
+        if tracer is not None:
+            engine.trace(tracer)
+            if detach:
+                engine.trace(None)
+        engine.run(ast)
+
+    # Interleave the two untraced variants, alternating which goes first, so
+    # drift in machine speed affects both equally; then compare the means
+    # with Welch's t statistic.
+    never, detached = [], []
+    for trial in range(16):
+        runs = [(never, run), (detached, lambda: run(tracing.EventLog(), detach=True))]
+        for times, function in (runs if trial % 2 else runs[::-1]):
+            times.append(timed(function))
+    mean_never, mean_detached = statistics.mean(never), statistics.mean(detached)
+    spread = (statistics.variance(never) / len(never)
+              + statistics.variance(detached) / len(detached)) ** 0.5
+    t = (mean_detached - mean_never) / spread if spread else 0.0
+
+    report(f"trace: counted loop, {iterations} iterations", [
+        ('never traced', mean_never),
+        ('traced, then detached', mean_detached),
+        ('traced to EventLog', timed(lambda: run(tracing.EventLog()))),
+    ])
+    print(f"  off overhead {mean_detached / mean_never - 1:+.2%}, Welch t = {t:+.2f} "
+          f"(|t| < 2: no significant difference)")
+
+
+def bench_profile(iterations):
+    """Measure the overhead of profiling a loop-heavy script."""
+    source = (
+        "x = 0;\n"
+        f"while (x < {iterations}) {{\n"
+        "    y = \"x is \" + x;\n"
+        "    if (x < 10) {\n"
+        "        print(x);\n"
+        "    }\n"
+        "    x = x + 1;\n"
+        "}\n"
+    )
+    pars = parser.Parser(lexer.Lexer(source).stream(), source)
+    ast = pars.parse()
+
+    def run():
+        runtime.Runtime(output.CaptureSink()).run(ast)
+
+    def run_profiled():
+        profile = profiler.Profiler(pars.positions, pars.line_column)
+        profile.run(ast, output_sink=output.CaptureSink())
+
+    plain, profiled = [], []
+    for trial in range(6):
+        runs = [(plain, run), (profiled, run_profiled)]
+        for times, function in (runs if trial % 2 else runs[::-1]):
+            times.append(timed(function))
+    report(f"profile: loop with a branch, {iterations} iterations", [
+        ('runtime.Runtime', min(plain)),
+        ('profiled', min(profiled)),
+    ])
+
+
+def bench_batch(iterations):
+    """Show how a batch of CPU-bound scripts scales with worker processes."""
+    scripts = 32
+    with tempfile.TemporaryDirectory() as directory:
+        paths = []
+        for index in range(scripts):
+            path = os.path.join(directory, f"script{index:02}.vlx")
+            with open(path, 'w') as script:
+                script.write(counted_loop_source(iterations // scripts))
+            paths.append(path)
+        cache_directory = os.path.join(directory, 'cache')
+
+        def run(workers):
+            for result in batch.run_batch(paths, workers, cache_directory):
+                assert result.error is None, result.error
+
+        def process_per_script():
+            for path in paths:
+                subprocess.run([sys.executable, 'shell.py', '--no-cache', path],
+                               check=True, stdout=subprocess.DEVNULL,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+
+        results = [('process per script', timed(process_per_script)),
+                   ('in-process', timed(lambda: run(0)))]
+        workers = 1
+        while workers <= (os.cpu_count() or 1):
+            results.append((f"{workers} workers", timed(lambda: run(workers))))
+            workers *= 2
+        report(f"batch: {scripts} scripts, {iterations} loop iterations in total", results)
+
+
+def bench_pool(iterations):
+    """Compare a fresh Runtime per snippet with pooled, budgeted runtimes."""
+    snippet = parse_source('x = 1;\ny = x + 2;\nprint("y is " + y);\n')
+    snippets = max(1, iterations // 10)
+    runtimes = pool.RuntimePool(max_instructions=10 ** 6, max_seconds=1.0, max_memory=1 << 20)
+
+    def fresh(engine_class):
+        for _ in range(snippets):
+            engine = engine_class(output.CaptureSink())
+            engine.run(snippet)
+            engine.output.getvalue()
+
+    def pooled():
+        for _ in range(snippets):
+            runtimes.run(snippet)
+
+    report(f"pool: {snippets} small snippets", [
+        ('fresh Runtime', timed(lambda: fresh(runtime.Runtime), repeat=3)),
+        ('fresh SandboxedRuntime', timed(lambda: fresh(pool.SandboxedRuntime), repeat=3)),
+        ('RuntimePool', timed(pooled, repeat=3)),
+    ])
+
+    loop = parse_source(counted_loop_source(iterations // 10))
+    report(f"pool: budget checks on a counted loop, {iterations // 10} iterations", [
+        ('runtime.Runtime', timed(lambda: runtime.Runtime(output.CaptureSink()).run(loop), repeat=3)),
+        ('SandboxedRuntime', timed(lambda: runtimes.run(loop), repeat=3)),
+    ])
+
+
+def bench_async(iterations):
+    """Run 10000 programs concurrently on one event loop."""
+    programs = 10000
+    steps = max(1, iterations // programs)
+    x = ('IDENTIFIER', 'x')
+    # Each program counts, and waits on an asynchronous host function every
+    # tenth iteration as an I/O-bound built-in would.
+    ast = [
+        ('VAR_DECL', 'x', ('NUMBER', '0')),
+        ('WHILE', ('BINARY', x, '<', ('NUMBER', str(steps))), [
+            ('IF', ('BINARY', ('BINARY', x, '%', ('NUMBER', '10')), '==', ('NUMBER', '0')), [
+                ('ASSIGN', 'x', ('CALL', 'wait', [x])),
+            ]),
+            ('ASSIGN', 'x', ('BINARY', x, '+', ('NUMBER', '1'))),
+        ]),
+        ('PRINT', x),
+    ]
+
+    def sequential():
+        for _ in range(programs):
+            engine = interpreter.Interpreter(output_sink=output.CaptureSink())
+            engine.define_host_function('wait', lambda value: value)
+            engine.interpret(ast)
+
+    async def wait(value):
+        await asyncio.sleep(0)
+        return value
+
+    finished = []
+
+    def concurrent():
+        async def main():
+            tasks = scheduler.Scheduler({'wait': wait}, yield_every=10)
+            finished[:] = await tasks.run([ast] * programs)
+        asyncio.run(main())
+
+    results = [('one after another', timed(sequential)), ('Scheduler', timed(concurrent))]
+    assert all(program.error is None for program in finished)
+    report(f"async: {programs} programs of {steps} iterations", results)
+    latencies = sorted(program.latency for program in finished)
+    print(f"  latency p50 {latencies[len(latencies) // 2]:.3f}s, "
+          f"p99 {latencies[len(latencies) * 99 // 100]:.3f}s, max {latencies[-1]:.3f}s")
+
+
+def bench_parallel(iterations):
+    """Compare sequential and parallel runs of independent top-level loops."""
+    width = max(2, os.cpu_count() or 1)
+    lines = []
+    for index in range(width):
+        lines.append(f"v{index} = 0;\nwhile (v{index} < {iterations // width}) {{\n"
+                     f"    v{index} = v{index} + 1;\n}}\n")
+    lines.append(f"print(v0 + {' + '.join(f'v{index}' for index in range(1, width))});\n")
+    ast = parse_source(''.join(lines))
+    executor = dependencies.shared_executor()
+    executor.submit(int).result()  # Start the workers outside the timings
+
+    report(f"parallel: {width} independent loops, {iterations} iterations in total", [
+        ('runtime.Runtime', timed(lambda: runtime.Runtime(output.CaptureSink()).run(ast), repeat=3)),
+        ('ParallelRuntime', timed(lambda: dependencies.ParallelRuntime(output.CaptureSink()).run(ast), repeat=3)),
+    ])
+
+
+def bench_arrays(iterations):
+    """Compare adding two columns element by element with one array operation."""
+    a = values.make_array(float(index) for index in range(iterations))
+    b = values.make_array(float(index % 7) for index in range(iterations))
+    loop = parse_source(f"i = 0;\nwhile (i < {iterations}) {{\n    c = a[i] + b[i];\n    i = i + 1;\n}}\n")
+    vectorized = parse_source("c = a + b;")
+
+    def run(ast, engine_class=runtime.Runtime):
+        engine = engine_class(output.CaptureSink())
+        engine.variables.update(a=a, b=b)
+        engine.run(ast)
+
+    backend = 'NumPy' if values.numpy is not None else 'lists, NumPy not installed'
+    report(f"arrays: adding columns of {iterations} floats ({backend})", [
+        ('runtime.Runtime, loop', timed(lambda: run(loop))),
+        ('transpiler, loop', timed(lambda: run(loop, transpiler.CompiledRuntime))),
+        ('runtime.Runtime, a + b', timed(lambda: run(vectorized), repeat=3)),
+    ])
+
+
+def bench_specialize(iterations):
+    """Compare runtime.Runtime with and without operator specialization."""
+    ast = parse_source(
+        f"i = 0; total = 0; label = \"\";\nwhile (i < {iterations}) {{\n"
+        "    total = total + i * 2 - i / 4;\n    label = \"i=\" + i;\n    i = i + 1;\n}\n")
+
+    def run():
+        engine = runtime.Runtime(output.CaptureSink(), jit_threshold=None)
+        engine.run(ast)
+        return engine
+
+    limit = specialize.MAX_CHANGES
+    specialize.MAX_CHANGES = 0  # Every site stays unspecialized
+    try:
+        generic = timed(run, repeat=3)
+    finally:
+        specialize.MAX_CHANGES = limit
+    specialized = timed(run, repeat=3)
+    report(f"specialize: arithmetic loop, {iterations} iterations", [
+        ('unspecialized sites', generic),
+        ('specialized sites', specialized),
+    ])
+    total = specialize.stats(run().inline_caches.values())
+    print(f"  {total.sites} sites, {total.hits / (total.hits + total.misses):.2%} hits")
+
+
+def bench_numbers(iterations):
+    """Compare integer and float arithmetic, and '+' before and after native ints."""
+    integers = parse_source(counted_loop_source(iterations))
+    floats = parse_source(counted_loop_source(iterations).replace('x = 0;', 'x = 0.0;').replace('x + 1;', 'x + 1.0;'))
+    for engine_class in (runtime.Runtime, vm.VM, transpiler.CompiledRuntime):
+        report(f"numbers: counted loop on {engine_class.__name__}, {iterations} iterations", [
+            ('float literals', timed(lambda: engine_class(output.CaptureSink()).run(floats), repeat=3)),
+            ('int literals', timed(lambda: engine_class(output.CaptureSink()).run(integers), repeat=3)),
+        ])
+
+    def add_all(add, one):
+        total = 0
+        for _ in range(iterations):
+            total = add(total, one)
+    report(f"numbers: {iterations} additions", [
+        ('legacy float add', timed(lambda: add_all(legacy_add, 1.0), repeat=3)),
+        ('values.add, floats', timed(lambda: add_all(values.add, 1.0), repeat=3)),
+        ('values.add, ints', timed(lambda: add_all(values.add, 1), repeat=3)),
+    ])
+
+
+def bench_strings(iterations):
+    """Time building a string with s = s + "..." at several sizes, with and without ropes."""
+    def build(appends):
+        ast = parse_source(f"s = \"\"; i = 0;\nwhile (i < {appends}) {{\n"
+                           "    s = s + \"0123456789\";\n    i = i + 1;\n}\nprint(len(s));\n")
+        return lambda: runtime.Runtime(output.CaptureSink()).run(ast)
+
+    # iterations appends of 10 characters, 10 MB by default.
+    sizes = [iterations // 8, iterations // 4, iterations // 2, iterations]
+    print(f"strings: building a string of up to {iterations * 10 / 1e6:.1f} MB")
+    for appends in sizes:
+        seconds = timed(build(appends))
+        print(f"  ropes       {appends * 10 / 1e6:6.2f} MB {seconds:10.4f}s  {seconds / appends * 1e6:6.2f}us per append")
+    limit = values.ROPE_LENGTH
+    values.ROPE_LENGTH = float('inf')  # Every '+' copies, as before ropes
+    try:
+        for appends in [size // 8 for size in sizes]:
+            seconds = timed(build(appends))
+            print(f"  copying     {appends * 10 / 1e6:6.2f} MB {seconds:10.4f}s  {seconds / appends * 1e6:6.2f}us per append")
+    finally:
+        values.ROPE_LENGTH = limit
+
+
+def bench_conditions(iterations):
+    """Time the per-iteration cost of loops with legacy and compiled conditions."""
+    counted = parse_source(f"i = 0;\nwhile (i < {iterations}) {{\n    i = i + 1;\n}}\n")
+    # Two statements in the body, so the loop is not fused.
+    stepped = parse_source(f"i = 0; j = 0;\nwhile (i < {iterations}) {{\n    i = i + 1;\n"
+                           "    j = j + 1;\n}\n")
+
+    def run(engine_class, ast):
+        return lambda: engine_class(output.CaptureSink(), jit_threshold=None).run(ast)
+
+    print(f"conditions: per iteration, {iterations} iterations")
+    for title, engine_class, ast in [
+        ('legacy, empty counted loop', LegacyConditionRuntime, counted),
+        ('fused, empty counted loop', runtime.Runtime, counted),
+        ('legacy, two-statement loop', LegacyConditionRuntime, stepped),
+        ('compiled, two-statement loop', runtime.Runtime, stepped),
+    ]:
+        seconds = timed(run(engine_class, ast), repeat=3)
+        print(f"  {title:<30} {seconds:10.4f}s  {seconds / iterations * 1e9:8.1f}ns per iteration")
+
+
+def fibonacci_interpreter_ast(n):
+    """Naive recursive Fibonacci of n, in interpreter.Interpreter's AST."""
+    def fib(argument):
+        return ('CALL', 'fib', [argument])
+
+    def minus(amount):
+        return ('BINARY', ('IDENTIFIER', 'n'), '-', ('NUMBER', str(amount)))
+
+    return [
+        ('FUNCTION', 'fib', ['n'], [
+            ('IF', ('BINARY', ('IDENTIFIER', 'n'), '<', ('NUMBER', '2')), [('RETURN', ('IDENTIFIER', 'n'))]),
+            ('RETURN', ('BINARY', fib(minus(1)), '+', fib(minus(2)))),
+        ]),
+        ('PRINT', fib(('NUMBER', str(n)))),
+    ]
+
+
+def bench_memo(iterations):
+    """Compare calls to pure functions with and without memoization."""
+    fibonacci = fibonacci_interpreter_ast(22)
+    # Calls whose arguments never repeat, where memoization only costs.
+    steps = counted_loop_interpreter_ast(iterations // 4)
+
+    def run(ast, **options):
+        return lambda: interpreter.Interpreter(output_sink=output.CaptureSink(), **options).interpret(ast)
+
+    report("memo: recursive fib(22)", [
+        ('memoize=False', timed(run(fibonacci, memoize=False))),
+        ('memoize=False, compiled', timed(run(fibonacci, memoize=False, compiled=True))),
+        ('memoized', timed(run(fibonacci), repeat=3)),
+        ('memoized, compiled', timed(run(fibonacci, compiled=True), repeat=3)),
+    ])
+    report(f"memo: {iterations // 4} calls with distinct arguments", [
+        ('memoize=False', timed(run(steps, memoize=False), repeat=3)),
+        ('memoized', timed(run(steps), repeat=3)),
+        ('memoize=False, compiled', timed(run(steps, memoize=False, compiled=True), repeat=3)),
+        ('memoized, compiled', timed(run(steps, compiled=True), repeat=3)),
+    ])
+    engine = interpreter.Interpreter(output_sink=output.CaptureSink())
+    engine.interpret(steps)
+    print(f"  {engine.memo_stats()}")
+
+
+def bench_scopes(iterations):
+    """Time calls with and without frames, and measure what an active call holds."""
+    def name(identifier):
+        return ('IDENTIFIER', identifier)
+
+    def binary(left, operator, right):
+        return ('BINARY', left, operator, right)
+
+    calls = iterations // 4
+    count = name('count')
+    loop = [
+        ('VAR_DECL', 'count', ('NUMBER', '0')),
+        ('FUNCTION', 'step', ['n'], [('RETURN', binary(name('n'), '+', ('NUMBER', '1')))]),
+        ('FUNCTION', 'tick', [], [('ASSIGN', 'count', binary(count, '+', ('NUMBER', '1')))]),
+    ]
+    with_frame = loop + [('WHILE', binary(count, '<', ('NUMBER', str(calls))), [
+        ('ASSIGN', 'count', ('CALL', 'step', [count])),
+    ])]
+    without_frame = loop + [('WHILE', binary(count, '<', ('NUMBER', str(calls))), [
+        ('VAR_DECL', 'ignored', ('CALL', 'tick', [])),
+    ])]
+
+    def run(ast, compiled):
+        return lambda: interpreter.Interpreter(output_sink=output.CaptureSink(), compiled=compiled,
+                                               memoize=False).interpret(ast)
+
+    print(f"scopes: {calls} calls")
+    for title, ast in [('function with a frame', with_frame), ('function without locals', without_frame)]:
+        for compiled in (False, True):
+            seconds = timed(run(ast, compiled), repeat=3)
+            engine = 'Interpreter(compiled=True)' if compiled else 'Interpreter()'
+            print(f"  {title:<24} {engine:<27} {seconds / calls * 1e9:8.0f}ns per iteration")
+
+    # Recursion to depth calls a host function at the bottom, which counts
+    # the blocks and bytes allocated since the run started.
+    depth = 2000
+    recursion = [
+        ('FUNCTION', 'down', ['n'], [
+            ('IF', binary(name('n'), '==', ('NUMBER', '0')), [('RETURN', ('CALL', 'probe', []))]),
+            ('RETURN', binary(('NUMBER', '1'), '+', ('CALL', 'down', [binary(name('n'), '-', ('NUMBER', '1'))]))),
+        ]),
+        ('PRINT', ('CALL', 'down', [('NUMBER', str(depth))])),
+    ]
+    measured = []
+
+    def probe():
+        statistics = tracemalloc.take_snapshot().statistics('filename')
+        measured.append((sum(stat.count for stat in statistics), sum(stat.size for stat in statistics)))
+        return 0
+
+    engine = interpreter.Interpreter(output_sink=output.CaptureSink(), memoize=False)
+    engine.define_host_function('probe', probe)
+    tracemalloc.start()
+    try:
+        engine.interpret(recursion)
+    finally:
+        tracemalloc.stop()
+    blocks, size = measured[0]
+    print(f"  recursion to depth {depth}: {blocks / depth:.1f} blocks, {size / depth:.0f} bytes per active call")
+
+
+def bench_jit(iterations):
+    """Compare interpreted and compiled loops with the same loops written in Python."""
+    counting = parse_source(counted_loop_source(iterations))
+    arithmetic = parse_source(
+        f"i = 0; total = 0.0;\nwhile (i < {iterations}) {{\n    total = total + i * 2 - i / 4;\n"
+        "    if (i > 100) {\n        total = total - 1;\n    }\n    i = i + 1;\n}\n")
+
+    def count_in_python(limit=iterations):
+        x = 0
+        while x < limit:
+            y = "x is " + str(x)
+            x = x + 1
+
+    def arithmetic_in_python(limit=iterations):
+        i = 0
+        total = 0.0
+        while i < limit:
+            total = total + i * 2 - i / 4
+            if i > 100:
+                total = total - 1
+            i = i + 1
+
+    def run(ast, **options):
+        return lambda: runtime.Runtime(output.CaptureSink(), **options).run(ast)
+
+    for title, ast, python in [('example.vlx style loop', counting, count_in_python),
+                               ('arithmetic loop', arithmetic, arithmetic_in_python)]:
+        report(f"jit: {title}, {iterations} iterations", [
+            ('jit_threshold=None', timed(run(ast, jit_threshold=None))),
+            ('jit', timed(run(ast, jit_threshold=jit.HOT_LOOP), repeat=3)),
+            ('hand-written Python', timed(python, repeat=3)),
+        ])
+    engine = runtime.Runtime(output.CaptureSink(), jit_threshold=jit.HOT_LOOP)
+    engine.run(arithmetic)
+    jit.report(engine.traces.values(), file=sys.stdout)
+
+
+BENCHMARKS = {
+    'vm': bench_vm,
+    'closures': bench_closures,
+    'compile': bench_compile,
+    'cache': bench_cache,
+    'slots': bench_slots,
+    'optimize': bench_optimize,
+    'output': bench_output,
+    'lexer': bench_lexer,
+    'tokens': bench_tokens,
+    'incremental': bench_incremental,
+    'trace': bench_trace,
+    'profile': bench_profile,
+    'batch': bench_batch,
+    'pool': bench_pool,
+    'async': bench_async,
+    'parallel': bench_parallel,
+    'arrays': bench_arrays,
+    'specialize': bench_specialize,
+    'numbers': bench_numbers,
+    'strings': bench_strings,
+    'conditions': bench_conditions,
+    'memo': bench_memo,
+    'scopes': bench_scopes,
+    'jit': bench_jit,
+}
+
+
+def main():
+    argument_parser = argparse.ArgumentParser(description='Velox benchmarks')
+    argument_parser.add_argument('names', nargs='*', metavar='name',
+                                 help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    argument_parser.add_argument('-n', '--iterations', type=int, default=10 ** 6)
+    args = argument_parser.parse_args()
+
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        argument_parser.error(f"unknown benchmark: {', '.join(unknown)}")
+
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name](args.iterations)
+
+
+if __name__ == '__main__':
+    main()
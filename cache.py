@@ -0,0 +1,166 @@
+# cache.py
+#
+# Persistent on-disk cache of parsed and compiled .vlx artifacts, in the
+# spirit of __pycache__.
+#
+# Entries are keyed on a hash of the source text plus an implementation tag
+# that changes whenever the lexer, parser or compilers change, so stale
+# artifacts are never loaded. Compiled artifacts built from an optimized AST
+# are also keyed on the optimization level. Each entry is written to a temporary file and
+# moved into place with os.replace, which is atomic: concurrent processes
+# either see a complete entry or none, and the last writer wins.
+
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+
+import compiler
+import lexer
+import optimizer
+import parser
+import resolver
+import transpiler
+
+MAGIC = b'VLXC'
+CACHE_DIRECTORY_NAME = '__vlxcache__'
+CACHE_ENVIRONMENT_VARIABLE = 'VELOX_CACHE_DIR'
+
+# Artifact kinds and the modules whose output they depend on.
+KINDS = {
+    'ast': (lexer, parser),
+    'bytecode': (lexer, parser, optimizer, resolver, compiler),
+    'python': (lexer, parser, optimizer, transpiler),
+}
+
+_implementation_tags = {}
+
+
+def implementation_tag(kind):
+    """Return a digest identifying the code that produces an artifact kind."""
+    if kind not in _implementation_tags:
+        digest = hashlib.sha256(sys.implementation.cache_tag.encode())
+        for module in KINDS[kind]:
+            with open(module.__file__, 'rb') as source:
+                digest.update(source.read())
+        _implementation_tags[kind] = digest.digest()
+    return _implementation_tags[kind]
+
+
+def cache_key(source, kind, optimize=0):
+    """Return the cache key for an artifact built from source."""
+    digest = hashlib.sha256(implementation_tag(kind))
+    digest.update(f"{kind}-O{optimize}".encode())
+    digest.update(source.encode())
+    return digest.digest()
+
+
+class Cache:
+    """Stores serialized artifacts keyed on source hash and implementation.
+
+    With a directory, entries are content addressed inside it. Without one,
+    entries for a script are kept in a __vlxcache__ directory next to it.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+
+    def entry_path(self, key, kind, path=None, optimize=0):
+        """Return the file an artifact is stored in, or None if uncacheable."""
+        if optimize:
+            kind = f"opt-{optimize}.{kind}"  # Like __pycache__'s .opt-1.pyc
+        if self.directory is not None:
+            return os.path.join(self.directory, f"{key.hex()}.{kind}")
+        if path is None:
+            return None
+        directory, name = os.path.split(os.path.abspath(path))
+        return os.path.join(directory, CACHE_DIRECTORY_NAME, f"{name}.{sys.implementation.cache_tag}.{kind}")
+
+    def get(self, source, kind, path=None, optimize=0):
+        """Return a cached artifact, or None on a miss."""
+        key = cache_key(source, kind, optimize)
+        entry = self.entry_path(key, kind, path, optimize)
+        if entry is None:
+            return None
+        try:
+            with open(entry, 'rb') as cached:
+                data = cached.read()
+        except OSError:
+            return None
+        header = MAGIC + key
+        if not data.startswith(header):
+            return None  # Stale entry for an older source or implementation
+        try:
+            return marshal.loads(data[len(header):])
+        except (EOFError, ValueError, TypeError):
+            return None
+
+    def put(self, source, kind, value, path=None, optimize=0):
+        """Store an artifact; failures to write are silently ignored."""
+        key = cache_key(source, kind, optimize)
+        entry = self.entry_path(key, kind, path, optimize)
+        if entry is None:
+            return
+        directory = os.path.dirname(entry)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            descriptor, temporary = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        except OSError:
+            return
+        try:
+            with os.fdopen(descriptor, 'wb') as cached:
+                cached.write(MAGIC + key + marshal.dumps(value))
+            os.chmod(temporary, 0o644)  # mkstemp creates files readable by the owner only
+            os.replace(temporary, entry)
+        except (OSError, ValueError):
+            try:
+                os.unlink(temporary)
+            except OSError:
+                pass
+
+    def parse(self, source, path=None):
+        """Return the AST for source, parsing it only on a cache miss."""
+        return self._parse(source, path)[0]
+
+    def _parse(self, source, path):
+        """Return the AST and whether artifacts built from it may be cached."""
+        ast = self.get(source, 'ast', path)
+        if ast is not None:
+            return ast, True
+        pars = parser.Parser(lexer.Lexer(source).stream(), source)
+        ast = pars.parse()
+        # Sources with syntax errors are not cached, so the errors keep
+        # being reported on every run.
+        cacheable = not pars.errors
+        if cacheable:
+            self.put(source, 'ast', ast, path)
+        return ast, cacheable
+
+    def bytecode(self, source, path=None, optimize=0):
+        """Return the compiler.Code for source."""
+        entry = self.get(source, 'bytecode', path, optimize)
+        if entry is not None:
+            return compiler.Code(*entry)
+        ast, cacheable = self._parse(source, path)
+        code = compiler.Compiler().compile(optimizer.optimize(ast, optimize))
+        if cacheable:
+            self.put(source, 'bytecode', (code.instructions, code.names), path, optimize)
+        return code
+
+    def python_code(self, source, path=None, optimize=0):
+        """Return the transpiled Python code object for source."""
+        code = self.get(source, 'python', path, optimize)
+        if code is not None:
+            return code
+        ast, cacheable = self._parse(source, path)
+        python_source = transpiler.Transpiler().transpile(optimizer.optimize(ast, optimize))
+        code = transpiler.compile_source(python_source, f'<velox {path}>' if path else '<velox>')
+        if cacheable:
+            self.put(source, 'python', code, path, optimize)
+        return code
+
+
+def default_cache():
+    """Return the cache configured by the environment."""
+    return Cache(os.environ.get(CACHE_ENVIRONMENT_VARIABLE) or None)
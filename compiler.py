@@ -0,0 +1,177 @@
+# compiler.py
+
+from resolver import resolve_program
+
+# Opcodes. Each instruction occupies two slots in Code.instructions: the
+# opcode followed by its argument (None when the opcode takes no argument).
+LOAD_CONST = 0
+LOAD_FAST = 1
+STORE_FAST = 2
+BINARY_OP = 3
+COMPARE_OP = 4
+JUMP = 5
+POP_JUMP_IF_FALSE = 6
+POP_JUMP_IF_TRUE = 7
+PRINT = 8
+BUILD_ARRAY = 9
+INDEX = 10
+LEN = 11
+
+OPCODE_NAMES = {
+    LOAD_CONST: 'LOAD_CONST',
+    LOAD_FAST: 'LOAD_FAST',
+    STORE_FAST: 'STORE_FAST',
+    BINARY_OP: 'BINARY_OP',
+    COMPARE_OP: 'COMPARE_OP',
+    JUMP: 'JUMP',
+    POP_JUMP_IF_FALSE: 'POP_JUMP_IF_FALSE',
+    POP_JUMP_IF_TRUE: 'POP_JUMP_IF_TRUE',
+    PRINT: 'PRINT',
+    BUILD_ARRAY: 'BUILD_ARRAY',
+    INDEX: 'INDEX',
+    LEN: 'LEN',
+}
+
+# Operator tables; BINARY_OP and COMPARE_OP take an index into these.
+BINARY_OPERATORS = ('+', '-', '*', '/', '%')
+COMPARE_OPERATORS = ('==', '<', '>', '<=', '>=', '!=')
+
+
+class Code:
+    """A flat sequence of bytecode instructions.
+
+    Variables are accessed by slot: LOAD_FAST and STORE_FAST take an index
+    into names, the variables of the program in slot order.
+    """
+
+    def __init__(self, instructions=None, names=()):
+        self.instructions = instructions if instructions is not None else []
+        self.names = tuple(names)
+
+    def emit(self, opcode, arg=None):
+        """Append an instruction and return its offset."""
+        offset = len(self.instructions)
+        self.instructions.extend((opcode, arg))
+        return offset
+
+    def patch(self, offset, arg):
+        """Set the argument of the instruction at the given offset."""
+        self.instructions[offset + 1] = arg
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def disassemble(self):
+        """Return a human readable listing of the instructions."""
+        lines = []
+        for offset in range(0, len(self.instructions), 2):
+            opcode, arg = self.instructions[offset], self.instructions[offset + 1]
+            detail = '' if arg is None else repr(arg)
+            if opcode == BINARY_OP:
+                detail = repr(BINARY_OPERATORS[arg])
+            elif opcode == COMPARE_OP:
+                detail = repr(COMPARE_OPERATORS[arg])
+            elif opcode in (LOAD_FAST, STORE_FAST):
+                detail = f"{arg} ({self.names[arg]})"
+            name = OPCODE_NAMES[opcode]
+            lines.append(f"{offset:>6} {name:<18} {detail}")
+        return '\n'.join(lines)
+
+
+class Compiler:
+    """Lowers the tuple AST produced by parser.Parser into bytecode."""
+
+    def compile(self, ast):
+        """Compile a list of statements into a Code object."""
+        self.slots = resolve_program(ast).slots
+        code = Code()
+        self.compile_block(code, ast)
+        code.names = tuple(self.slots)
+        return code
+
+    def compile_block(self, code, statements):
+        """Compile a sequence of statements."""
+        for statement in statements:
+            if statement is not None:
+                self.compile_statement(code, statement)
+
+    def compile_statement(self, code, statement):
+        """Compile a single statement based on its type."""
+        statement_type = statement[0]
+
+        if statement_type == 'print':
+            self.compile_expression(code, statement[1])
+            code.emit(PRINT)
+        elif statement_type == 'assign':
+            self.compile_expression(code, statement[2])
+            code.emit(STORE_FAST, self.slots[statement[1]])
+        elif statement_type == 'if':
+            self.compile_condition(code, statement[1])
+            jump = code.emit(POP_JUMP_IF_FALSE, None)
+            self.compile_block(code, statement[2])
+            code.patch(jump, len(code))
+        elif statement_type == 'while':
+            # The condition is placed after the body so that each iteration
+            # only executes a single conditional jump.
+            jump = code.emit(JUMP, None)
+            body_start = len(code)
+            self.compile_block(code, statement[2])
+            code.patch(jump, len(code))
+            self.compile_condition(code, statement[1])
+            code.emit(POP_JUMP_IF_TRUE, body_start)
+        else:
+            raise ValueError(f"Unknown statement type: {statement_type}")
+
+    def compile_condition(self, code, condition):
+        """Compile a comparison condition."""
+        op, left, right = condition
+        if op not in COMPARE_OPERATORS:
+            raise ValueError(f"Unknown operator: {op}")
+        self.compile_expression(code, left)
+        self.compile_expression(code, right)
+        code.emit(COMPARE_OP, COMPARE_OPERATORS.index(op))
+
+    def compile_expression(self, code, expr):
+        """Compile an expression that leaves its value on the stack."""
+        if isinstance(expr, str):
+            if expr.startswith('"') and expr.endswith('"'):
+                code.emit(LOAD_CONST, expr[1:-1])
+            else:
+                code.emit(LOAD_FAST, self.slots[expr])
+            return
+
+        if isinstance(expr, tuple):
+            node_type = expr[0]
+            if node_type == 'num':
+                code.emit(LOAD_CONST, expr[1])
+                return
+            if node_type == 'str':
+                code.emit(LOAD_CONST, expr[1])
+                return
+            if node_type == 'var':
+                code.emit(LOAD_FAST, self.slots[expr[1]])
+                return
+            if node_type == 'array':
+                for element in expr[1]:
+                    self.compile_expression(code, element)
+                code.emit(BUILD_ARRAY, len(expr[1]))
+                return
+            if node_type == 'index':
+                self.compile_expression(code, expr[1])
+                self.compile_expression(code, expr[2])
+                code.emit(INDEX)
+                return
+            if node_type == 'len':
+                self.compile_expression(code, expr[1])
+                code.emit(LEN)
+                return
+
+            operator, left, right = expr
+            if operator not in BINARY_OPERATORS:
+                raise ValueError(f"Unknown operator: {operator}")
+            self.compile_expression(code, left)
+            self.compile_expression(code, right)
+            code.emit(BINARY_OP, BINARY_OPERATORS.index(operator))
+            return
+
+        code.emit(LOAD_CONST, expr)
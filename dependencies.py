@@ -0,0 +1,227 @@
+# dependencies.py
+#
+# Dependency analysis of top-level statements, and an executor that runs
+# independent statements in parallel.
+#
+# Two top-level statements depend on each other when one writes a variable
+# the other reads or writes; a while or if counts as one statement that
+# reads and writes everything its condition and body do. Statements that do
+# not depend on each other, directly or through others, can run in any
+# order. waves() groups statements into waves: each statement goes in the
+# wave after the last one it depends on, so all statements of a wave are
+# independent of each other and only need the results of earlier waves.
+#
+# ParallelRuntime runs the statements of a wave that contain loops in worker
+# processes. Each worker gets a copy of just the variables its statement
+# uses, and sends back the values of the variables it assigned and what it
+# printed. Results are applied in program order and output is written in
+# program order, so printing and the final variables are the same as with
+# runtime.Runtime. Printing is not a dependency: each statement's output is
+# captured on its own and written out once every earlier statement is done.
+#
+# When a statement fails, the run stops as runtime.Runtime would at that
+# statement: the variables are those left by the statements before it and
+# by the failing statement itself, earlier statements that had not run yet
+# are run first, and results of later statements that already ran are
+# discarded. Later statements still running in workers are not waited for,
+# since they may never end: the shared pool is shut down and its workers
+# stopped.
+
+import collections
+import concurrent.futures
+
+import optimizer
+import output
+import runtime
+from resolver import is_temporary
+
+# The variables a statement reads and writes, and whether it prints. The
+# optimizer's temporaries are only used inside the statement that assigns
+# them, so they are not writes.
+Effects = collections.namedtuple('Effects', 'reads writes prints')
+
+
+def statement_effects(statement):
+    """Return the Effects of a parser.Parser statement."""
+    reads, writes, prints = set(), set(), False
+    pending = [statement]
+    while pending:
+        statement = pending.pop()
+        if statement is None:
+            continue
+        statement_type = statement[0]
+        if statement_type == 'assign':
+            reads |= optimizer.read_names(statement[2])
+            if not is_temporary(statement[1]):
+                writes.add(statement[1])
+        elif statement_type == 'print':
+            reads |= optimizer.read_names(statement[1])
+            prints = True
+        elif statement_type in ('if', 'while'):
+            reads |= optimizer.read_names(statement[1])
+            pending.extend(statement[2])
+    return Effects(reads, writes, prints)
+
+
+def dependency_graph(ast):
+    """Return, for each statement, the indexes of earlier statements it depends on."""
+    effects = [statement_effects(statement) for statement in ast]
+    graph = []
+    for index, (reads, writes, prints) in enumerate(effects):
+        used = reads | writes
+        graph.append({earlier for earlier in range(index)
+                      if effects[earlier].writes & used or effects[earlier].reads & writes})
+    return graph
+
+
+def waves(ast):
+    """Group statement indexes into waves of mutually independent statements."""
+    levels = []
+    groups = []
+    for index, predecessors in enumerate(dependency_graph(ast)):
+        level = max((levels[earlier] + 1 for earlier in predecessors), default=0)
+        levels.append(level)
+        if level == len(groups):
+            groups.append([])
+        groups[level].append(index)
+    return groups
+
+
+def contains_loop(statement):
+    """Whether a statement can run for longer than its length."""
+    if statement is None or statement[0] not in ('if', 'while'):
+        return False
+    return statement[0] == 'while' or any(contains_loop(inner) for inner in statement[2])
+
+
+def run_statement(statement, variables, writes):
+    """Run one statement on its own runtime.
+
+    Returns the final values of the variables in writes that are set, the
+    output, and the exception the statement raised or None.
+    """
+    engine = runtime.Runtime(output.CaptureSink())
+    engine.variables = variables
+    error = None
+    try:
+        engine.run([statement])
+    except Exception as e:
+        error = e
+    written = {name: variables[name] for name in writes if name in variables}
+    return written, engine.output.getvalue(), error
+
+
+class ParallelRuntime(runtime.Runtime):
+    """A runtime that runs independent top-level loops in worker processes.
+
+    Statements without loops run in this process, since sending them to a
+    worker would cost more than running them. Without an executor, runtimes
+    share a process pool that is started on first use.
+    """
+
+    def __init__(self, output_sink=None, executor=None):
+        super().__init__(output_sink)
+        self.executor = executor
+
+    def run(self, ast):
+        """Execute a list of statements, running independent ones in parallel."""
+        ast = [statement for statement in ast if statement is not None]
+        effects = [statement_effects(statement) for statement in ast]
+        initial = dict(self.variables)
+        results = [None] * len(ast)
+        written = 0  # Statements whose output has been written
+        try:
+            for wave in waves(ast):
+                futures = {}
+                failed = None
+                for index in wave:
+                    reads, writes, prints = effects[index]
+                    arguments = (ast[index], self.snapshot(reads | writes), writes)
+                    if len(wave) > 1 and contains_loop(ast[index]):
+                        futures[index] = self.pool().submit(run_statement, *arguments)
+                    else:
+                        results[index] = run_statement(*arguments)
+                        if results[index][2] is not None:
+                            failed = index  # Later statements of the wave are not needed
+                            break
+                # Results are waited for in program order, so a failure
+                # stops the wait for later statements, which may never end.
+                for index, future in futures.items():
+                    if failed is not None and index > failed:
+                        break
+                    results[index] = future.result()
+                    if results[index][2] is not None:
+                        failed = index
+                if failed is not None:
+                    self.abandon([future for index, future in futures.items() if index > failed])
+                    self.fail(ast, effects, results, initial, written, failed)
+                for index in wave:
+                    self.variables.update(results[index][0])
+                while written < len(ast) and results[written] is not None:
+                    self.output.write(results[written][1])
+                    written += 1
+        finally:
+            self.output.flush()
+
+    def snapshot(self, names):
+        """Copy the variables with the given names that are set."""
+        variables = self.variables
+        return {name: variables[name] for name in names if name in variables}
+
+    def fail(self, ast, effects, results, initial, written, failed):
+        """Finish a run the way runtime.Runtime would at a failing statement."""
+        self.variables = dict(initial)
+        for index in range(failed):
+            if results[index] is None:
+                reads, writes, prints = effects[index]
+                results[index] = run_statement(ast[index], self.snapshot(reads | writes), writes)
+            self.variables.update(results[index][0])
+            if results[index][2] is not None:  # An earlier statement that had not run yet failed
+                failed = index
+                break
+        else:
+            self.variables.update(results[failed][0])
+        for index in range(written, failed + 1):
+            self.output.write(results[index][1])
+        raise results[failed][2]
+
+    def abandon(self, futures):
+        """Give up on statements running in workers whose results are not needed.
+
+        Futures that have not started are cancelled. Statements that are
+        running may never end, so the shared process pool is shut down and
+        its workers stopped; an executor passed in is left to its owner.
+        """
+        running = [future for future in futures if not future.cancel() and not future.done()]
+        if running and self.executor is _shared_executor:
+            self.executor = None
+            stop_shared_executor()
+
+    def pool(self):
+        """Return the executor that runs statements in parallel."""
+        if self.executor is None:
+            self.executor = shared_executor()
+        return self.executor
+
+
+_shared_executor = None
+
+
+def shared_executor():
+    """Return the process pool shared by ParallelRuntimes, starting it if needed."""
+    global _shared_executor
+    if _shared_executor is None:
+        _shared_executor = concurrent.futures.ProcessPoolExecutor()
+    return _shared_executor
+
+
+def stop_shared_executor():
+    """Shut down the shared process pool, stopping statements still running in it."""
+    global _shared_executor
+    executor, _shared_executor = _shared_executor, None
+    if executor is None:
+        return
+    processes = list((executor._processes or {}).values())  # The executor has no public way to stop them
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
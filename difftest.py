@@ -0,0 +1,374 @@
+# difftest.py
+#
+# Differential testing harness. Runs sample programs through the reference
+# runtime.Runtime (and velox.Runtime for the dataclass AST) and through every
+# alternative execution engine, and reports any difference in printed output,
+# final variables or the type of a raised exception. Engines that run the
+# optimizer first are compared too, which checks that optimizing a program
+# never changes what it does.
+#
+# Usage: python difftest.py [file.vlx ...]
+
+import contextlib
+import io
+import os
+import sys
+
+import dependencies
+import interpreter
+import lexer
+import optimizer
+import parser
+import runtime
+import transpiler
+import velox
+import vm
+
+SAMPLES = [
+    ('example.vlx', None),
+    ('arithmetic', 'a = 10; b = a - 3; c = a + b - 1; print(c); print(a - b);'),
+    ('strings', 'name = "velox"; print("hello " + name); print(1 + "x" + 2);'),
+    ('unbound', 'print(missing); y = missing + "!"; print(y);'),
+    ('self assignment', 'b = b; print(b); c = d; e = 0;\nwhile (e < 2) {\n f = f;\n e = e + 1;\n}\nif (e > 5) {\n g = g;\n}\n'),
+    ('if', 'x = 3;\nif (x > 2) {\n print("big");\n}\nif (x < 2) {\n print("small");\n}\n'),
+    ('nested', 'i = 0; total = 0;\nwhile (i < 4) {\n j = 0;\n while (j < 3) {\n  total = total + j;\n'
+               '  j = j + 1;\n }\n if (i >= 2) {\n  print("i=" + i);\n }\n i = i + 1;\n}\nprint(total);\n'),
+    ('comparisons', 'x = 2;\nif (x <= 2) {\n print("le");\n}\nif (x >= 3) {\n print("ge");\n}\n'
+                    'if (x == 2) {\n print("eq");\n}\nif (x != 2) {\n print("ne");\n}\n'),
+    ('empty', ''),
+    ('folding', 'x = 2 + 3 - 1; s = "a" + "b" + x; print(s); print(x + 0.5); print(1 - "z");'),
+    ('dead code', 'debug = 0;\nif (debug > 0) {\n print("debug");\n}\nlimit = 3;\n'
+                  'while (limit < 2) {\n print("never");\n}\nif (limit == 3) {\n print("three");\n}\n'),
+    ('invariant', 'prefix = "item "; i = 0;\nwhile (i < 3) {\n i = i + 1;\n}\nbase = i - 2; n = 0;\n'
+                  'while (n < 40) {\n label = prefix + "#" + n;\n print(label);\n n = base - 1 + n + 7;\n'
+                  ' if (n > 20) {\n  print(prefix + base);\n }\n}\n'
+                  'while (i < 0) {\n z = prefix + "never";\n}\nprint(_hoisted0);\n'),
+    ('hoisted before an error', 'p = "x"; i = 0;\nwhile (i < 3) {\n s = p + "y";\n i = i + 1;\n'
+                                ' if (i > 1) {\n  t = p - 1;\n }\n}\n'),
+    ('invariant overflow', 'big = 1%s; f = 0.5; j = 0;\n'
+                           'while (j < 2) {\n print(j);\n j = j + 1;\n x = big * f;\n}\n' % ('0' * 400)),
+    ('independent', 'a = 0;\nwhile (a < 3) {\n print("a" + a);\n a = a + 1;\n}\nprint("between");\n'
+                    'b = 0;\nwhile (b < 4) {\n b = b + 1;\n}\nprint(b);\nc = a + b;\n'
+                    'while (a < 5) {\n a = a + 1;\n}\nprint(a + c);\n'),
+    ('independent failure', 'a = 0;\nwhile (a < 3) {\n print("a" + a);\n a = a + 1;\n}\n'
+                            'b = a;\nwhile (b < 5) {\n print("b" + b);\n b = b + 1;\n}\nc = "x" - 1;\n'
+                            'd = 0;\nwhile (d < 2) {\n print("d" + d);\n d = d + 1;\n}\n'),
+    ('failure before endless loops', 'x = "a" - 1;\nwhile (y != 5) {\n z = 1;\n}\nwhile (w != 5) {\n q = 1;\n}\n'),
+    ('failing loop before an endless loop', 'while (v != 1) {\n v = "a" - 1;\n}\nwhile (y != 5) {\n z = 1;\n}\n'),
+    ('arrays', 'a = [1, 2, 3]; b = [10, 20, 30,]; print(a + b); print(a * 2 - 1); print(b / a % 4);\n'
+               'print(a[0] + b[2]); print(len(a) + len([])); print("row " + a); s = ["x", 1] + ["!", 2]; print(s); print(s[0]);\n'
+               'i = 0; total = 0;\nwhile (i < 3) {\n total = total + a[i] * b[i];\n i = i + 1;\n}\nprint(total);\n'
+               'n = [a, b] * 2; print(n[1][2]); print((1 + 2) * 3); print(len("abc"));\n'),
+    ('array errors', 'a = [1, 2]; z = [1, 0]; print(a / 1); ok = a + a; bad = a / z; print(bad);'),
+    ('array mismatch', 'a = [1, 2]; b = [1, 2, 3]; i = 0;\n'
+                       'while (i < 2) {\n i = i + 1;\n if (i > 1) {\n  c = a + b;\n }\n}\n'),
+    ('numbers', 'a = 7; b = 2; print(a + b); print(a / b); print(a % b); print(a - 2.5); print(a * b * 1.0);\n'
+                'print("3" - 1); print("3" * b); big = 99999999999999999999 * 99999999999999999999; print(big + 1);\n'
+                'print(6 / 3); print(a - b - 10 % 4); x = 0;\nwhile (x < 3.5) {\n x = x + 1;\n}\nprint(x);\n'
+                'print([1, 2.5] + 1); print(len([1, 2]) * 2); y = a % 0;\n'),
+    ('ropes', 's = ""; i = 0;\nwhile (i < 200) {\n s = s + "ab" + i;\n i = i + 1;\n}\nprint(len(s)); print(s[500]);\n'
+              't = s + "X"; u = s + "Y"; print(t[len(t) - 1] + u[len(u) - 1]); v = "<" + t; print(len(v));\n'
+              'long = "0123456789012345678901234567890123456789012345678901234567890123456789" + '
+              '"0123456789012345678901234567890123456789012345678901234567890123456789012345678901234567890123456789" + '
+              '"0123456789012345678901234567890123456789012345678901234567890123456789012345678901234567890123456789" + "!";\n'
+              'print(long); w = [s, 1] + "!"; print(len(w)); n = t - 1;\n'),
+    ('counted loops', 'i = 0;\nwhile (i < 10) {\n i = i + 3;\n}\nprint(i); j = 0;\nwhile (j <= 10) {\n j = j + 2;\n}\n'
+                      'print(j); d = 3;\nwhile (d > 0) {\n d = d - 0.5;\n}\nprint(d); e = 0;\nwhile (e != 10) {\n e = e + 2;\n}\n'
+                      'print(e); f = 1.5;\nwhile (f < 4) {\n f = f + 1;\n}\nprint(f); k = 10;\nwhile (k < 3) {\n k = k + 1;\n}\n'
+                      'print(k); g = 0;\nwhile (g == 0) {\n g = g + 1;\n}\nprint(g);\nwhile (q < 3) {\n q = q + 1;\n}\n'),
+    ('traces', 'a = [1, 2.5, "q", [3]]; i = 0; t = 0; s = "";\nwhile (i < 8) {\n j = i;\n while (j > 0) {\n'
+               '  t = t + j / 2 - i % 3 * 1.5;\n  j = j - 1;\n }\n if (i < 4) {\n  e = a[i];\n  print(e);\n }\n'
+               ' s = s + i + "0123456789012345678901234567890123456789";\n i = i + 1;\n}\nprint(t); print(len(s));\n'
+               'k = 0;\nwhile (k < 3) {\n m = "k"; c = 1;\n while (c < 3) {\n  m = m + "k";\n  c = len(m);\n }\n'
+               ' k = k + 1;\n}\nprint(m); b = [1, 2, 3, 4, 5, "x", 7]; p = 0; q = 0;\nwhile (p < 3) {\n r = 0;\n'
+               ' while (r < 7) {\n  v = b[r];\n  q = q + r;\n  r = r + 1;\n }\n p = p + 1;\n}\nprint(q + v);\n'
+               'n = 0;\nwhile (n < 5) {\n n = n + 1;\n if (n > 3) {\n  n = n + "!";\n }\n}\n'),
+]
+
+DATACLASS_SAMPLES = [
+    ('precedence', 'x = 1 + 2 * 3 print x y = x / 2 - 1 print y'),
+    ('reassign', 'x = 4 x = x * x print x'),
+    ('undefined', 'print z'),
+    ('division by zero', 'x = 0 print 1 / x'),
+    ('folding', 'x = 2 * 3 - 1 y = x / 2 + z print y'),
+]
+
+
+def left_chain(terms):
+    """An expression adding 1 to itself terms times, as generated code would."""
+    expr = ('NUMBER', '0')
+    for _ in range(terms):
+        expr = ('BINARY', expr, '+', ('NUMBER', '1'))
+    return expr
+
+
+def right_chain(terms):
+    """An expression subtracting from 1 terms times, nested to the right."""
+    expr = ('NUMBER', '1')
+    for _ in range(terms):
+        expr = ('BINARY', ('NUMBER', '1'), '-', expr)
+    return expr
+
+
+# Programs in interpreter.Interpreter's AST, which has no parser.
+INTERPRETER_SAMPLES = [
+    ('folding', [
+        ('VAR_DECL', 'x', ('BINARY', ('NUMBER', '2'), '*', ('NUMBER', '21'))),
+        ('PRINT', ('BINARY', ('STRING', '"x="'), '+', ('STRING', '"42"'))),
+        ('PRINT', ('BINARY', ('IDENTIFIER', 'x'), '==', ('BINARY', ('NUMBER', '40'), '+', ('NUMBER', '2')))),
+        ('PRINT', ('UNARY', '!', ('NUMBER', '0'))),
+    ]),
+    ('dead code', [
+        ('IF', ('BINARY', ('NUMBER', '1'), '>', ('NUMBER', '2')), [('PRINT', ('STRING', '"no"'))],
+         [('VAR_DECL', 'y', ('NUMBER', '1')), ('PRINT', ('STRING', '"else"'))]),
+        ('WHILE', ('BINARY', ('NUMBER', '1'), '<', ('NUMBER', '0')), [('PRINT', ('STRING', '"never"'))]),
+        ('FUNCTION', 'f', ['a'], [
+            ('IF', ('UNARY', '-', ('NUMBER', '1')), [('VAR_DECL', 'b', ('IDENTIFIER', 'a'))]),
+            ('RETURN', ('BINARY', ('IDENTIFIER', 'b'), '+', ('BINARY', ('NUMBER', '1'), '+', ('NUMBER', '1')))),
+        ]),
+        ('PRINT', ('CALL', 'f', [('IDENTIFIER', 'y')])),
+    ]),
+    ('type error', [
+        ('PRINT', ('BINARY', ('STRING', '"a"'), '+', ('NUMBER', '1'))),
+    ]),
+    ('returns', [
+        ('FUNCTION', 'fact', ['n'], [
+            ('IF', ('BINARY', ('IDENTIFIER', 'n'), '<', ('NUMBER', '2')), [('RETURN', ('NUMBER', '1'))]),
+            ('RETURN', ('BINARY', ('IDENTIFIER', 'n'), '*',
+                        ('CALL', 'fact', [('BINARY', ('IDENTIFIER', 'n'), '-', ('NUMBER', '1'))]))),
+        ]),
+        ('PRINT', ('CALL', 'fact', [('NUMBER', '20')])),
+        ('RETURN', ('STRING', '"ignored"')),
+        ('PRINT', ('STRING', '"after a top-level return"')),
+    ]),
+    ('tail calls', [
+        ('FUNCTION', 'total', ['n', 'sum'], [
+            ('IF', ('BINARY', ('IDENTIFIER', 'n'), '==', ('NUMBER', '0')), [('RETURN', ('IDENTIFIER', 'sum'))]),
+            ('RETURN', ('CALL', 'total', [('BINARY', ('IDENTIFIER', 'n'), '-', ('NUMBER', '1')),
+                                          ('BINARY', ('IDENTIFIER', 'sum'), '+', ('IDENTIFIER', 'n'))])),
+        ]),
+        ('PRINT', ('CALL', 'total', [('NUMBER', '20000'), ('NUMBER', '0')])),
+    ]),
+    ('long chain', [
+        ('PRINT', left_chain(10000)),
+    ]),
+    ('deep recursion', [
+        ('FUNCTION', 'depth', ['n'], [
+            ('IF', ('BINARY', ('IDENTIFIER', 'n'), '<', ('NUMBER', '1')), [('RETURN', ('NUMBER', '0'))]),
+            ('IF', ('NUMBER', '1'), [
+                ('RETURN', ('BINARY', ('NUMBER', '1'), '+',
+                            ('CALL', 'depth', [('BINARY', ('IDENTIFIER', 'n'), '-', ('NUMBER', '1'))]))),
+            ]),
+        ]),
+        ('PRINT', ('CALL', 'depth', [('NUMBER', '5000')])),
+        ('PRINT', right_chain(300)),
+    ]),
+    ('memoization', [
+        ('FUNCTION', 'fib', ['n'], [
+            ('IF', ('BINARY', ('IDENTIFIER', 'n'), '<', ('NUMBER', '2')), [('RETURN', ('IDENTIFIER', 'n'))]),
+            ('RETURN', ('BINARY', ('CALL', 'fib', [('BINARY', ('IDENTIFIER', 'n'), '-', ('NUMBER', '1'))]), '+',
+                        ('CALL', 'fib', [('BINARY', ('IDENTIFIER', 'n'), '-', ('NUMBER', '2'))]))),
+        ]),
+        ('PRINT', ('CALL', 'fib', [('NUMBER', '20')])),
+        ('FUNCTION', 'shout', ['s'], [('PRINT', ('IDENTIFIER', 's')), ('RETURN', ('IDENTIFIER', 's'))]),
+        ('PRINT', ('CALL', 'shout', [('STRING', '"hi"')])),
+        ('PRINT', ('CALL', 'shout', [('STRING', '"hi"')])),
+        ('FUNCTION', 'base', ['n'], [('RETURN', ('NUMBER', '1'))]),
+        ('FUNCTION', 'scaled', ['n'], [('RETURN', ('BINARY', ('IDENTIFIER', 'n'), '*', ('CALL', 'base', [])))]),
+        ('PRINT', ('CALL', 'scaled', [('NUMBER', '3')])),
+        ('FUNCTION', 'base', ['n'], [('RETURN', ('NUMBER', '2'))]),
+        ('PRINT', ('CALL', 'scaled', [('NUMBER', '3')])),
+        ('FUNCTION', 'base', ['n'], [('PRINT', ('STRING', '"base"')), ('RETURN', ('NUMBER', '3'))]),
+        ('PRINT', ('CALL', 'scaled', [('NUMBER', '3')])),
+        ('PRINT', ('CALL', 'scaled', [('NUMBER', '3')])),
+        ('FUNCTION', 'same', ['a'], [('RETURN', ('IDENTIFIER', 'a'))]),
+        ('PRINT', ('CALL', 'same', [('NUMBER', '1')])),
+        ('PRINT', ('CALL', 'same', [('BINARY', ('NUMBER', '1'), '==', ('NUMBER', '1'))])),
+        ('PRINT', ('CALL', 'same', [('NUMBER', '0')])),
+        ('PRINT', ('CALL', 'same', [('UNARY', '-', ('NUMBER', '0'))])),
+        ('PRINT', ('BINARY', ('CALL', 'same', [('CALL', 'same', [('IDENTIFIER', 'fib')])]), '==', ('IDENTIFIER', 'fib'))),
+        ('PRINT', ('CALL', 'fib', [('STRING', '"x"')])),
+    ]),
+    ('lexical scopes', [
+        ('VAR_DECL', 'factor', ('NUMBER', '2')),
+        ('VAR_DECL', 'count', ('NUMBER', '0')),
+        ('FUNCTION', 'scale', ['n'], [('RETURN', ('BINARY', ('IDENTIFIER', 'n'), '*', ('IDENTIFIER', 'factor')))]),
+        ('PRINT', ('CALL', 'scale', [('NUMBER', '5')])),
+        ('ASSIGN', 'factor', ('NUMBER', '3')),
+        ('PRINT', ('CALL', 'scale', [('NUMBER', '5')])),
+        ('FUNCTION', 'tick', [], [('ASSIGN', 'count', ('BINARY', ('IDENTIFIER', 'count'), '+', ('NUMBER', '1'))),
+                                  ('RETURN', ('IDENTIFIER', 'count'))]),
+        ('PRINT', ('CALL', 'tick', [])),
+        ('PRINT', ('CALL', 'tick', [])),
+        ('FUNCTION', 'counter', ['start'], [
+            ('VAR_DECL', 'total', ('IDENTIFIER', 'start')),
+            ('FUNCTION', 'add', ['n'], [
+                ('ASSIGN', 'total', ('BINARY', ('IDENTIFIER', 'total'), '+', ('IDENTIFIER', 'n'))),
+                ('RETURN', ('IDENTIFIER', 'total')),
+            ]),
+            ('FUNCTION', 'peek', [], [('RETURN', ('BINARY', ('IDENTIFIER', 'total'), '*', ('IDENTIFIER', 'factor')))]),
+            ('VAR_DECL', 'ignored', ('CALL', 'add', [('NUMBER', '10')])),
+            ('PRINT', ('CALL', 'peek', [])),
+            ('RETURN', ('IDENTIFIER', 'add')),
+        ]),
+        ('VAR_DECL', 'add_a', ('CALL', 'counter', [('NUMBER', '1')])),
+        ('VAR_DECL', 'add_b', ('CALL', 'counter', [('NUMBER', '100')])),
+        ('PRINT', ('CALL', 'add_a', [('NUMBER', '1')])),
+        ('PRINT', ('CALL', 'add_a', [('NUMBER', '1')])),
+        ('PRINT', ('CALL', 'add_b', [('NUMBER', '1')])),
+        ('FUNCTION', 'shadow', ['count'], [('RETURN', ('BINARY', ('IDENTIFIER', 'count'), '+', ('NUMBER', '1')))]),
+        ('PRINT', ('CALL', 'shadow', [('NUMBER', '41')])),
+        ('PRINT', ('IDENTIFIER', 'count')),
+        ('FUNCTION', 'early', [], [('PRINT', ('IDENTIFIER', 'factor')), ('VAR_DECL', 'factor', ('NUMBER', '1'))]),
+        ('PRINT', ('CALL', 'early', [])),
+    ]),
+]
+
+
+def optimized(engine_class, optimizer_class, level):
+    """Return an engine class that optimizes programs before running them."""
+    class OptimizedEngine(engine_class):
+        def run(self, ast):
+            super().run(optimizer_class(level).optimize(ast))
+    return OptimizedEngine
+
+
+class JitRuntime(runtime.Runtime):
+    """A runtime.Runtime that compiles every loop after its first iteration."""
+
+    def __init__(self):
+        super().__init__(jit_threshold=1)
+
+
+class UnfusedRuntime(runtime.Runtime):
+    """A runtime.Runtime that runs every loop on the general path."""
+
+    def __init__(self):
+        super().__init__(fuse_loops=False)
+
+
+class InterpreterEngine(interpreter.Interpreter):
+    """Adapts interpreter.Interpreter to the engine interface."""
+
+    def run(self, ast):
+        self.interpret(ast)
+
+    @property
+    def variables(self):
+        # Function values hold their (possibly optimized) body; leave them out.
+        return {name: value for name, value in self.environment.variables.items()
+                if not isinstance(value, dict)}
+
+
+class CompiledInterpreterEngine(InterpreterEngine):
+    def __init__(self):
+        super().__init__(compiled=True)
+
+
+class UnmemoizedInterpreterEngine(InterpreterEngine):
+    def __init__(self):
+        super().__init__(memoize=False)
+
+
+# Engines compared against runtime.Runtime on the parser's tuple AST.
+ENGINES = {
+    'vm.VM': vm.VM,
+    'transpiler.CompiledRuntime': transpiler.CompiledRuntime,
+    'runtime.Runtime -O1': optimized(runtime.Runtime, optimizer.Optimizer, 1),
+    'runtime.Runtime -O2': optimized(runtime.Runtime, optimizer.Optimizer, 2),
+    'vm.VM -O2': optimized(vm.VM, optimizer.Optimizer, 2),
+    'transpiler.CompiledRuntime -O2': optimized(transpiler.CompiledRuntime, optimizer.Optimizer, 2),
+    'dependencies.ParallelRuntime': dependencies.ParallelRuntime,
+    'runtime.Runtime(jit_threshold=1)': JitRuntime,
+    'runtime.Runtime(fuse_loops=False)': UnfusedRuntime,
+}
+
+# Engines compared against velox.Runtime on the dataclass AST.
+DATACLASS_ENGINES = {
+    'transpiler.CompiledDataclassRuntime': transpiler.CompiledDataclassRuntime,
+    'velox.Runtime -O1': optimized(velox.Runtime, optimizer.DataclassOptimizer, 1),
+}
+
+# Engines compared against interpreter.Interpreter.
+INTERPRETER_ENGINES = {
+    'Interpreter(compiled=True)': CompiledInterpreterEngine,
+    'Interpreter -O1': optimized(InterpreterEngine, optimizer.InterpreterOptimizer, 1),
+    'Interpreter(compiled=True) -O1': optimized(CompiledInterpreterEngine, optimizer.InterpreterOptimizer, 1),
+    'Interpreter(memoize=False)': UnmemoizedInterpreterEngine,
+}
+
+
+def parse_source(source):
+    """Tokenize and parse Velox source into the tuple AST."""
+    return parser.Parser(lexer.Lexer(source).stream(), source).parse()
+
+
+def parse_dataclass_source(source):
+    """Tokenize and parse source with the velox.py front end."""
+    return velox.Parser(velox.Lexer(source).tokenize()).parse()
+
+
+def observe(engine_class, ast):
+    """Run a program and return (output, variables, exception type)."""
+    engine = engine_class()
+    output = io.StringIO()
+    error = None
+    with contextlib.redirect_stdout(output):
+        try:
+            engine.run(ast)
+        except Exception as e:
+            error = type(e).__name__
+    return output.getvalue(), engine.variables, error
+
+
+def compare(reference_class, engines, ast):
+    """Return a list of differences between the reference and each engine."""
+    expected = observe(reference_class, ast)
+    differences = []
+    for name, engine_class in engines.items():
+        actual = observe(engine_class, ast)
+        for label, want, got in zip(('output', 'variables', 'error'), expected, actual):
+            if want != got:
+                differences.append(f"{name}: {label} differs\n  expected: {want!r}\n  actual:   {got!r}")
+    return differences
+
+
+def check(source):
+    """Compare all tuple AST engines on a Velox program."""
+    return compare(runtime.Runtime, ENGINES, parse_source(source))
+
+
+def check_dataclass(source):
+    """Compare all dataclass AST engines on a velox.py program."""
+    return compare(velox.Runtime, DATACLASS_ENGINES, parse_dataclass_source(source))
+
+
+def check_interpreter(ast):
+    """Compare all engines for interpreter.Interpreter's AST on a program."""
+    return compare(InterpreterEngine, INTERPRETER_ENGINES, ast)
+
+
+def main(paths):
+    samples = [(path, open(path).read()) for path in paths]
+    if not samples:
+        directory = os.path.dirname(os.path.abspath(__file__))
+        samples = [(name, source if source is not None else open(os.path.join(directory, name)).read())
+                   for name, source in SAMPLES]
+
+    failures = 0
+    checks = [(check, samples)]
+    if not paths:
+        checks += [(check_dataclass, DATACLASS_SAMPLES), (check_interpreter, INTERPRETER_SAMPLES)]
+    for checker, programs in checks:
+        for name, source in programs:
+            differences = checker(source)
+            print(f"{'FAIL' if differences else 'ok  '} {name}")
+            for difference in differences:
+                print(f"  {difference}")
+            failures += bool(differences)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,233 @@
+# incremental.py
+#
+# Incremental re-lexing and re-parsing for editor integrations.
+#
+# A Document keeps its source as a list of chunks, one per top-level
+# statement. Each chunk holds the statement's text (including the whitespace
+# that follows it), its tokens with offsets relative to the chunk, and its
+# AST. An edit re-lexes and re-parses only the chunks around the edit, and
+# stops as soon as the new token stream reaches the start of an unchanged
+# chunk past the edit. Lexing from a position depends only on the text after
+# it, and the parser starts every top-level statement afresh, so every chunk
+# from that point on can be reused as is.
+#
+# Chunk start offsets are stored with a gap: entries at or after self.gap
+# are smaller than the true offset by self.delta. An edit moves the gap to
+# the edited chunk and adjusts the delta, so its cost depends on the size
+# of the edit and on how far it is from the previous one, not on the size
+# of the document.
+
+import lexer
+import parser
+from lexer import EOF
+
+
+class Chunk:
+    """The text, tokens and AST of one top-level statement."""
+    __slots__ = ('text', 'tokens', 'ast', 'error')
+
+    def __init__(self, text, tokens, ast, error=None):
+        self.text = text
+        self.tokens = tokens  # (kind, start, end) relative to the chunk
+        self.ast = ast  # None for leading whitespace and syntax errors
+        self.error = error
+
+    def same_as(self, other):
+        """Whether two chunks parse to the same statement from the same text."""
+        return self.text == other.text and self.ast == other.ast and self.error is None and other.error is None
+
+
+class RecordingStream:
+    """Wraps a token stream and keeps every token it yields."""
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.seen = []
+
+    def __iter__(self):
+        for token in self.tokens:
+            self.seen.append(token)
+            yield token
+
+
+class Document:
+    """Source text kept parsed across edits."""
+
+    def __init__(self, source=''):
+        self.length = len(source)
+        self.chunks = []
+        self.starts = []
+        self.gap = 0
+        self.delta = 0
+        chunks, _ = self.parse_region(source, 0, {}, at_end=True, leading=True)
+        self.splice(0, 0, chunks)
+
+    @property
+    def source(self):
+        """The full text of the document."""
+        return ''.join(chunk.text for chunk in self.chunks)
+
+    @property
+    def ast(self):
+        """The statements of the document, as parser.Parser would produce."""
+        return [chunk.ast for chunk in self.chunks if chunk.ast is not None]
+
+    @property
+    def errors(self):
+        """The syntax errors in the document."""
+        return [chunk.error for chunk in self.chunks if chunk.error is not None]
+
+    def tokens(self):
+        """Yield the document's tokens as (kind, start, end) offsets."""
+        for index, chunk in enumerate(self.chunks):
+            start = self.start(index)
+            for kind, token_start, token_end in chunk.tokens:
+                yield (kind, start + token_start, start + token_end)
+
+    def start(self, index):
+        """Return the offset at which a chunk starts."""
+        if index >= self.gap:
+            return self.starts[index] + self.delta
+        return self.starts[index]
+
+    def find(self, offset):
+        """Return the index of the last chunk starting at or before offset."""
+        low, high = 0, len(self.chunks) - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.start(middle) <= offset:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    def move_gap(self, index):
+        """Make stored offsets exact for all chunks before index."""
+        starts, delta = self.starts, self.delta
+        for position in range(self.gap, index):
+            starts[position] += delta
+        for position in range(index, self.gap):
+            starts[position] -= delta
+        self.gap = index
+
+    def splice(self, index, removed, chunks):
+        """Replace removed chunks at index with new chunks."""
+        self.move_gap(index)
+        following = index + removed
+        offset = (self.start(following) if following < len(self.chunks) else self.length)
+        offset -= sum(len(chunk.text) for chunk in chunks)
+        starts = []
+        for chunk in chunks:
+            starts.append(offset)
+            offset += len(chunk.text)
+        self.chunks[index:following] = chunks
+        self.starts[index:following] = starts
+        self.gap = index + len(chunks)
+
+    def edit(self, offset, deleted, inserted):
+        """Apply a text edit and re-parse the statements it affects.
+
+        Returns (index, removed, added): the chunks from index to
+        index + removed were replaced by the list of chunks added.
+        """
+        if not 0 <= offset <= offset + deleted <= self.length:
+            raise ValueError(f"Edit {offset}:{offset + deleted} is outside the document")
+
+        last = self.find(offset + deleted)
+        self.move_gap(last + 1)
+        self.delta += len(inserted) - deleted
+        self.length += len(inserted) - deleted
+
+        # The statement before the edit can extend into the edited text, so
+        # parsing starts one chunk earlier. If the region then starts with
+        # something that is not a statement, the statement before it may
+        # absorb it, so parsing starts earlier still.
+        first = self.find(offset)
+        while True:
+            first = max(first - 1, 0)
+            region_start = self.start(first)
+            extra = 1
+            while True:
+                end = min(last + 1 + extra, len(self.chunks))
+                text, boundaries = self.region_text(first, last, offset - region_start, deleted, inserted, end)
+                chunks, resync = self.parse_region(text, offset - region_start + len(inserted), boundaries,
+                                                   at_end=end == len(self.chunks), leading=first == 0)
+                if chunks is not None:
+                    break
+                extra *= 2  # The parse ran past the region; extend it
+            if first == 0 or (chunks and chunks[0].ast is not None):
+                break
+
+        removed = resync - first
+        # Keep leading chunks that did not change.
+        index = first
+        while chunks and removed and chunks[0].same_as(self.chunks[index]):
+            chunks.pop(0)
+            index += 1
+            removed -= 1
+        self.splice(index, removed, chunks)
+        return index, removed, chunks
+
+    def region_text(self, first, last, offset, deleted, inserted, end):
+        """Return the text of chunks first to end with the edit applied.
+
+        Also returns the offsets in that text at which an unchanged
+        statement chunk after the edit starts, mapped to its index.
+        """
+        old = ''.join(chunk.text for chunk in self.chunks[first:last + 1])
+        pieces = [old[:offset], inserted, old[offset + deleted:]]
+        position = sum(map(len, pieces))
+        boundaries = {}
+        for index in range(last + 1, end):
+            chunk = self.chunks[index]
+            if chunk.ast is not None:
+                boundaries[position] = index
+            pieces.append(chunk.text)
+            position += len(chunk.text)
+        return ''.join(pieces), boundaries
+
+    def parse_region(self, text, edit_end, boundaries, at_end, leading):
+        """Parse text into chunks, mirroring Parser.parse error recovery.
+
+        Parsing stops at the first statement at or after edit_end that
+        starts an unchanged chunk listed in boundaries, and returns the new
+        chunks with the index of that chunk. Reaching the end of the text
+        before then returns None for the chunks unless at_end is true, since
+        the last statement may continue past the region.
+        """
+        chunks = []
+        stream = RecordingStream(lexer.Lexer(text).stream())
+        start = consumed = 0
+        try:
+            pars = parser.Parser(stream, text)
+            if leading:
+                start = pars.current[1]
+                chunks.append(Chunk(text[:start], [], None))
+
+            while pars.current[0] != EOF:
+                if start >= edit_end and start in boundaries:
+                    return chunks, boundaries[start]
+                try:
+                    statement, error = pars.parse_statement(), None
+                except lexer.LexerError:
+                    raise
+                except SyntaxError as e:
+                    statement, error = None, e
+                    pars.advance()  # Skip the problematic token
+                end = pars.current[1]
+                chunks.append(self.make_chunk(text, start, end, stream.seen[consumed:pars.position], statement, error))
+                start, consumed = end, pars.position
+        except lexer.LexerError as e:
+            if not at_end:
+                return None, None
+            # An illegal character: the rest of the document is one error.
+            chunks.append(Chunk(text[start:], [], None, e))
+
+        if not at_end:
+            return None, None
+        return chunks, len(self.chunks)
+
+    def make_chunk(self, text, start, end, tokens, ast, error=None):
+        """Build a chunk for text[start:end] with chunk-relative tokens."""
+        return Chunk(text[start:end], [(kind, token_start - start, token_end - start)
+                                       for kind, token_start, token_end in tokens], ast, error)
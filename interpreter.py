@@ -1,7 +1,15 @@
 # interpreter.py
-from typing import Any, Dict, List, Union
+import asyncio
+import inspect
+import operator
+import sys
+from typing import Any, Callable, Dict, List, Union
 from dataclasses import dataclass
 
+import memo
+import output
+from resolver import SlotTable, UNDEFINED, resolve_function
+
 @dataclass
 class Environment:
     """Stores the interpreter's variable environment."""
@@ -27,170 +35,450 @@ class Environment:
         else:
             raise RuntimeError(f"Undefined variable '{name}'")
 
+class Frame(list):
+    """A function call's variables, stored in slots resolved ahead of time.
+    
+    Has the same interface as Environment, but is a single preallocated
+    list indexed by the slots of the function's SlotTable. parent is the
+    frame of the function it was declared in, or the global Environment:
+    names the function does not declare are looked up along that chain, at
+    the (depth, slot) the table resolved them to. Use new_frame to create
+    one.
+    """
+    __slots__ = ('table', 'parent')
+    
+    def define(self, name: str, value: Any) -> None:
+        """Define a variable in the frame."""
+        slot = self.table.slots.get(name)
+        if slot is None:
+            raise RuntimeError(f"Variable '{name}' was not resolved")
+        self[slot] = value
+    
+    def get(self, name: str) -> Any:
+        """Get a variable's value from the frame or the scopes enclosing it."""
+        slot = self.table.slots.get(name)
+        if slot is None:
+            return self.get_outer(name)
+        value = self[slot]
+        if value is UNDEFINED:
+            raise RuntimeError(f"Undefined variable '{name}'")
+        return value
+    
+    def assign(self, name: str, value: Any) -> None:
+        """Assign a value to an existing variable."""
+        slot = self.table.slots.get(name)
+        frame = self
+        if slot is None:
+            where = self.table.lookup(name)
+            if where is None:
+                self.globals().assign(name, value)
+                return
+            frame = self.enclosing(where[0])
+            slot = where[1]
+        if frame[slot] is UNDEFINED:
+            raise RuntimeError(f"Undefined variable '{name}'")
+        frame[slot] = value
+    
+    def get_outer(self, name: str) -> Any:
+        """Get the value of a variable the frame's function does not declare."""
+        where = self.table.lookup(name)
+        if where is None:
+            return self.globals().get(name)
+        value = self.enclosing(where[0])[where[1]]
+        if value is UNDEFINED:
+            raise RuntimeError(f"Undefined variable '{name}'")
+        return value
+    
+    def enclosing(self, depth: int) -> 'Frame':
+        """Return the frame depth levels up the chain; 0 is this frame."""
+        frame = self
+        for _ in range(depth):
+            frame = frame.parent
+        return frame
+    
+    def globals(self) -> Environment:
+        """Return the global Environment at the end of the chain."""
+        scope = self.parent
+        while type(scope) is Frame:
+            scope = scope.parent
+        return scope
+
+def new_frame(table: SlotTable, parent: Union[Frame, Environment]) -> Frame:
+    """Create a frame with every slot of a SlotTable undefined."""
+    frame = Frame(table.template)
+    frame.table = table
+    frame.parent = parent
+    return frame
+
+def declare_function(params: List[str], body: List, scope: Union[Frame, Environment]) -> dict:
+    """Return the function a declaration made in scope, a Frame or the globals, defines."""
+    parent = scope.table if type(scope) is Frame else None
+    return {'params': params, 'body': body, 'slots': resolve_function(params, body, parent), 'scope': scope}
+
+def function_slots(function: dict) -> SlotTable:
+    """Return a function's SlotTable, resolving it on first use."""
+    table = function.get('slots')
+    if table is None:
+        table = function['slots'] = resolve_function(function['params'], function['body'])
+    return table
+
+# Tasks of the explicit-stack evaluator. AST nodes are pushed on the task
+# stack as they are; these tasks finish what a node started once the values
+# it needs are on the value stack. They are lowercase so they never clash
+# with node types.
+APPLY_BINARY = 'apply binary'
+APPLY_UNARY = 'apply unary'
+CONSTANT = 'constant'
+CALL = 'call'
+TAIL_CALL = 'tail call'
+END_CALL = 'end call'
+MEMOIZE = 'memoize'
+HOST_CALL = 'host call'
+RETURN = 'return'
+PRINT_VALUE = 'print value'
+DEFINE = 'define'
+ASSIGN_VALUE = 'assign value'
+BRANCH = 'branch'
+LOOP = 'loop'
+
+RETURN_TASK = (RETURN,)
+END_CALL_TASK = (END_CALL,)
+PRINT_TASK = (PRINT_VALUE,)
+NO_VALUE = (CONSTANT, None)
+
+# Compiled code runs on the Python stack. A compiled call that would take it
+# past MAX_COMPILED_FRAMES frames runs on the task stack instead, and so does
+# an expression nested more than MAX_COMPILED_NESTING levels deep.
+MAX_COMPILED_FRAMES = 400
+MAX_COMPILED_NESTING = 100
+
+# interpret_async hands control back to the event loop this often, counted
+# in loop iterations.
+DEFAULT_YIELD_EVERY = 100
+
 class Interpreter:
-    """Interprets the AST nodes and executes the program."""
+    """Interprets the AST nodes and executes the program.
+    
+    Statements and expressions are evaluated on an explicit task stack
+    rather than by recursive Python calls, so neither expression nesting
+    nor Velox call depth is limited by the Python stack. A RETURN of a CALL
+    inside a function is a tail call: it replaces the current call instead
+    of nesting a new one.
+    
+    Because the whole state of a run lives on those stacks, a run can also
+    be suspended and resumed: interpret_async runs a program as a coroutine
+    that lets other tasks run at loop back-edges and while it awaits host
+    functions, the Python callables made available to programs with
+    define_host_function.
     
-    def __init__(self):
+    Calls to pure functions are memoized unless memoize is False: their
+    results are kept in a memo.LRUCache of up to memo_size calls, whose
+    counters memo_stats returns.
+    """
+    
+    def __init__(self, compiled: bool = False, output_sink: output.Sink = None, memoize: bool = True,
+                 memo_size: int = memo.DEFAULT_SIZE):
         self.environment = Environment()
+        self.globals = self.environment
+        self.compiled = compiled
+        self.output = output_sink if output_sink is not None else output.StreamSink()
+        self.literals: Dict[str, Any] = {}  # NUMBER and STRING literal text -> its value, parsed once
+        self.memo = memo.LRUCache(memo_size) if memoize else None
+        self.compiled_frames = 0  # Python frames held by the compiled calls running now
     
     def interpret(self, ast: List) -> None:
         """Interpret a list of AST nodes."""
         try:
-            for node in ast:
-                self.execute(node)
+            if self.compiled:
+                ClosureCompiler(self).compile_block(ast)()
+            else:
+                self.execute_block(ast)
         except Exception as e:
             raise RuntimeError(f"Runtime error: {str(e)}")
+        finally:
+            self.output.flush()
     
-    def execute(self, node: tuple) -> None:
-        """Execute a single AST node."""
-        node_type = node[0]
+    async def interpret_async(self, ast: List, yield_every: int = DEFAULT_YIELD_EVERY) -> None:
+        """Interpret a list of AST nodes as a coroutine.
         
-        # Mapping of node types to their handler methods
-        handlers = {
-            'PRINT': self.execute_print,
-            'VAR_DECL': self.execute_var_decl,
-            'ASSIGN': self.execute_assign,
-            'IF': self.execute_if,
-            'WHILE': self.execute_while,
-            'FUNCTION': self.execute_function,
-            'RETURN': self.execute_return,
-            'BLOCK': self.execute_block
-        }
+        Control goes back to the event loop every yield_every loop
+        iterations, and whenever a host function returns an awaitable, which
+        is awaited and its result used as the value of the call. Programs
+        run on the task stack even if the interpreter is compiled.
+        """
+        machine = self.machine(list(reversed(ast)), yield_every)
+        value, error = None, None
+        try:
+            while True:
+                try:
+                    request = machine.send(value) if error is None else machine.throw(error)
+                except StopIteration:
+                    return
+                value, error = None, None
+                if request is None:
+                    await asyncio.sleep(0)
+                else:
+                    try:
+                        value = await request
+                    except Exception as e:
+                        error = e  # Raised inside the program, at the call
+        except Exception as e:
+            raise RuntimeError(f"Runtime error: {str(e)}")
+        finally:
+            self.output.flush()
+    
+    def define_host_function(self, name: str, function: Callable[..., Any]) -> None:
+        """Make a Python callable available to programs as a global function.
         
-        if node_type in handlers:
-            handlers[node_type](node)
-        else:
-            raise RuntimeError(f"Unknown node type: {node_type}")
-    
-    def execute_print(self, node: tuple) -> None:
-        """Execute a print statement."""
-        value = self.evaluate_expression(node[1])
-        print(str(value))
-    
-    def execute_var_decl(self, node: tuple) -> None:
-        """Execute a variable declaration."""
-        name = node[1]
-        value = self.evaluate_expression(node[2])
-        self.environment.define(name, value)
-    
-    def execute_assign(self, node: tuple) -> None:
-        """Execute a variable assignment."""
-        name = node[1]
-        value = self.evaluate_expression(node[2])
-        self.environment.assign(name, value)
-    
-    def execute_if(self, node: tuple) -> None:
-        """Execute an if statement."""
-        condition = self.evaluate_expression(node[1])
-        
-        if self.is_truthy(condition):
-            self.execute_block(node[2])
-        elif len(node) > 3:  # Has else block
-            self.execute_block(node[3])
-    
-    def execute_while(self, node: tuple) -> None:
-        """Execute a while loop."""
-        while self.is_truthy(self.evaluate_expression(node[1])):
-            self.execute_block(node[2])
-    
-    def execute_function(self, node: tuple) -> None:
-        """Execute a function declaration."""
-        name = node[1]
-        params = node[2]
-        body = node[3]
-        self.environment.define(name, {'params': params, 'body': body})
-    
-    def execute_return(self, node: tuple) -> Any:
-        """Execute a return statement."""
-        if len(node) > 1:
-            return self.evaluate_expression(node[1])
-        return None
+        A host function may return an awaitable, but can then only be
+        called from programs run with interpret_async.
+        """
+        self.globals.define(name, function)
+    
+    def execute(self, node: tuple) -> None:
+        """Execute a single AST node."""
+        self.run_tasks([node])
     
     def execute_block(self, statements: List) -> None:
         """Execute a block of statements."""
-        for statement in statements:
-            self.execute(statement)
+        self.run_tasks(list(reversed(statements)))
     
     def evaluate_expression(self, expr: Union[tuple, str, float]) -> Any:
         """Evaluate an expression and return its value."""
-        if isinstance(expr, (str, float, int)):
-            return expr
-        
-        expr_type = expr[0]
-        
-        evaluators = {
-            'NUMBER': lambda: float(expr[1]),
-            'STRING': lambda: expr[1][1:-1],  # Strip quotes
-            'IDENTIFIER': lambda: self.environment.get(expr[1]),
-            'BINARY': lambda: self.evaluate_binary(expr[1], expr[2], expr[3]),
-            'UNARY': lambda: self.evaluate_unary(expr[1], expr[2]),
-            'CALL': lambda: self.evaluate_call(expr[1], expr[2])
-        }
-        
-        if expr_type in evaluators:
-            return evaluators[expr_type]()
-        
-        raise RuntimeError(f"Unknown expression type: {expr_type}")
+        return self.run_tasks([expr if isinstance(expr, tuple) else (CONSTANT, expr)])
     
-    def evaluate_binary(self, left: Any, operator: str, right: Any) -> Any:
-        """Evaluate a binary expression."""
-        left_val = self.evaluate_expression(left)
-        right_val = self.evaluate_expression(right)
-        
-        operators = {
-            '+': lambda: left_val + right_val,
-            '-': lambda: left_val - right_val,
-            '*': lambda: left_val * right_val,
-            '/': lambda: left_val / right_val,
-            '%': lambda: left_val % right_val,
-            '==': lambda: left_val == right_val,
-            '!=': lambda: left_val != right_val,
-            '<': lambda: left_val < right_val,
-            '<=': lambda: left_val <= right_val,
-            '>': lambda: left_val > right_val,
-            '>=': lambda: left_val >= right_val
-        }
-        
-        if operator in operators:
-            return operators[operator]()
-        
-        raise RuntimeError(f"Unknown operator: {operator}")
+    def call_on_stack(self, function: Any, arguments: List) -> Any:
+        """Call a function with arguments already evaluated, on the task stack."""
+        tasks = [(CALL if isinstance(function, dict) else HOST_CALL, function, len(arguments))]
+        tasks.extend((CONSTANT, argument) for argument in reversed(arguments))
+        return self.run_tasks(tasks)
     
-    def evaluate_unary(self, operator: str, operand: Any) -> Any:
-        """Evaluate a unary expression."""
-        value = self.evaluate_expression(operand)
+    def lookup_function(self, callee: str) -> dict:
+        """Find the function a call refers to.
         
-        if operator == '-':
-            return -float(value)
-        elif operator == '!':
-            return not self.is_truthy(value)
-        
-        raise RuntimeError(f"Unknown unary operator: {operator}")
-    
-    def evaluate_call(self, callee: str, arguments: List) -> Any:
-        """Evaluate a function call."""
+        The callee is looked up like any other name, so functions can call
+        themselves, each other and the functions they are nested in.
+        """
         function = self.environment.get(callee)
+        if callable(function):
+            return function  # A host function
         if not isinstance(function, dict) or 'params' not in function:
             raise RuntimeError(f"Can only call functions. Got: {callee}")
+        return function
+    
+    def memo_key(self, function: dict, arguments: List) -> Any:
+        """Return the memo cache key of a call, or None if the call is not memoized."""
+        if self.memo is None:
+            return None
+        purity = function.get('purity')
+        variables = self.globals.variables
+        if purity is None or not purity.current(variables):
+            purity = function['purity'] = memo.analyze(function, variables)
+        if not purity.memoized:
+            return None
+        return memo.call_key(purity, arguments)
+    
+    def memo_stats(self) -> memo.Stats:
+        """Return the hits, misses, evictions and size of the memo cache."""
+        if self.memo is None:
+            return memo.Stats(0, 0, 0, 0, 0)
+        return self.memo.stats()
+    
+    def run_tasks(self, tasks: List) -> Any:
+        """Run tasks until the stack is empty; return the last value left."""
+        machine = self.machine(tasks)
+        try:
+            awaitable = next(machine)
+        except StopIteration as stop:
+            return stop.value
+        machine.close()
+        close = getattr(awaitable, 'close', None)
+        if close is not None:
+            close()  # Avoid a warning about a coroutine that was never awaited
+        raise RuntimeError("A host function returned an awaitable; use interpret_async")
+    
+    def machine(self, tasks: List, yield_every: int = None):
+        """Run tasks as a generator; return the last value left.
         
-        # Create new environment for function scope
-        previous_env = self.environment
-        self.environment = Environment()
+        The generator yields every yield_every loop iterations, if given,
+        and yields the awaitables returned by host functions, expecting to
+        be sent their results.
+        """
+        countdown = yield_every
+        values = []
+        frames = []  # Task stack index of each active call's END_CALL, then the environment to return to
+        push, pop, schedule = values.append, values.pop, tasks.append
+        print_value = self.output.print
+        literals = self.literals
+        operators = BINARY_OPERATORS
+        is_truthy = self.is_truthy
+        memo_cache = self.memo
+        caller_environment = self.environment
         
         try:
-            # Bind arguments to parameters
-            for param, arg in zip(function['params'], arguments):
-                self.environment.define(param, self.evaluate_expression(arg))
-            
-            # Execute function body
-            for statement in function['body']:
-                if statement[0] == 'RETURN':
-                    return self.execute_return(statement)
-                self.execute(statement)
-            
-            return None
-        finally:
-            self.environment = previous_env
+            while tasks:
+                task = tasks.pop()
+                kind = task[0]
+                
+                # Expressions
+                if kind == 'IDENTIFIER':
+                    push(self.environment.get(task[1]))
+                elif kind == 'NUMBER':
+                    value = literals.get(task[1])
+                    if value is None:
+                        value = literals[task[1]] = float(task[1])
+                    push(value)
+                elif kind == 'BINARY':
+                    left, right = task[1], task[3]
+                    schedule((APPLY_BINARY, task[2]))
+                    schedule(right if isinstance(right, tuple) else (CONSTANT, right))
+                    schedule(left if isinstance(left, tuple) else (CONSTANT, left))
+                elif kind == APPLY_BINARY:
+                    right = pop()
+                    function = operators.get(task[1])
+                    if function is None:
+                        raise RuntimeError(f"Unknown operator: {task[1]}")
+                    values[-1] = function(values[-1], right)
+                elif kind == 'STRING':
+                    value = literals.get(task[1])
+                    if value is None:
+                        value = literals[task[1]] = sys.intern(task[1][1:-1])  # Strip quotes
+                    push(value)
+                elif kind == CONSTANT:
+                    push(task[1])
+                elif kind == 'UNARY':
+                    operand = task[2]
+                    schedule((APPLY_UNARY, task[1]))
+                    schedule(operand if isinstance(operand, tuple) else (CONSTANT, operand))
+                elif kind == APPLY_UNARY:
+                    if task[1] == '-':
+                        values[-1] = -float(values[-1])
+                    elif task[1] == '!':
+                        values[-1] = not is_truthy(values[-1])
+                    else:
+                        raise RuntimeError(f"Unknown unary operator: {task[1]}")
+                elif kind == 'CALL':
+                    function, arguments = self.lookup_function(task[1]), task[2]
+                    schedule((CALL if isinstance(function, dict) else HOST_CALL, function, len(arguments)))
+                    for argument in reversed(arguments):
+                        schedule(argument if isinstance(argument, tuple) else (CONSTANT, argument))
+                elif kind == CALL or kind == TAIL_CALL:
+                    function, count = task[1], task[2]
+                    arguments = values[len(values) - count:]
+                    del values[len(values) - count:]
+                    key = self.memo_key(function, arguments) if kind == CALL and memo_cache is not None else None
+                    if key is not None:
+                        result = memo_cache.lookup(key)
+                        if result is not memo.MISSING:
+                            push(result)
+                            continue
+                        schedule((MEMOIZE, key))  # Runs once the call has left its result
+                    table = function_slots(function)
+                    if table.names:
+                        frame = Frame(table.template)
+                        frame.table = table
+                        frame.parent = function.get('scope', self.globals)
+                        slots = table.slots
+                        for param, value in zip(function['params'], arguments):
+                            frame[slots[param]] = value
+                    else:  # Nothing to store, so the body runs in the scope it was declared in
+                        frame = function.get('scope', self.globals)
+                    if kind == CALL:
+                        frames.append(len(tasks))
+                        frames.append(self.environment)
+                        schedule(END_CALL_TASK)
+                    else:
+                        del tasks[frames[-2] + 1:]  # Nothing is left to run in the caller
+                    self.environment = frame
+                    tasks.extend(reversed(function['body']))
+                elif kind == HOST_CALL:
+                    count = task[2]
+                    arguments = values[len(values) - count:]
+                    del values[len(values) - count:]
+                    result = task[1](*arguments)
+                    if inspect.isawaitable(result):
+                        result = yield result
+                    push(result)
+                elif kind == END_CALL:  # The function body ended without a return
+                    self.environment = frames.pop()
+                    frames.pop()
+                    push(None)
+                elif kind == MEMOIZE:
+                    memo_cache.store(task[1], values[-1])
+                
+                # Statements
+                elif kind == 'ASSIGN':
+                    value = task[2]
+                    schedule((ASSIGN_VALUE, task[1]))
+                    schedule(value if isinstance(value, tuple) else (CONSTANT, value))
+                elif kind == ASSIGN_VALUE:
+                    self.environment.assign(task[1], pop())
+                elif kind == 'WHILE':
+                    condition = task[1]
+                    schedule((LOOP, task))
+                    schedule(condition if isinstance(condition, tuple) else (CONSTANT, condition))
+                elif kind == LOOP:
+                    if is_truthy(pop()):
+                        node = task[1]
+                        schedule(node)  # Test the condition again after the body
+                        tasks.extend(reversed(node[2]))
+                        if countdown is not None:
+                            countdown -= 1
+                            if not countdown:
+                                countdown = yield_every
+                                yield None
+                elif kind == 'IF':
+                    condition = task[1]
+                    schedule((BRANCH, task))
+                    schedule(condition if isinstance(condition, tuple) else (CONSTANT, condition))
+                elif kind == BRANCH:
+                    node = task[1]
+                    if is_truthy(pop()):
+                        tasks.extend(reversed(node[2]))
+                    elif len(node) > 3:  # Has else block
+                        tasks.extend(reversed(node[3]))
+                elif kind == 'PRINT':
+                    value = task[1]
+                    schedule(PRINT_TASK)
+                    schedule(value if isinstance(value, tuple) else (CONSTANT, value))
+                elif kind == PRINT_VALUE:
+                    print_value(pop())
+                elif kind == 'VAR_DECL':
+                    value = task[2]
+                    schedule((DEFINE, task[1]))
+                    schedule(value if isinstance(value, tuple) else (CONSTANT, value))
+                elif kind == DEFINE:
+                    self.environment.define(task[1], pop())
+                elif kind == 'RETURN':
+                    value = task[1] if len(task) > 1 else None
+                    function = None
+                    if frames and isinstance(value, tuple) and value[0] == 'CALL':
+                        function = self.lookup_function(value[1])
+                    if isinstance(function, dict):
+                        arguments = value[2]
+                        schedule((TAIL_CALL, function, len(arguments)))
+                        for argument in reversed(arguments):
+                            schedule(argument if isinstance(argument, tuple) else (CONSTANT, argument))
+                    else:
+                        schedule(RETURN_TASK)
+                        schedule(value if isinstance(value, tuple) else (CONSTANT, value))
+                elif kind == RETURN:
+                    if frames:
+                        self.environment = frames.pop()
+                        del tasks[frames.pop():]  # Leave the value as the call's result
+                    else:
+                        pop()  # Outside a function a return only evaluates its value
+                elif kind == 'FUNCTION':
+                    self.environment.define(task[1], declare_function(task[2], task[3], self.environment))
+                elif kind == 'BLOCK':
+                    tasks.extend(reversed(task[1]))
+                else:
+                    raise RuntimeError(f"Unknown node type: {kind}")
+        except BaseException:
+            self.environment = caller_environment
+            raise
+        
+        return values[-1] if values else None
     
     @staticmethod
     def is_truthy(value: Any) -> bool:
@@ -205,6 +493,366 @@ class Interpreter:
             return len(value) > 0
         return True
 
+BINARY_OPERATORS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '%': operator.mod,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge
+}
+
+def call_host(function: Callable[..., Any], arguments: List) -> Any:
+    """Call a host function from a compiled program, which cannot await."""
+    result = function(*arguments)
+    if inspect.isawaitable(result):
+        close = getattr(result, 'close', None)
+        if close is not None:
+            close()
+        raise RuntimeError("A host function returned an awaitable; use interpret_async")
+    return result
+
+class ClosureCompiler:
+    """Compiles AST nodes into nested Python closures.
+    
+    Every node is resolved to a callable once, so running a program only
+    calls closures instead of re-dispatching on node types at each visit.
+    Inside a function body, scope is the function's SlotTable and
+    variables compile to direct indexing of the call's Frame or of a frame
+    enclosing it, at the (depth, slot) the table resolves them to.
+    
+    Statement closures return None to continue, (value,) to return a value
+    from the current function, or (function, arguments) for a tail call,
+    which the calling closure runs in a loop instead of recursing.
+    
+    Closures call each other, so every call and nesting level uses Python
+    frames. nesting counts the blocks and expressions being compiled; past
+    MAX_COMPILED_NESTING an expression is left to the task stack, and a
+    call estimates its frames from the nesting of its site so that deep
+    recursion moves to the task stack before the Python stack runs out.
+    """
+    
+    def __init__(self, interpreter: Interpreter, scope: SlotTable = None):
+        self.interpreter = interpreter
+        self.scope = scope
+        self.nesting = 0
+    
+    def where(self, name: str) -> Union[tuple, None]:
+        """Return the (depth, slot) of a variable, or None for a global."""
+        if self.scope is None:
+            return None
+        return self.scope.lookup(name)
+    
+    def compile_block(self, statements: List) -> Callable[[], Any]:
+        """Compile a block of statements into a single callable."""
+        self.nesting += 1
+        try:
+            compiled = tuple(self.compile_statement(statement) for statement in statements)
+        finally:
+            self.nesting -= 1
+        if len(compiled) == 1:
+            return compiled[0]  # Statements follow the same protocol as blocks
+        
+        def block():
+            for statement in compiled:
+                result = statement()
+                if result is not None:
+                    return result
+        return block
+    
+    def compile_statement(self, node: tuple) -> Callable[[], Any]:
+        """Compile a single statement node."""
+        node_type = node[0]
+        
+        compilers = {
+            'PRINT': self.compile_print,
+            'VAR_DECL': self.compile_var_decl,
+            'ASSIGN': self.compile_assign,
+            'IF': self.compile_if,
+            'WHILE': self.compile_while,
+            'FUNCTION': self.compile_function,
+            'RETURN': self.compile_return,
+            'BLOCK': lambda node: self.compile_block(node[1])
+        }
+        
+        if node_type in compilers:
+            return compilers[node_type](node)
+        raise RuntimeError(f"Unknown node type: {node_type}")
+    
+    def compile_print(self, node: tuple) -> Callable[[], None]:
+        print_value = self.interpreter.output.print
+        value = self.compile_expression(node[1])
+        
+        def print_():
+            print_value(value())
+        return print_
+    
+    def compile_var_decl(self, node: tuple) -> Callable[[], None]:
+        interpreter, name = self.interpreter, node[1]
+        value = self.compile_expression(node[2])
+        where = self.where(name)
+        
+        if where is not None:
+            slot = where[1]  # Declarations are always in the function's own frame
+            
+            def var_decl_local():
+                interpreter.environment[slot] = value()
+            return var_decl_local
+        
+        def var_decl():
+            interpreter.environment.define(name, value())
+        return var_decl
+    
+    def compile_assign(self, node: tuple) -> Callable[[], None]:
+        interpreter, name = self.interpreter, node[1]
+        value = self.compile_expression(node[2])
+        where = self.where(name)
+        if where is None:
+            environment = interpreter.globals
+            
+            def assign():
+                environment.assign(name, value())
+            return assign
+        
+        depth, slot = where
+        if depth == 0:
+            def assign_local():
+                result = value()
+                frame = interpreter.environment
+                if frame[slot] is UNDEFINED:
+                    raise RuntimeError(f"Undefined variable '{name}'")
+                frame[slot] = result
+            return assign_local
+        
+        def assign_enclosing():
+            result = value()
+            frame = interpreter.environment.enclosing(depth)
+            if frame[slot] is UNDEFINED:
+                raise RuntimeError(f"Undefined variable '{name}'")
+            frame[slot] = result
+        return assign_enclosing
+    
+    def compile_if(self, node: tuple) -> Callable[[], Any]:
+        is_truthy = Interpreter.is_truthy
+        condition = self.compile_expression(node[1])
+        then_block = self.compile_block(node[2])
+        
+        if len(node) > 3:  # Has else block
+            else_block = self.compile_block(node[3])
+            
+            def if_else():
+                if is_truthy(condition()):
+                    return then_block()
+                return else_block()
+            return if_else
+        
+        def if_():
+            if is_truthy(condition()):
+                return then_block()
+        return if_
+    
+    def compile_while(self, node: tuple) -> Callable[[], Any]:
+        is_truthy = Interpreter.is_truthy
+        condition = self.compile_expression(node[1])
+        body = self.compile_block(node[2])
+        
+        def while_():
+            while is_truthy(condition()):
+                result = body()
+                if result is not None:
+                    return result
+        return while_
+    
+    def compile_function(self, node: tuple) -> Callable[[], None]:
+        interpreter = self.interpreter
+        name, params, body = node[1], node[2], node[3]
+        function = {'params': params, 'body': body, 'slots': resolve_function(params, body, self.scope)}
+        function['compiled'] = self.compile_function_body(function)
+        if self.scope is None:
+            function['scope'] = interpreter.globals
+            
+            def declare():
+                interpreter.environment.define(name, function)
+            return declare
+        
+        def declare_nested():
+            # Each declaration is a new function, closing over the current call's frame.
+            environment = interpreter.environment
+            environment.define(name, dict(function, scope=environment))
+        return declare_nested
+    
+    def compile_function_body(self, function: dict) -> Callable[[], Any]:
+        """Compile a function body against the function's slots."""
+        return ClosureCompiler(self.interpreter, function_slots(function)).compile_block(function['body'])
+    
+    def compile_return(self, node: tuple) -> Callable[[], Any]:
+        value = node[1] if len(node) > 1 else None
+        if self.scope is None:
+            # Outside a function a return only evaluates its value.
+            value = self.compile_expression(value)
+            
+            def evaluate():
+                value()
+            return evaluate
+        
+        if isinstance(value, tuple) and value[0] == 'CALL':
+            interpreter, callee = self.interpreter, value[1]
+            arguments = tuple(self.compile_expression(arg) for arg in value[2])
+            
+            def tail_call():
+                function = interpreter.lookup_function(callee)
+                return (function, [argument() for argument in arguments])
+            return tail_call
+        
+        value = self.compile_expression(value)
+        return lambda: (value(),)
+    
+    def compile_expression(self, expr: Union[tuple, str, float]) -> Callable[[], Any]:
+        """Compile an expression into a callable returning its value."""
+        if self.nesting >= MAX_COMPILED_NESTING:
+            evaluate = self.interpreter.evaluate_expression
+            return lambda: evaluate(expr)
+        self.nesting += 1
+        try:
+            return self.compile_operation(expr)
+        finally:
+            self.nesting -= 1
+    
+    def compile_operation(self, expr: Union[tuple, str, float]) -> Callable[[], Any]:
+        """Compile an expression node, compiling its operands with compile_expression."""
+        if not isinstance(expr, tuple):
+            return lambda: expr
+        
+        expr_type = expr[0]
+        
+        if expr_type == 'NUMBER':
+            value = float(expr[1])
+            return lambda: value
+        if expr_type == 'STRING':
+            value = sys.intern(expr[1][1:-1])  # Strip quotes
+            return lambda: value
+        if expr_type == 'IDENTIFIER':
+            interpreter, name = self.interpreter, expr[1]
+            where = self.where(name)
+            if where is None:
+                environment = interpreter.globals
+                return lambda: environment.get(name)
+            
+            depth, slot = where
+            if depth:
+                def load_enclosing():
+                    value = interpreter.environment.enclosing(depth)[slot]
+                    if value is UNDEFINED:
+                        raise RuntimeError(f"Undefined variable '{name}'")
+                    return value
+                return load_enclosing
+            
+            def load_local():
+                value = interpreter.environment[slot]
+                if value is UNDEFINED:
+                    raise RuntimeError(f"Undefined variable '{name}'")
+                return value
+            return load_local
+        if expr_type == 'BINARY':
+            return self.compile_binary(expr[1], expr[2], expr[3])
+        if expr_type == 'UNARY':
+            return self.compile_unary(expr[1], expr[2])
+        if expr_type == 'CALL':
+            return self.compile_call(expr[1], expr[2])
+        
+        raise RuntimeError(f"Unknown expression type: {expr_type}")
+    
+    def compile_binary(self, left: Any, operator: str, right: Any) -> Callable[[], Any]:
+        # Left-nested chains such as a + b + c + ... are compiled into one
+        # loop, so long generated chains do not exhaust the Python stack.
+        operations = [(operator, right)]
+        while isinstance(left, tuple) and left[0] == 'BINARY':
+            operations.append((left[2], left[3]))
+            left = left[1]
+        for operator, _ in operations:
+            if operator not in BINARY_OPERATORS:
+                raise RuntimeError(f"Unknown operator: {operator}")
+        
+        first = self.compile_expression(left)
+        steps = tuple((BINARY_OPERATORS[operator], self.compile_expression(right))
+                      for operator, right in reversed(operations))
+        if len(steps) == 1:
+            function, right = steps[0]
+            return lambda: function(first(), right())
+        
+        def chain():
+            value = first()
+            for function, right in steps:
+                value = function(value, right())
+            return value
+        return chain
+    
+    def compile_unary(self, operator: str, operand: Any) -> Callable[[], Any]:
+        operand = self.compile_expression(operand)
+        if operator == '-':
+            return lambda: -float(operand())
+        if operator == '!':
+            is_truthy = Interpreter.is_truthy
+            return lambda: not is_truthy(operand())
+        raise RuntimeError(f"Unknown unary operator: {operator}")
+    
+    def compile_call(self, callee: str, arguments: List) -> Callable[[], Any]:
+        interpreter = self.interpreter
+        frames = 2 * self.nesting + 3  # At most two frames per level, and the call itself
+        arguments = tuple(self.compile_expression(arg) for arg in arguments)
+        
+        def call():
+            function = interpreter.lookup_function(callee)
+            values = [argument() for argument in arguments]
+            if interpreter.compiled_frames + frames > MAX_COMPILED_FRAMES:
+                return interpreter.call_on_stack(function, values)
+            key = interpreter.memo_key(function, values) if isinstance(function, dict) else None
+            if key is None:
+                return invoke(function, values)
+            result = interpreter.memo.lookup(key)
+            if result is memo.MISSING:
+                result = invoke(function, values)
+                interpreter.memo.store(key, result)
+            return result
+        
+        def invoke(function, values):
+            previous_env = interpreter.environment
+            interpreter.compiled_frames += frames
+            try:
+                while True:  # Tail calls run here instead of nesting
+                    if not isinstance(function, dict):
+                        return call_host(function, values)
+                    body = function.get('compiled')
+                    if body is None:  # Declared by the tree-walking interpreter
+                        body = function['compiled'] = self.compile_function_body(function)
+                    table = function['slots']  # Set when the body was compiled
+                    if table.names:
+                        environment = Frame(table.template)
+                        environment.table = table
+                        environment.parent = function.get('scope', interpreter.globals)
+                        slots = table.slots
+                        for param, value in zip(function['params'], values):
+                            environment[slots[param]] = value
+                    else:  # Nothing to store, so the body runs in the scope it was declared in
+                        environment = function.get('scope', interpreter.globals)
+                    
+                    interpreter.environment = environment
+                    result = body()
+                    if result is None:
+                        return None
+                    if len(result) == 1:
+                        return result[0]
+                    function, values = result
+            finally:
+                interpreter.environment = previous_env
+                interpreter.compiled_frames -= frames
+        return call
+
 if __name__ == '__main__':
     # Sample usage
     code = '''
@@ -0,0 +1,382 @@
+# jit.py
+#
+# A tracing tier for the while loops of runtime.Runtime.
+#
+# Runtime counts the back-edges of every while loop it interprets in the
+# loop's Trace. Once a loop has gone round its threshold, HOT_LOOP times by
+# default, the trace is recorded: the types its variables hold at that point
+# are observed, and the loop is compiled with compile() into a Python
+# function specialized for them. Like the programs of transpiler.py, the
+# function keeps Velox variables in Python locals, loaded from the runtime's
+# variables on entry and written back when it returns, and runs the whole
+# loop there.
+#
+# Each variable is given the set of types it may hold in the loop, starting
+# from the observed one and widened until it covers every value assigned to
+# it. Arithmetic on operands that can only be numbers is then Python's own
+# operator, and '+' on text calls values.concatenate directly; other
+# operators call the generic ones in values.py. What indexing yields cannot
+# be known in advance, so an assignment from an index is followed by a guard
+# checking that the value still has the observed type.
+#
+# Guards fall back to the interpreter. The function first checks that the
+# variables hold the types it was compiled for, and returns at once if not.
+# A guard failing in the loop returns after writing the variables back, and
+# the interpreter finishes the iteration from the next statement before it
+# goes on with the loop. Either way the trace is dropped and the loop counted
+# again, to be recorded for the new types; a loop whose traces fail
+# MAX_TRACES times, or that cannot be compiled, stays interpreted.
+#
+# Runtime subclasses that observe every condition, statement or assignment
+# keep interpreting their loops, so they still see each one.
+#
+# The tier is off unless a Runtime is given a jit_threshold, so the
+# reference engine stays a plain interpreter; shell.py and batch.py turn it
+# on with HOT_LOOP.
+
+import builtins
+import collections
+import functools
+import math
+import sys
+import types
+
+import specialize
+import values
+
+# Back-edges after which a loop is recorded and compiled.
+HOT_LOOP = 100
+
+# Traces compiled for a loop after which it stays interpreted.
+MAX_TRACES = 4
+
+PYTHON_FUNCTION_NAME = '_velox_loop'
+
+# What an assigned variable that is not bound yet is loaded as.
+ABSENT = object()
+
+NUMBERS = frozenset(values.NUMBER_TYPES)
+TEXT = frozenset(values.TEXT_TYPES)
+
+# The types guards check, with the names generated code knows them by.
+TYPE_NAMES = {int: 'int', float: 'float', str: 'str', values.Rope: '_Rope', values.Array: '_Array'}
+
+# The generic operator for each binary operator, in generated code.
+OPERATOR_NAMES = {'+': '_add', '-': '_sub', '*': '_mul', '/': '_div', '%': '_mod'}
+
+GLOBALS = {
+    '__builtins__': builtins,
+    '_absent': ABSENT,
+    '_Rope': values.Rope,
+    '_Array': values.Array,
+    '_concat': values.concatenate,
+    '_add': values.add,
+    '_sub': values.subtract,
+    '_mul': values.multiply,
+    '_div': values.divide,
+    '_mod': values.modulo,
+    '_array': values.make_array,
+    '_index': values.index,
+    '_len': values.length,
+}
+
+# Exit 0 is the guard on entry, which returns before the loop starts.
+ENTRY_EXIT = ('entered with other types', ())
+
+
+class Unsupported(Exception):
+    """Raised for a loop the compiler cannot translate."""
+
+
+class Trace:
+    """The JIT state of one while loop of a runtime.
+
+    countdown is the number of back-edges left before the loop is recorded,
+    negative once it stays interpreted. function is the compiled trace or
+    None; it returns None when the loop ends, or the index in exits of the
+    guard that failed. Each exit holds a description of the guard and the
+    statements the interpreter continues with, as (statements, loop) pairs
+    from the innermost block out: the rest of the block, and the nested
+    loop, as (condition, body), to go on with after it.
+    """
+    __slots__ = ('condition', 'body', 'threshold', 'countdown', 'function', 'exits', 'types',
+                 'traces', 'entries', 'failures', 'reason')
+
+    def __init__(self, condition, body, threshold=HOT_LOOP):
+        self.condition = condition
+        self.body = body  # Keeps the body alive, so its id() stays unique
+        self.threshold = threshold
+        self.countdown = threshold
+        self.function = None
+        self.exits = ()
+        self.types = {}
+        self.traces = 0
+        self.entries = 0
+        self.failures = collections.Counter()
+        self.reason = None
+
+    def record(self, variables):
+        """Compile a trace specialized for the types the loop's variables hold now."""
+        compiler = LoopCompiler(variables)
+        try:
+            source = compiler.compile(self.condition, self.body)
+        except Unsupported as error:
+            self.reason = str(error)
+            self.countdown = -1
+            return
+        self.function = types.FunctionType(compile_source(source), GLOBALS)
+        self.exits = compiler.exits
+        self.types = compiler.types
+        self.traces += 1
+
+    def fail(self, exit):
+        """Drop the trace after a guard failed and return the interpreter's continuation."""
+        description, continuation = self.exits[exit]
+        self.failures[description] += 1
+        self.function = None
+        self.countdown = self.threshold if self.traces < MAX_TRACES else -1
+        return continuation
+
+    @property
+    def state(self):
+        """'compiled' with the types, 'interpreted', or why the loop stays interpreted."""
+        if self.function is not None:
+            specialized = ', '.join(f"{name}: {type_names(kinds)}" for name, kinds in self.types.items())
+            return f"compiled for {specialized or 'no variables'}"
+        if self.reason is not None:
+            return f"not compiled: {self.reason}"
+        if self.countdown < 0:
+            return f"gave up after {self.traces} traces"
+        return 'interpreted'
+
+
+def type_names(kinds):
+    """A set of types as text, 'any' for None."""
+    if kinds is None:
+        return 'any'
+    return ' | '.join(sorted(kind.__name__ for kind in kinds))
+
+
+class LoopCompiler:
+    """Translates a while loop into a function specialized for its variables' types."""
+
+    def __init__(self, variables):
+        self.variables = variables
+        self.types = {}  # Variable name -> frozenset of the types it can hold, or None for any
+        self.assigned = {}
+        self.exits = [ENTRY_EXIT]
+        self.widened = False
+
+    def compile(self, condition, body):
+        """Return the source of the loop's function."""
+        lines = self.emit_loop(condition, body)
+        while self.widened:
+            self.assigned = {}
+            self.exits = [ENTRY_EXIT]
+            self.widened = False
+            lines = self.emit_loop(condition, body)
+        for name in self.assigned:
+            if self.variables.get(name, ABSENT) is ABSENT:
+                raise Unsupported(f"assigns {name} before it is bound")
+
+        head = [f"def {PYTHON_FUNCTION_NAME}(_variables, _print):"]
+        guards = []
+        for name, kinds in self.types.items():
+            default = '_absent' if name in self.assigned else repr(name)
+            head.append(f"    v_{name} = _variables.get({name!r}, {default})")
+            if kinds is not None:
+                guards.append(self.type_test(name, kinds))
+            elif name in self.assigned:
+                guards.append(f"v_{name} is _absent")
+        if guards:
+            head.append(f"    if {' or '.join(guards)}:")
+            head.append("        return 0")
+        if not self.assigned:
+            return '\n'.join(head + [line[4:] for line in lines]) + '\n'
+        head.append("    try:")
+        head.extend(lines)
+        head.append("    finally:")
+        head.extend(f"        _variables[{name!r}] = v_{name}" for name in self.assigned)
+        return '\n'.join(head) + '\n'
+
+    def emit_loop(self, condition, body):
+        lines = [f"        while {self.condition(condition)}:"]
+        self.emit_block(lines, body, 3, None, ())
+        return lines
+
+    def emit_block(self, lines, statements, depth, loop, outer):
+        """Append the translation of a block.
+
+        loop is the nested loop whose body the block is, or None, and outer
+        the continuation of the blocks enclosing it.
+        """
+        start = len(lines)
+        for position, statement in enumerate(statements):
+            if statement is None:
+                if loop is not None:
+                    raise Unsupported("empty statement in a loop body")
+                continue
+            here = ((statements[position + 1:], loop),) + outer
+            self.emit_statement(lines, statement, depth, here)
+        if len(lines) == start:
+            lines.append('    ' * depth + 'pass')
+
+    def emit_statement(self, lines, statement, depth, continuation):
+        """Append the translation of a single statement."""
+        indent = '    ' * depth
+        statement_type = statement[0]
+
+        if statement_type == 'print':
+            lines.append(f"{indent}_print({self.expression(statement[1])[0]})")
+        elif statement_type == 'assign':
+            name = statement[1]
+            value, kinds = self.expression(statement[2])
+            lines.append(f"{indent}{self.variable(name, store=True)[0]} = {value}")
+            expected = self.types[name]
+            if kinds is None and expected is not None:
+                lines.append(f"{indent}if {self.type_test(name, expected)}:")
+                lines.append(f"{indent}    return {len(self.exits)}")
+                self.exits.append((f"{name} is not {type_names(expected)}", continuation))
+            elif expected is not None and kinds is not None and not kinds <= expected:
+                self.types[name] = expected | kinds
+                self.widened = True
+        elif statement_type == 'if':
+            lines.append(f"{indent}if {self.condition(statement[1])}:")
+            self.emit_block(lines, statement[2], depth + 1, None, continuation)
+        elif statement_type == 'while':
+            lines.append(f"{indent}while {self.condition(statement[1])}:")
+            self.emit_block(lines, statement[2], depth + 1, (statement[1], statement[2]), continuation)
+        else:
+            raise Unsupported(f"statement type {statement_type!r}")
+
+    def type_test(self, name, kinds):
+        """A test that is true when a variable's value is not one of kinds."""
+        if len(kinds) == 1:
+            return f"type(v_{name}) is not {TYPE_NAMES[next(iter(kinds))]}"
+        return f"type(v_{name}) not in ({', '.join(sorted(TYPE_NAMES[kind] for kind in kinds))})"
+
+    def condition(self, condition):
+        """Translate a comparison condition."""
+        op, left, right = condition
+        if op not in specialize.COMPARISONS:
+            raise Unsupported(f"comparison {op!r}")
+        return f"{self.expression(left)[0]} {op} {self.expression(right)[0]}"
+
+    def expression(self, expr):
+        """Translate an expression into its source and the set of types it can have, or None."""
+        if isinstance(expr, str):
+            if expr.startswith('"') and expr.endswith('"'):
+                return repr(expr[1:-1]), frozenset((str,))
+            return self.variable(expr)
+        if not isinstance(expr, tuple):
+            return self.constant(expr)
+
+        node_type = expr[0]
+        if node_type in ('num', 'str'):
+            return self.constant(expr[1])
+        if node_type == 'var':
+            return self.variable(expr[1])
+        if node_type == 'array':
+            elements = ', '.join(self.expression(element)[0] for element in expr[1])
+            return f"_array([{elements}])", frozenset((values.Array,))
+        if node_type == 'index':
+            return f"_index({self.expression(expr[1])[0]}, {self.expression(expr[2])[0]})", None
+        if node_type == 'len':
+            return f"_len({self.expression(expr[1])[0]})", frozenset((int,))
+
+        operator, left, right = expr
+        if operator not in OPERATOR_NAMES:
+            raise Unsupported(f"operator {operator!r}")
+        left, left_kinds = self.expression(left)
+        right, right_kinds = self.expression(right)
+        if left_kinds is not None and right_kinds is not None:
+            if left_kinds <= NUMBERS and right_kinds <= NUMBERS:
+                if operator == '/':
+                    kinds = frozenset((float,))
+                else:
+                    kinds = frozenset(int if x is int and y is int else float
+                                      for x in left_kinds for y in right_kinds)
+                return f"({left} {operator} {right})", kinds
+            if (operator == '+' and (left_kinds <= TEXT or right_kinds <= TEXT)
+                    and left_kinds | right_kinds <= TEXT | NUMBERS):
+                return f"_concat({left}, {right})", TEXT
+        return f"{OPERATOR_NAMES[operator]}({left}, {right})", None
+
+    def constant(self, value):
+        """Translate a literal value."""
+        if type(value) is str:
+            return repr(value), frozenset((str,))
+        if type(value) in values.NUMBER_TYPES:
+            literal = repr(value) if type(value) is int or math.isfinite(value) else f"float({str(value)!r})"
+            return literal, frozenset((type(value),))
+        raise Unsupported(f"literal of type {type(value).__name__}")
+
+    def variable(self, name, store=False):
+        """Translate a variable reference, observing its type on first use."""
+        if name not in self.types:
+            value = self.variables.get(name, name)  # Unbound names evaluate to themselves
+            self.types[name] = frozenset((type(value),)) if type(value) in TYPE_NAMES else None
+        if store:
+            self.assigned[name] = True
+        return f"v_{name}", self.types[name]
+
+
+@functools.lru_cache(maxsize=256)
+def compile_source(source):
+    """Compile the source of a loop's function into its code object."""
+    namespace = {}
+    exec(compile(source, '<velox jit>', 'exec'), namespace)
+    return namespace[PYTHON_FUNCTION_NAME].__code__
+
+
+# Totals over a set of traces.
+Stats = collections.namedtuple('Stats', 'loops compiled traces entries failures')
+
+
+def stats(traces):
+    """Total the counters of a collection of Traces."""
+    traces = list(traces)
+    return Stats(len(traces), sum(trace.function is not None for trace in traces),
+                 sum(trace.traces for trace in traces), sum(trace.entries for trace in traces),
+                 sum(sum(trace.failures.values()) for trace in traces))
+
+
+def report(traces, top=10, file=None):
+    """Print the compiled traces and guard failures of a set of loops."""
+    file = file if file is not None else sys.stderr
+    traces = list(traces)
+    total = stats(traces)
+    print(f"{total.loops} loops, {total.traces} traces compiled, {total.entries} compiled runs, "
+          f"{total.failures} guard failures", file=file)
+    recorded = [trace for trace in traces if trace.traces or trace.reason is not None]
+    for trace in sorted(recorded, key=lambda trace: trace.entries, reverse=True)[:top]:
+        print(f"  {trace.traces:>4} traces {trace.entries:>8} runs  while ({describe(trace.condition)}): "
+              f"{trace.state}", file=file)
+        for description, count in trace.failures.most_common():
+            print(f"  {count:>13} guard failures: {description}", file=file)
+
+
+def describe(expr):
+    """A condition or expression as Velox source, for reports."""
+    if isinstance(expr, tuple):
+        node_type = expr[0]
+        if node_type in ('num', 'var'):
+            return str(expr[1])
+        if node_type == 'str':
+            return f'"{expr[1]}"'
+        if node_type == 'array':
+            return f"[{', '.join(describe(element) for element in expr[1])}]"
+        if node_type == 'index':
+            return f"{describe(expr[1])}[{describe(expr[2])}]"
+        if node_type == 'len':
+            return f"len({describe(expr[1])})"
+        operator, left, right = expr
+        return f"{operand(left)} {operator} {operand(right)}"
+    return str(expr)
+
+
+def operand(expr):
+    """An operand of a binary operator as Velox source, in parentheses if it is one too."""
+    if isinstance(expr, tuple) and expr[0] in OPERATOR_NAMES:
+        return f"({describe(expr)})"
+    return describe(expr)
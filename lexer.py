@@ -2,51 +2,94 @@
 
 import re
 
+# Token patterns in the order they are tried. Frequent tokens come first and
+# two-character operators come before their one-character prefixes. A
+# token's kind is its position in this list, starting at 1; kind 0 is EOF.
 TOKEN_TYPES = [
-    ("LESS", r'<'),
-    ("GREATER", r'>'),
+    ("IDENTIFIER", r'[a-zA-Z_]\w*'),
+    ("NUMBER", r'\d+(?:\.\d+)?'),
     ("LESSEQUAL", r'<='),
     ("GREATEREQUAL", r'>='),
-    ("NUMBER", r'\d+(\.\d+)?'),  
-    ("STRING", r'"(.*?)"'),      
-    ("IDENTIFIER", r'[a-zA-Z_]\w*'),  
-    ("PLUS", r'\+'),             
-    ("MINUS", r'-'),             
-    ("TIMES", r'\*'),            
-    ("DIVIDE", r'/'),            
-    ("EQUAL", r'='),             
-    ("LPAREN", r'\('),           
-    ("RPAREN", r'\)'),           
-    ("LBRACE", r'{'),            
-    ("RBRACE", r'}'),            
-    ("SEMICOLON", r';'),         
-    ("NEWLINE", r'\n'),          
-    ("WHITESPACE", r'\s+'),      
+    ("EQEQUAL", r'=='),
+    ("NOTEQUAL", r'!='),
+    ("SEMICOLON", r';'),
+    ("EQUAL", r'='),
+    ("PLUS", r'\+'),
+    ("LPAREN", r'\('),
+    ("RPAREN", r'\)'),
+    ("LBRACE", r'{'),
+    ("RBRACE", r'}'),
+    ("STRING", r'"[^"\n]*"'),
+    ("MINUS", r'-'),
+    ("TIMES", r'\*'),
+    ("DIVIDE", r'/'),
+    ("LESS", r'<'),
+    ("GREATER", r'>'),
+    ("LBRACKET", r'\['),
+    ("RBRACKET", r'\]'),
+    ("COMMA", r','),
+    ("PERCENT", r'%'),
 ]
 
-TOKEN_REGEX = '|'.join(f'(?P<{name}>{pattern})' for name, pattern in TOKEN_TYPES)
+KIND_NAMES = ['EOF'] + [name for name, pattern in TOKEN_TYPES]
+KINDS = {name: kind for kind, name in enumerate(KIND_NAMES)}
+
+(EOF, IDENTIFIER, NUMBER, LESSEQUAL, GREATEREQUAL, EQEQUAL, NOTEQUAL, SEMICOLON,
+ EQUAL, PLUS, LPAREN, RPAREN, LBRACE, RBRACE, STRING, MINUS, TIMES, DIVIDE,
+ LESS, GREATER, LBRACKET, RBRACKET, COMMA, PERCENT) = range(len(KIND_NAMES))
+
+# Leading whitespace is consumed as part of each match, so it never produces
+# an object of its own. Every position matches, which lets the stream use
+# finditer: the last two alternatives match the end of the source and any
+# character that cannot start a token.
+END_OF_SOURCE = len(TOKEN_TYPES) + 1
+ILLEGAL = END_OF_SOURCE + 1
+TOKEN_REGEX = r'\s*(?:' + '|'.join(f'({pattern})' for name, pattern in TOKEN_TYPES) + r'|(\Z)|(.))'
 token_re = re.compile(TOKEN_REGEX)
 
+# Unbound methods avoid creating a bound method object per call.
+_match_start = re.Match.start
+_match_end = re.Match.end
+
+class LexerError(SyntaxError):
+    """Raised for characters that cannot start a token."""
+
 class Lexer:
     def __init__(self, source):
         self.source = source
         self.position = 0
 
+    def stream(self):
+        """Yield tokens lazily as (kind, start, end) offsets into the source."""
+        source = self.source
+        end_of_source = END_OF_SOURCE
+        start, end = _match_start, _match_end
+        for token in token_re.finditer(source, self.position):
+            kind = token.lastindex
+            if kind >= end_of_source:
+                if kind == ILLEGAL:
+                    raise LexerError(f'Illegal character: {source[start(token, kind)]}')
+                return
+            yield (kind, start(token, kind), end(token))
+
     def tokenize(self):
-        tokens = []
-        while self.position < len(self.source):
-            match = token_re.match(self.source, self.position)
-            if not match:
-                raise SyntaxError(f'Illegal character: {self.source[self.position]}')
-
-            type_ = match.lastgroup
-            value = match.group(type_)
-            if type_ == 'WHITESPACE':
-                pass  
-            elif type_ == 'NEWLINE':
-                tokens.append(('NEWLINE', None))  
-            else:
-                tokens.append((type_, value))
-
-            self.position = match.end()
-        return tokens
+        """Return all tokens as a list of (type name, text) pairs."""
+        source = self.source
+        return [(KIND_NAMES[kind], source[start:end]) for kind, start, end in self.stream()]
+
+def from_pairs(pairs):
+    """Convert (type name, text) pairs into an offset token list and source.
+
+    Supports callers that build token lists by hand rather than lexing
+    source text. Pairs without text, such as NEWLINE, are dropped.
+    """
+    pieces = []
+    tokens = []
+    position = 0
+    for name, value in pairs:
+        if value is None:
+            continue
+        tokens.append((KINDS[name], position, position + len(value)))
+        pieces.append(value)
+        position += len(value) + 1
+    return tokens, ' '.join(pieces)
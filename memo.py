@@ -0,0 +1,235 @@
+# memo.py
+#
+# Memoization of pure interpreter.Interpreter functions.
+#
+# A function that reads and assigns nothing but its own parameters and
+# locals, prints nothing and only calls pure functions returns the same
+# value whenever it is called with the same arguments, and the interpreter
+# can keep that value instead of running the body again. This turns recursive helpers
+# such as Fibonacci, which call themselves with the same arguments an
+# exponential number of times, into a linear number of calls.
+#
+# analyze() decides whether a function is pure. Calls name their callee, so
+# a function's purity depends on what the global names it calls are bound
+# to; the resulting Purity records those bindings and is analyzed again
+# once any of them changes. Calls to names of the function or the functions
+# enclosing it, which can hold any function passed in, and calls to host
+# functions make a function impure.
+#
+# Results are kept in an LRUCache holding at most maxsize calls, keyed on
+# the function's Purity and the types and values of the arguments. A call
+# that raises is not cached, nor one whose arguments cannot be hashed.
+#
+# Caching costs a little on every call, which is wasted on functions that
+# are never called twice with the same arguments, such as a step function
+# called from a counted loop. Once GIVE_UP results of a function in a row
+# were evicted without ever being used, its calls are no longer cached.
+
+import collections
+import math
+
+import resolver
+
+DEFAULT_SIZE = 4096
+
+# Evicted results in a row, never used, after which a function is no longer
+# memoized.
+GIVE_UP = 1024
+
+# Returned by LRUCache.lookup for a key it does not hold, since None is a
+# result like any other.
+MISSING = object()
+
+# The counters of an LRUCache.
+Stats = collections.namedtuple('Stats', 'hits misses evictions size maxsize')
+
+
+class Purity:
+    """Whether a function is pure, given the functions its global callees are bound to.
+
+    dependencies pairs the global names reached from the function with what
+    they were bound to when it was analyzed, None for names that were not
+    bound yet. wasted counts the function's results evicted from an
+    LRUCache in a row without being used, and memoized is whether its
+    calls are cached: when it is pure, until wasted reaches GIVE_UP.
+    """
+    __slots__ = ('dependencies', 'pure', 'wasted', 'memoized')
+
+    def __init__(self, dependencies, pure):
+        self.dependencies = dependencies
+        self.pure = pure
+        self.wasted = 0
+        self.memoized = pure
+
+    def current(self, variables):
+        """Whether the global names it depends on are still bound the same way."""
+        for name, callee in self.dependencies:
+            if variables.get(name) is not callee:
+                return False
+        return True
+
+
+def analyze(function, variables):
+    """Return the Purity of an interpreter function under the given globals."""
+    dependencies = {}
+    pending = [function]
+    seen = set()
+    while pending:
+        current = pending.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        callees = called_names(current)
+        if callees is None:
+            return Purity(tuple(dependencies.items()), False)
+        for name in callees:
+            callee = dependencies[name] = variables.get(name)
+            if not (isinstance(callee, dict) and 'params' in callee):
+                return Purity(tuple(dependencies.items()), False)  # A host function, or not a function yet
+            pending.append(callee)
+    return Purity(tuple(dependencies.items()), True)
+
+
+def called_names(function):
+    """Return the global names a function's body calls, or None if the body itself is impure."""
+    calls = function.get('calls', MISSING)
+    if calls is MISSING:
+        calls = function['calls'] = _block_calls(function['body'], _function_slots(function), set())
+    return calls
+
+
+def _function_slots(function):
+    table = function.get('slots')
+    if table is None:
+        table = resolver.resolve_function(function['params'], function['body'])
+    return table
+
+
+def _block_calls(statements, table, calls):
+    for statement in statements:
+        statement_type = statement[0]
+        if statement_type == 'PRINT':
+            return None
+        if statement_type in ('VAR_DECL', 'ASSIGN'):
+            if statement[1] not in table.slots:
+                return None
+            expressions, blocks = [statement[2]], []
+        elif statement_type in ('IF', 'WHILE'):
+            expressions, blocks = [statement[1]], statement[2:]
+        elif statement_type == 'RETURN':
+            expressions, blocks = statement[1:], []
+        elif statement_type == 'BLOCK':
+            expressions, blocks = [], [statement[1]]
+        elif statement_type == 'FUNCTION':
+            continue  # Only declares a local; calling it makes the body impure
+        else:
+            return None
+        for expr in expressions:
+            if _expression_calls(expr, table, calls) is None:
+                return None
+        for block in blocks:
+            if _block_calls(block, table, calls) is None:
+                return None
+    return calls
+
+
+def _expression_calls(expr, table, calls):
+    pending = [expr]
+    while pending:
+        expr = pending.pop()
+        if not isinstance(expr, tuple):
+            continue
+        expr_type = expr[0]
+        if expr_type == 'BINARY':
+            pending.append(expr[1])
+            pending.append(expr[3])
+        elif expr_type == 'UNARY':
+            pending.append(expr[2])
+        elif expr_type == 'CALL':
+            if table.lookup(expr[1]) is not None:
+                return None  # A variable of the function or an enclosing one
+            calls.add(expr[1])
+            pending.extend(expr[2])
+        elif expr_type == 'IDENTIFIER':
+            if expr[1] not in table.slots:
+                return None  # A variable of an enclosing scope
+        elif expr_type not in ('NUMBER', 'STRING'):
+            return None
+    return calls
+
+
+def call_key(purity, arguments):
+    """Return the cache key of a call to a pure function, or None if it has none.
+
+    Arguments other than numbers and strings are keyed with their type,
+    since True == 1.0. A negative zero equals 0.0 but prints differently, so
+    calls passing one are not cached, nor calls passing unhashable values
+    such as functions.
+    """
+    key = [purity]
+    for argument in arguments:
+        argument_type = type(argument)
+        if argument_type is float:
+            if argument == 0.0 and math.copysign(1.0, argument) < 0.0:
+                return None
+        elif argument_type is not str:
+            try:
+                hash(argument)
+            except TypeError:
+                return None
+            argument = (argument_type, argument)
+        key.append(argument)
+    return tuple(key)
+
+
+class LRUCache:
+    """Results of at most maxsize calls, evicting the least recently used.
+
+    Keys are call_key tuples. Each entry holds a result and whether it was
+    used, which is counted against the function's Purity when the entry is
+    evicted.
+    """
+    __slots__ = ('maxsize', 'entries', 'hits', 'misses', 'evictions')
+
+    def __init__(self, maxsize=DEFAULT_SIZE):
+        self.maxsize = maxsize
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, key):
+        """Return the result stored for key, or MISSING."""
+        entries = self.entries
+        entry = entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return MISSING
+        self.hits += 1
+        entry[1] = True
+        entries.move_to_end(key)
+        return entry[0]
+
+    def store(self, key, result):
+        """Store the result of a call that missed, evicting the least recently used if full."""
+        entries = self.entries
+        entries[key] = [result, False]
+        if len(entries) > self.maxsize:
+            evicted, (_, used) = entries.popitem(last=False)
+            self.evictions += 1
+            purity = evicted[0]
+            if used:
+                purity.wasted = 0
+            else:
+                purity.wasted += 1
+                if purity.wasted >= GIVE_UP:
+                    purity.memoized = False
+
+    def clear(self):
+        """Forget every entry and reset the counters."""
+        self.entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Return the cache's Stats."""
+        return Stats(self.hits, self.misses, self.evictions, len(self.entries), self.maxsize)
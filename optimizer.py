@@ -0,0 +1,468 @@
+# optimizer.py
+#
+# AST optimizer, run between parsing and execution.
+#
+# Level 1 folds constant arithmetic and concatenation of literals, propagates
+# constants assigned in straight-line code, drops if statements and while
+# loops whose condition is statically false and unwraps if statements whose
+# condition is statically true. Level 2 also hoists loop-invariant
+# expressions out of while loops: each is assigned to a temporary variable
+# before the loop, under a copy of the loop condition so nothing is evaluated
+# for a loop that never runs. Only expressions that cannot raise are hoisted,
+# so errors still happen where they would have. Temporaries are named so no
+# program can spell them (see resolver.is_temporary), and engines leave them
+# out of the variables a run ends with.
+#
+# Folding evaluates operations with the same functions the engines use, and
+# leaves any operation that raises unfolded, so the error still happens at
+# run time.
+
+import operator
+
+import values
+import velox
+from compiler import BINARY_OPERATORS, COMPARE_OPERATORS
+from interpreter import BINARY_OPERATORS as INTERPRETER_OPERATORS, Interpreter
+from vm import BINARY_FUNCTIONS, COMPARE_FUNCTIONS
+
+# Temporary variables holding hoisted expressions are named with a number
+# and this suffix.
+HOISTED_SUFFIX = '_hoisted'
+
+BINARY = dict(zip(BINARY_OPERATORS, BINARY_FUNCTIONS))
+COMPARE = dict(zip(COMPARE_OPERATORS, COMPARE_FUNCTIONS))
+
+# Errors an operation on constants may raise; folding gives up on them.
+FOLDING_ERRORS = (ArithmeticError, TypeError, ValueError)
+
+# The value of an expression that is not known statically.
+UNKNOWN = object()
+
+
+def optimize(ast, level=1):
+    """Optimize a parser.Parser AST at the given level; 0 returns it as is."""
+    return Optimizer(level).optimize(ast)
+
+
+def constant_value(expr):
+    """Return the value of a literal expression, or UNKNOWN."""
+    if isinstance(expr, tuple) and expr[0] in ('num', 'str'):
+        return expr[1]
+    return UNKNOWN
+
+
+def constant_node(value):
+    """Return a literal expression for a value."""
+    if isinstance(value, values.TEXT_TYPES):
+        return ('str', str(value))
+    return ('num', value)
+
+
+class Optimizer:
+    """Optimizes the tuple AST produced by parser.Parser."""
+
+    def __init__(self, level=1):
+        self.level = level
+
+    def optimize(self, ast):
+        """Return an optimized copy of a list of statements."""
+        if self.level <= 0:
+            return ast
+        self.hoisted = 0
+        return self.optimize_block(ast, {}, {})
+
+    def optimize_block(self, statements, constants, types):
+        """Optimize a sequence of statements."""
+        result = []
+        for statement in statements:
+            if statement is not None:
+                self.optimize_statement(result, statement, constants, types)
+        return result
+
+    def optimize_statement(self, result, statement, constants, types):
+        """Append the optimized form of a statement to result.
+
+        constants maps variables to their value and types maps them to the
+        type of their value, where known at this point of the program.
+        """
+        statement_type = statement[0]
+
+        if statement_type == 'assign':
+            name = statement[1]
+            value = self.fold(statement[2], constants)
+            self.forget((name,), constants, types)
+            if constant_value(value) is not UNKNOWN:
+                constants[name] = constant_value(value)
+            value_type = self.type_of(value, types)
+            if value_type is not None:
+                types[name] = value_type
+            result.append(('assign', name, value))
+        elif statement_type == 'print':
+            result.append(('print', self.fold(statement[1], constants)))
+        elif statement_type == 'if':
+            condition, value = self.fold_condition(statement[1], constants)
+            if value is True:
+                for child in statement[2]:
+                    if child is not None:
+                        self.optimize_statement(result, child, constants, types)
+            elif value is not False:
+                body = self.optimize_block(statement[2], dict(constants), dict(types))
+                self.forget(assigned_names(statement[2]), constants, types)
+                result.append(('if', condition, body))
+        elif statement_type == 'while':
+            assigned = assigned_names(statement[2])
+            self.forget(assigned, constants, types)
+            condition, value = self.fold_condition(statement[1], constants)
+            if value is False:
+                return
+            body = self.optimize_block(statement[2], dict(constants), dict(types))
+            if self.level >= 2 and value is UNKNOWN:
+                hoisted = []
+                body = [self.hoist_statement(child, assigned, types, hoisted) for child in body]
+                if hoisted:
+                    result.append(('if', condition, hoisted + [('while', condition, body)]))
+                    return
+            result.append(('while', condition, body))
+        else:
+            raise ValueError(f"Unknown statement type: {statement_type}")
+
+    @staticmethod
+    def forget(names, constants, types):
+        """Drop what is known about variables that may have been assigned."""
+        for name in names:
+            constants.pop(name, None)
+            types.pop(name, None)
+
+    def fold(self, expr, constants):
+        """Return an expression with its constant parts evaluated."""
+        if isinstance(expr, str):
+            if expr.startswith('"') and expr.endswith('"'):
+                return ('str', expr[1:-1])
+            expr = ('var', expr)
+
+        if not isinstance(expr, tuple):
+            return expr
+        node_type = expr[0]
+        if node_type in ('num', 'str'):
+            return expr
+        if node_type == 'var':
+            value = constants.get(expr[1], UNKNOWN)
+            return expr if value is UNKNOWN else constant_node(value)
+        if node_type == 'array':
+            return ('array', tuple(self.fold(element, constants) for element in expr[1]))
+        if node_type == 'len':
+            return ('len', self.fold(expr[1], constants))
+        if node_type == 'index':
+            return ('index', self.fold(expr[1], constants), self.fold(expr[2], constants))
+
+        operator, left, right = expr
+        left, right = self.fold(left, constants), self.fold(right, constants)
+        left_value, right_value = constant_value(left), constant_value(right)
+        if operator in BINARY and left_value is not UNKNOWN and right_value is not UNKNOWN:
+            try:
+                return constant_node(BINARY[operator](left_value, right_value))
+            except FOLDING_ERRORS:
+                pass  # Leave the error to happen at run time
+        return (operator, left, right)
+
+    def fold_condition(self, condition, constants):
+        """Fold a condition; return it with its value, if known statically."""
+        op, left, right = condition
+        left, right = self.fold(left, constants), self.fold(right, constants)
+        left_value, right_value = constant_value(left), constant_value(right)
+        if op in COMPARE and left_value is not UNKNOWN and right_value is not UNKNOWN:
+            try:
+                return (op, left, right), bool(COMPARE[op](left_value, right_value))
+            except FOLDING_ERRORS:
+                pass
+        return (op, left, right), UNKNOWN
+
+    def type_of(self, expr, types):
+        """Return the type of an expression's value, or None if unknown."""
+        if not isinstance(expr, tuple):
+            return None
+        node_type = expr[0]
+        if node_type == 'num':
+            return type(expr[1])
+        if node_type == 'str':
+            return str
+        if node_type == 'var':
+            return types.get(expr[1])
+        if node_type == 'array':
+            return values.Array
+        if node_type == 'len':
+            return int
+        if node_type == 'index':
+            return None
+        left, right = self.type_of(expr[1], types), self.type_of(expr[2], types)
+        if node_type == '+' and str in (left, right):
+            return str
+        if values.Array in (left, right):
+            return values.Array
+        if left is right is int:
+            return float if node_type == '/' else int
+        if left in values.NUMBER_TYPES and right in values.NUMBER_TYPES:
+            return float
+        if node_type != '+' and left is not None and right is not None:
+            return float  # Anything else raises or produces a float from float()
+        return None
+
+    def can_raise(self, expr, types):
+        """Whether evaluating an expression may raise an error."""
+        if not isinstance(expr, tuple):
+            return True
+        node_type = expr[0]
+        if node_type in ('num', 'str', 'var'):
+            return False
+        if node_type == 'array':
+            return any(self.can_raise(element, types) for element in expr[1])
+        if node_type in ('index', 'len'):
+            return True
+        operator, left, right = expr
+        if self.can_raise(left, types) or self.can_raise(right, types):
+            return True
+        left_type, right_type = self.type_of(left, types), self.type_of(right, types)
+        operand_types = {left_type, right_type}
+        if int in operand_types and operand_types != {int}:
+            # An int too large for a float overflows, and one with too many
+            # digits for str() raises ValueError when concatenated.
+            return True
+        if operator == '+':
+            # Concatenation and adding numbers cannot fail; adding arrays can.
+            return not operand_types <= {str, int, float}
+        if operator not in BINARY:
+            return True
+        # The other operators convert operands that are not numbers.
+        if left_type not in values.NUMBER_TYPES or right_type not in values.NUMBER_TYPES:
+            return True
+        if operator == '/' and left_type is int:
+            return True  # A quotient of ints too large for a float overflows
+        return operator in ('/', '%') and constant_value(right) in (0, UNKNOWN)
+
+    def hoist_statement(self, statement, assigned, types, hoisted):
+        """Hoist the loop-invariant expressions out of a loop body statement."""
+        statement_type = statement[0]
+        if statement_type == 'assign':
+            return ('assign', statement[1], self.hoist_expression(statement[2], assigned, types, hoisted))
+        if statement_type == 'print':
+            return ('print', self.hoist_expression(statement[1], assigned, types, hoisted))
+        return (statement_type, statement[1],
+                [self.hoist_statement(child, assigned, types, hoisted) for child in statement[2]])
+
+    def hoist_expression(self, expr, assigned, types, hoisted):
+        """Replace the largest invariant operations in expr with temporaries."""
+        if not isinstance(expr, tuple) or expr[0] in ('num', 'str', 'var'):
+            return expr
+        if not (read_names(expr) & assigned) and not self.can_raise(expr, types):
+            name = self.temporary()
+            hoisted.append(('assign', name, expr))
+            return ('var', name)
+        if expr[0] == 'array':
+            return ('array', tuple(self.hoist_expression(element, assigned, types, hoisted)
+                                   for element in expr[1]))
+        if expr[0] == 'len':
+            return ('len', self.hoist_expression(expr[1], assigned, types, hoisted))
+        operator, left, right = expr
+        return (operator, self.hoist_expression(left, assigned, types, hoisted),
+                self.hoist_expression(right, assigned, types, hoisted))
+
+    def temporary(self):
+        """Return a new name for a hoisted expression."""
+        self.hoisted += 1
+        return f"{self.hoisted - 1}{HOISTED_SUFFIX}"
+
+
+def assigned_names(statements):
+    """Return the set of variables assigned anywhere in statements."""
+    names = set()
+    for statement in statements:
+        if statement is None:
+            continue
+        if statement[0] == 'assign':
+            names.add(statement[1])
+        elif statement[0] in ('if', 'while'):
+            names |= assigned_names(statement[2])
+    return names
+
+
+def read_names(expr):
+    """Return the set of variables an expression reads."""
+    if not isinstance(expr, tuple):
+        return set()
+    if expr[0] == 'var':
+        return {expr[1]}
+    if expr[0] in ('num', 'str'):
+        return set()
+    if expr[0] == 'array':
+        return set().union(*(read_names(element) for element in expr[1]))
+    if expr[0] == 'len':
+        return read_names(expr[1])
+    return read_names(expr[1]) | read_names(expr[2])
+
+
+class DataclassOptimizer:
+    """Folds constant expressions in the dataclass AST from velox.Parser.
+
+    Programs are straight-line code, so every variable assigned a constant
+    keeps that value until it is assigned again.
+    """
+
+    OPERATORS = {
+        velox.TokenType.PLUS: operator.add,
+        velox.TokenType.MINUS: operator.sub,
+        velox.TokenType.MULTIPLY: operator.mul,
+        velox.TokenType.DIVIDE: operator.truediv,
+    }
+
+    def __init__(self, level=1):
+        self.level = level
+
+    def optimize(self, statements):
+        """Return an optimized copy of the program."""
+        if self.level <= 0:
+            return statements
+        constants = {}
+        result = []
+        for statement in statements:
+            if isinstance(statement, velox.AssignmentNode):
+                value = self.fold(statement.value, constants)
+                if isinstance(value, velox.NumberNode):
+                    constants[statement.name] = value.value
+                else:
+                    constants.pop(statement.name, None)
+                statement = velox.AssignmentNode(statement.name, value)
+            elif isinstance(statement, velox.PrintNode):
+                statement = velox.PrintNode(self.fold(statement.expression, constants))
+            result.append(statement)
+        return result
+
+    def fold(self, node, constants):
+        """Return an expression node with its constant parts evaluated."""
+        if isinstance(node, velox.VariableNode) and node.name in constants:
+            return velox.NumberNode(constants[node.name])
+        if not isinstance(node, velox.BinOpNode):
+            return node
+        left, right = self.fold(node.left, constants), self.fold(node.right, constants)
+        if (isinstance(left, velox.NumberNode) and isinstance(right, velox.NumberNode)
+                and node.operator in self.OPERATORS
+                and not (node.operator == velox.TokenType.DIVIDE and right.value == 0)):
+            return velox.NumberNode(self.OPERATORS[node.operator](left.value, right.value))
+        return velox.BinOpNode(left, node.operator, right)
+
+
+class InterpreterOptimizer:
+    """Folds constants and dead branches in interpreter.Interpreter's AST."""
+
+    def __init__(self, level=1):
+        self.level = level
+
+    def optimize(self, ast):
+        """Return an optimized copy of a list of statements."""
+        if self.level <= 0:
+            return ast
+        return self.optimize_block(ast)
+
+    def optimize_block(self, statements):
+        """Optimize a list of statements, dropping removed ones."""
+        result = []
+        for statement in statements:
+            statement = self.optimize_statement(statement)
+            if statement is not None:
+                result.append(statement)
+        return result
+
+    def optimize_statement(self, node):
+        """Return the optimized form of a statement, or None to remove it."""
+        node_type = node[0]
+        if node_type in ('PRINT', 'RETURN') and len(node) > 1:
+            return (node_type, self.fold(node[1]))
+        if node_type in ('VAR_DECL', 'ASSIGN'):
+            return (node_type, node[1], self.fold(node[2]))
+        if node_type == 'IF':
+            condition = self.fold(node[1])
+            value = self.constant_value(condition)
+            if value is UNKNOWN:
+                branches = tuple(self.optimize_block(branch) for branch in node[2:])
+                return ('IF', condition) + branches
+            # Blocks do not open a scope, so the taken branch runs as is.
+            if Interpreter.is_truthy(value):
+                return ('BLOCK', self.optimize_block(node[2]))
+            if len(node) > 3:
+                return ('BLOCK', self.optimize_block(node[3]))
+            return None
+        if node_type == 'WHILE':
+            condition = self.fold(node[1])
+            value = self.constant_value(condition)
+            if value is not UNKNOWN and not Interpreter.is_truthy(value):
+                return None
+            return ('WHILE', condition, self.optimize_block(node[2]))
+        if node_type == 'FUNCTION':
+            return ('FUNCTION', node[1], node[2], self.optimize_block(node[3]))
+        if node_type == 'BLOCK':
+            return ('BLOCK', self.optimize_block(node[1]))
+        return node
+
+    @staticmethod
+    def constant_value(expr):
+        """Return the value of a literal expression, or UNKNOWN."""
+        if isinstance(expr, (str, float, int)):
+            return expr
+        try:
+            if expr[0] == 'NUMBER':
+                return float(expr[1])
+            if expr[0] == 'STRING':
+                return expr[1][1:-1]
+        except ValueError:
+            pass
+        return UNKNOWN
+
+    @staticmethod
+    def constant_node(value):
+        """Return a literal expression for a value."""
+        if isinstance(value, float):
+            return ('NUMBER', repr(value))
+        if isinstance(value, str):
+            return ('STRING', f'"{value}"')
+        return value  # Booleans evaluate to themselves
+
+    def fold_binary(self, left, op, right):
+        """Return a binary operation on folded operands, folded if constant."""
+        left_value, right_value = self.constant_value(left), self.constant_value(right)
+        if op in INTERPRETER_OPERATORS and left_value is not UNKNOWN and right_value is not UNKNOWN:
+            try:
+                return self.constant_node(INTERPRETER_OPERATORS[op](left_value, right_value))
+            except FOLDING_ERRORS:
+                pass
+        return ('BINARY', left, op, right)
+
+    def fold(self, expr):
+        """Return an expression with its constant parts evaluated."""
+        if not isinstance(expr, tuple):
+            return expr
+        expr_type = expr[0]
+        if expr_type == 'BINARY':
+            # Walk left-nested chains iteratively, like the interpreter does,
+            # so long generated chains do not exhaust the Python stack.
+            operations = []
+            while isinstance(expr, tuple) and expr[0] == 'BINARY':
+                operations.append((expr[2], expr[3]))
+                expr = expr[1]
+            left = self.fold(expr)
+            for op, right in reversed(operations):
+                left = self.fold_binary(left, op, self.fold(right))
+            return left
+        if expr_type == 'UNARY':
+            op, operand = expr[1], self.fold(expr[2])
+            value = self.constant_value(operand)
+            if value is not UNKNOWN:
+                try:
+                    if op == '-':
+                        return self.constant_node(-float(value))
+                    if op == '!':
+                        return not Interpreter.is_truthy(value)
+                except FOLDING_ERRORS:
+                    pass
+            return ('UNARY', op, operand)
+        if expr_type == 'CALL':
+            return ('CALL', expr[1], [self.fold(argument) for argument in expr[2]])
+        return expr
@@ -0,0 +1,177 @@
+# output.py
+#
+# Output sinks for Velox print statements.
+#
+# Engines print through a sink rather than calling the built-in print for
+# every statement. A sink's print method behaves like print(value): it writes
+# str(value) and a newline. StreamSink collects output in memory and writes
+# it to a text stream in blocks, so a loop printing every iteration costs
+# one write per block instead of one per line. When the stream is a terminal
+# every line is written as soon as it is complete, as print would. Engines
+# flush their sink when a run ends, including when it ends with an error.
+#
+# CaptureSink keeps output in memory for tests and embedding, and AsyncSink
+# hands output to an asyncio stream writer.
+
+import abc
+import sys
+
+DEFAULT_BUFFER_SIZE = 8192
+
+
+class Sink(abc.ABC):
+    """Base class of output sinks; subclasses implement write."""
+
+    def print(self, value):
+        """Write a value and a newline, like the built-in print."""
+        self.write(f"{value}\n")
+
+    @abc.abstractmethod
+    def write(self, text):
+        """Write text as it is."""
+
+    def flush(self):
+        """Write out any buffered output."""
+
+    def close(self):
+        """Flush and release the sink."""
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class StreamSink(Sink):
+    """A block-buffered writer to a text stream.
+
+    Output is written once buffer_size characters are pending. Without a
+    stream, output goes to whatever sys.stdout is when a block is written,
+    so redirecting sys.stdout keeps working. line_buffered defaults to whether
+    the stream is a terminal; when set, every complete line is written out
+    immediately.
+    """
+
+    def __init__(self, stream=None, buffer_size=DEFAULT_BUFFER_SIZE, line_buffered=None):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.line_buffered = line_buffered
+        self.pieces = []
+        self.pending = 0
+        self._target = None
+        self._flush_lines = False
+        self.target()
+
+    def target(self):
+        """Return the stream output goes to, noting whether it is a terminal.
+
+        Checked on creation and on every flush, so a change of sys.stdout
+        takes effect from the next block.
+        """
+        stream = self.stream if self.stream is not None else sys.stdout
+        if stream is not self._target:
+            self._target = stream
+            if self.line_buffered is not None:
+                self._flush_lines = self.line_buffered
+            else:
+                isatty = getattr(stream, 'isatty', None)
+                self._flush_lines = bool(isatty and isatty())
+        return stream
+
+    def print(self, value):
+        """Write a value and a newline, like the built-in print."""
+        text = f"{value}\n"
+        self.pieces.append(text)
+        self.pending += len(text)
+        if self.pending >= self.buffer_size or self._flush_lines:
+            self.flush()
+
+    def write(self, text):
+        self.pieces.append(text)
+        self.pending += len(text)
+        if self.pending >= self.buffer_size or (self._flush_lines and '\n' in text):
+            self.flush()
+
+    def flush(self):
+        stream = self.target()
+        if self.pieces:
+            text = ''.join(self.pieces)
+            self.pieces.clear()
+            self.pending = 0
+            stream.write(text)
+        stream.flush()
+
+
+class CaptureSink(Sink):
+    """Accumulates output in memory as UTF-8.
+
+    Output is appended to a single bytearray; getbuffer returns a
+    memoryview of it, so reading captured output does not copy it.
+    """
+
+    def __init__(self, encoding='utf-8'):
+        self.encoding = encoding
+        self.buffer = bytearray()
+
+    def print(self, value):
+        """Write a value and a newline, like the built-in print."""
+        self.buffer += f"{value}\n".encode(self.encoding)
+
+    def write(self, text):
+        self.buffer += text.encode(self.encoding)
+
+    def getbuffer(self):
+        """Return a view of the captured bytes.
+
+        The view must be released before more output is written, since a
+        bytearray with exported views cannot grow.
+        """
+        return memoryview(self.buffer)
+
+    def getvalue(self):
+        """Return the captured output as a string."""
+        return self.buffer.decode(self.encoding)
+
+    def clear(self):
+        """Discard the captured output."""
+        del self.buffer[:]
+
+
+class AsyncSink(Sink):
+    """Buffers output for an asyncio.StreamWriter.
+
+    Printing never blocks the event loop: buffered output is handed to the
+    writer's transport once buffer_size characters are pending, and drain
+    flushes the sink and waits for the writer's flow control.
+    """
+
+    def __init__(self, writer, buffer_size=DEFAULT_BUFFER_SIZE, encoding='utf-8'):
+        self.writer = writer
+        self.buffer_size = buffer_size
+        self.encoding = encoding
+        self.pieces = []
+        self.pending = 0
+
+    def write(self, text):
+        self.pieces.append(text)
+        self.pending += len(text)
+        if self.pending >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.pieces:
+            data = ''.join(self.pieces).encode(self.encoding)
+            self.pieces.clear()
+            self.pending = 0
+            self.writer.write(data)
+
+    async def drain(self):
+        """Flush the sink and wait until the writer can take more output."""
+        self.flush()
+        await self.writer.drain()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
@@ -1,124 +1,241 @@
+import bisect
+import re
+import sys
+
+import lexer
+from lexer import (
+    EOF, IDENTIFIER, NUMBER, STRING, PLUS, MINUS, TIMES, DIVIDE, PERCENT,
+    EQUAL, LPAREN, RPAREN, LBRACE, RBRACE, LBRACKET, RBRACKET, COMMA,
+    SEMICOLON, LESS, GREATER, LESSEQUAL, GREATEREQUAL, EQEQUAL, NOTEQUAL,
+    KIND_NAMES,
+)
+
+COMPARISON_TOKENS = (LESS, GREATER, LESSEQUAL, GREATEREQUAL, EQEQUAL, NOTEQUAL)
+ADDITIVE_TOKENS = (PLUS, MINUS)
+MULTIPLICATIVE_TOKENS = (TIMES, DIVIDE, PERCENT)
+
 class Parser:
-    def __init__(self, tokens):
-        self.tokens = tokens
+    """Parses a token stream into the tuple AST.
+
+    Tokens are (kind, start, end) offsets into source, as produced by
+    lexer.Lexer.stream. They are read one at a time, so a stream is never
+    materialized; token text is only sliced out of the source when needed.
+    A list of (type name, text) pairs from Lexer.tokenize is also accepted
+    when no source is given.
+
+    The AST itself carries no source positions. Instead, positions maps the
+    id() of every statement tuple to (statement, offset of its first token).
+    Holding the statement keeps it alive, so its id() cannot be reused by
+    another object while the table exists. offset_of looks up a statement,
+    and line_column converts an offset to a 1-based (line, column) pair.
+    """
+
+    def __init__(self, tokens, source=None):
+        if source is None:
+            tokens, source = lexer.from_pairs(tokens)
+        self.tokens = iter(tokens)
+        self.source = source
+        self.eof = (EOF, len(source), len(source))
+        self.current = next(self.tokens, self.eof)
         self.position = 0
+        self.errors = []
+        self.positions = {}
+        self._line_starts = None
 
     def parse(self):
         statements = []
-        while self.position < len(self.tokens):
+        while self.current[0] != EOF:
             try:
                 statement = self.parse_statement()
                 if statement:
                     statements.append(statement)
+            except lexer.LexerError:
+                raise
             except SyntaxError as e:
-                print(f"Syntax error at token {self.peek()}: {e}")
+                self.errors.append(e)
+                print(f"Syntax error at token {self.describe(self.peek())}: {e}")
                 self.advance()  # Skip the problematic token
         return statements
 
     def parse_statement(self):
         current_token = self.peek()
-        if current_token[0] == 'IDENTIFIER':
-            return self.handle_identifier(current_token)
-        elif current_token[0] == 'NEWLINE':
-            self.advance()
-            return None
+        if current_token[0] == IDENTIFIER:
+            statement = self.handle_identifier(current_token)
+            self.positions[id(statement)] = (statement, current_token[1])
+            return statement
         else:
-            raise SyntaxError(f"Unexpected token: {current_token}")
+            raise SyntaxError(f"Unexpected token: {self.describe(current_token)}")
 
     def handle_identifier(self, current_token):
-        if current_token[1] == 'print':
+        keyword = self.text(current_token)
+        if keyword == 'print':
             return self.parse_print_statement()
-        elif current_token[1] == 'if':
+        elif keyword == 'if':
             return self.parse_if_statement()
-        elif current_token[1] == 'while':
+        elif keyword == 'while':
             return self.parse_while_statement()
         else:
             return self.parse_assignment()
 
     def parse_print_statement(self):
-        self.expect('IDENTIFIER', 'print')
-        self.expect('LPAREN')
+        self.expect(IDENTIFIER, 'print')
+        self.expect(LPAREN)
         expression = self.parse_expression()
-        self.expect('RPAREN')
-        self.expect_optional('SEMICOLON')
+        self.expect(RPAREN)
+        self.expect_optional(SEMICOLON)
         return ('print', expression)
 
     def parse_expression(self):
-        left = self.parse_term()
-        while self.peek()[0] in ('PLUS', 'MINUS'):
-            operator = self.advance()[1]
-            right = self.parse_term()
+        left = self.parse_product()
+        while self.peek()[0] in ADDITIVE_TOKENS:
+            operator = self.text(self.advance())
+            right = self.parse_product()
             left = (operator, left, right)  # Create a binary operation
         return left
 
+    def parse_product(self):
+        left = self.parse_postfix()
+        while self.peek()[0] in MULTIPLICATIVE_TOKENS:
+            operator = self.text(self.advance())
+            right = self.parse_postfix()
+            left = (operator, left, right)
+        return left
+
+    def parse_postfix(self):
+        expression = self.parse_term()
+        while self.peek()[0] == LBRACKET:
+            self.advance()
+            position = self.parse_expression()
+            self.expect(RBRACKET)
+            expression = ('index', expression, position)  # Indexing, like a[0]
+        return expression
+
     def parse_term(self):
         token = self.peek()
-        if token[0] == 'IDENTIFIER':
+        if token[0] == IDENTIFIER:
+            self.advance()
+            name = self.text(token)
+            if name == 'len' and self.peek()[0] == LPAREN:
+                self.advance()
+                argument = self.parse_expression()
+                self.expect(RPAREN)
+                return ('len', argument)  # Length of an array or string
+            return ('var', name)  # Variable
+        elif token[0] == NUMBER:
             self.advance()
-            return ('var', token[1])  # Variable
-        elif token[0] == 'NUMBER':
+            return ('num', self.number(token))  # Literal
+        elif token[0] == STRING:
             self.advance()
-            return ('num', token[1])  # Literal
+            return ('str', sys.intern(self.source[token[1] + 1:token[2] - 1]))  # String literal without quotes
+        elif token[0] == LBRACKET:
+            return self.parse_array()
+        elif token[0] == LPAREN:
+            self.advance()
+            expression = self.parse_expression()
+            self.expect(RPAREN)
+            return expression
         else:
-            raise SyntaxError(f"Unexpected token in expression: {token}")
+            raise SyntaxError(f"Unexpected token in expression: {self.describe(token)}")
+
+    def parse_array(self):
+        self.expect(LBRACKET)
+        elements = []
+        while self.peek()[0] != RBRACKET:
+            elements.append(self.parse_expression())
+            if self.peek()[0] != COMMA:
+                break
+            self.advance()  # Allows a trailing comma
+        self.expect(RBRACKET)
+        return ('array', tuple(elements))  # Array literal
 
     def parse_assignment(self):
-        identifier = self.expect('IDENTIFIER')[1]
-        self.expect('EQUAL')
+        identifier = self.text(self.expect(IDENTIFIER))
+        self.expect(EQUAL)
         value = self.parse_expression()
-        self.expect_optional('SEMICOLON')
+        self.expect_optional(SEMICOLON)
         return ('assign', identifier, value)
 
     def parse_if_statement(self):
-        self.expect('IDENTIFIER', 'if')
-        self.expect('LPAREN')
+        self.expect(IDENTIFIER, 'if')
+        self.expect(LPAREN)
         condition = self.parse_condition()
-        self.expect('RPAREN')
-        self.expect('LBRACE')
+        self.expect(RPAREN)
+        self.expect(LBRACE)
         body = self.parse_block()
         return ('if', condition, body)
 
     def parse_condition(self):
-        left = self.expect('IDENTIFIER')[1]
-        operator = self.expect('IDENTIFIER')[1]  # Expecting a comparison operator (like <, >, ==)
-        right = self.expect('NUMBER')[1]
+        left = ('var', self.text(self.expect(IDENTIFIER)))
+        if self.peek()[0] not in COMPARISON_TOKENS:
+            raise SyntaxError(f"Expected comparison operator, but got {self.describe(self.peek())}")
+        operator = self.text(self.advance())  # Comparison operator (like <, >, <=)
+        right = ('num', self.number(self.expect(NUMBER)))
         return (operator, left, right)  # Return condition tuple
 
     def parse_while_statement(self):
-        self.expect('IDENTIFIER', 'while')
-        self.expect('LPAREN')
+        self.expect(IDENTIFIER, 'while')
+        self.expect(LPAREN)
         condition = self.parse_condition()  # Parse the condition (e.g., x < 5)
-        self.expect('RPAREN')
-        self.expect('LBRACE')
+        self.expect(RPAREN)
+        self.expect(LBRACE)
         body = self.parse_block()
         return ('while', condition, body)
 
     def parse_block(self):
         body = []
-        while self.peek()[0] != 'RBRACE':
+        while self.peek()[0] != RBRACE:
             statement = self.parse_statement()
             if statement:
                 body.append(statement)
-        self.expect('RBRACE')
+        self.expect(RBRACE)
         return body
 
     def peek(self):
-        if self.position < len(self.tokens):
-            return self.tokens[self.position]
-        return ('EOF', None)
+        return self.current
+
+    def text(self, token):
+        """Return the source text of a token."""
+        return self.source[token[1]:token[2]]
+
+    def number(self, token):
+        """Return the value of a NUMBER token: an int, or a float if it has a fraction."""
+        text = self.text(token)
+        return float(text) if '.' in text else int(text)
+
+    def offset_of(self, statement):
+        """Return the offset of a statement's first token, or None if it was not parsed here."""
+        entry = self.positions.get(id(statement))
+        return entry[1] if entry is not None and entry[0] is statement else None
+
+    def line_column(self, offset):
+        """Return the 1-based line and column of a source offset."""
+        if self._line_starts is None:
+            self._line_starts = [0] + [match.end() for match in re.finditer('\n', self.source)]
+        line = bisect.bisect_right(self._line_starts, offset)
+        return line, offset - self._line_starts[line - 1] + 1
+
+    def describe(self, token):
+        """Format a token for error messages."""
+        if token[0] == EOF:
+            return "('EOF', None)"
+        return f"({KIND_NAMES[token[0]]!r}, {self.text(token)!r})"
 
     def expect(self, token_type, value=None):
-        if self.position >= len(self.tokens):
-            raise SyntaxError(f'Expected token type {token_type}, but reached end of file')
-        token = self.tokens[self.position]
-        if token[0] != token_type or (value and token[1] != value):
-            raise SyntaxError(f'Expected token {token_type} {value}, but got {token}')
-        self.position += 1
+        token = self.current
+        if token[0] == EOF:
+            raise SyntaxError(f'Expected token type {KIND_NAMES[token_type]}, but reached end of file')
+        if token[0] != token_type or (value and self.text(token) != value):
+            raise SyntaxError(f'Expected token {KIND_NAMES[token_type]} {value}, but got {self.describe(token)}')
+        self.advance()
         return token
 
     def expect_optional(self, token_type):
-        if self.position < len(self.tokens) and self.tokens[self.position][0] == token_type:
-            self.position += 1
+        if self.current[0] == token_type:
+            self.advance()
 
     def advance(self):
-        self.position += 1
+        token = self.current
+        if token[0] != EOF:
+            self.current = next(self.tokens, self.eof)
+            self.position += 1
+        return token
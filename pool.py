@@ -0,0 +1,288 @@
+# pool.py
+#
+# Sandboxed, reusable runtimes for evaluating untrusted Velox snippets.
+#
+# SandboxedRuntime is a runtime.Runtime that charges one instruction for
+# every condition it evaluates, that is for every loop iteration and every
+# if statement. Every check_every instructions it checks the instruction and
+# wall-clock budgets; checking the clock less often keeps the cost per
+# instruction to a counter increment and a comparison.
+#
+# Counting conditions bounds the number of statements a program runs, as
+# only loops repeat statements, but not the work of one statement: ints are
+# exact, so a loop such as while (x > 1) { x = x * x; } doubles the size of
+# x on every iteration, and a few dozen iterations would take hours. Every
+# product of two ints is therefore checked before it is computed: one whose
+# result could have more than max_int_bits bits, or would not fit in the
+# memory budget, raises, and big products check the clock first. Sums and
+# differences grow by one bit at most, and other values grow at most
+# linearly in the size of their operands.
+#
+# Assignments keep a running estimate of the memory held by variables and
+# fail once it would exceed the memory budget. With a memory budget, arrays
+# are measured with their elements, nested arrays included. Exceeding any
+# budget raises a BudgetExceeded subclass.
+#
+# The same runtime can also run a program as a generator, which yields at
+# loop back-edges once every yield_every instructions. RuntimePool.run_async
+# drives that generator and gives control back to the event loop at each
+# yield, so a long-running snippet cannot stall other tasks.
+#
+# A RuntimePool keeps idle runtimes, each writing to its own CaptureSink.
+# Resetting one clears its variables, counters, inline caches, compiled
+# conditions and loops and output in place, so a service can keep a bounded
+# set of runtimes and their buffers alive rather than allocating new ones
+# for every snippet.
+
+import asyncio
+import contextlib
+import sys
+import threading
+import time
+
+import lexer
+import output
+import parser
+import runtime
+import values
+
+DEFAULT_CHECK_EVERY = 1024
+DEFAULT_YIELD_EVERY = 10000
+
+# The largest product of two ints, in bits. Computing one takes about 0.1s.
+DEFAULT_MAX_INT_BITS = 1 << 20
+
+# Products of ints at least this many bits long check the budgets first.
+CHECKED_PRODUCT_BITS = 1 << 14
+
+_evaluate_condition = runtime.Runtime.evaluate_condition
+_evaluate_expression = runtime.Runtime.evaluate_expression
+
+
+class BudgetExceeded(RuntimeError):
+    """Raised when a program exceeds one of its runtime's budgets."""
+
+
+class InstructionBudgetExceeded(BudgetExceeded):
+    pass
+
+
+class TimeBudgetExceeded(BudgetExceeded):
+    pass
+
+
+class MemoryBudgetExceeded(BudgetExceeded):
+    pass
+
+
+class IntegerBudgetExceeded(BudgetExceeded):
+    pass
+
+
+def value_size(value, limit=None):
+    """sys.getsizeof of a value, with the elements of arrays and nested arrays.
+
+    An array holding the same array twice counts it twice, as printing it
+    would. Measuring stops once the size is over limit, if one is given.
+    """
+    size = 0
+    pending = [value]
+    while pending:
+        value = pending.pop()
+        size += sys.getsizeof(value)
+        if limit is not None and size > limit:
+            break
+        if type(value) is values.Array and isinstance(value.items, list):
+            pending.extend(value.items)
+    return size
+
+
+class SandboxedRuntime(runtime.Runtime):
+    """A runtime that enforces instruction, time and memory budgets.
+
+    Budgets of None are unlimited. Instructions are counted only in
+    evaluate_condition, one per condition, so the instruction and time
+    budgets rely on every loop iteration evaluating its condition here;
+    products of ints are bounded separately by max_int_bits. max_memory is
+    in bytes, as estimated by sys.getsizeof for variable names and values,
+    and by value_size for arrays.
+    """
+
+    def __init__(self, output_sink=None, max_instructions=None, max_seconds=None, max_memory=None,
+                 check_every=DEFAULT_CHECK_EVERY, yield_every=DEFAULT_YIELD_EVERY,
+                 max_int_bits=DEFAULT_MAX_INT_BITS):
+        super().__init__(output_sink if output_sink is not None else output.CaptureSink())
+        self.max_instructions = max_instructions
+        self.max_seconds = max_seconds
+        self.max_memory = max_memory
+        self.max_int_bits = max_int_bits
+        self.check_every = check_every
+        self.yield_every = yield_every
+        self.instructions = 0
+        self.next_check = 0
+        self.next_yield = yield_every
+        self.deadline = None
+        self.memory = 0
+
+    def reset(self):
+        """Forget all variables and output so the runtime can be reused."""
+        self.variables.clear()
+        self.clear_caches()
+        self.memory = 0
+        self.instructions = 0
+        clear = getattr(self.output, 'clear', None)
+        if clear is not None:
+            clear()
+
+    def start(self):
+        """Start the budgets of a new run."""
+        self.instructions = 0
+        self.next_check = 0
+        self.next_yield = self.yield_every
+        self.deadline = time.monotonic() + self.max_seconds if self.max_seconds is not None else None
+
+    def check(self):
+        """Raise if a budget is exhausted, and schedule the next check."""
+        if self.max_instructions is not None and self.instructions > self.max_instructions:
+            raise InstructionBudgetExceeded(f"Exceeded the budget of {self.max_instructions} instructions")
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise TimeBudgetExceeded(f"Exceeded the budget of {self.max_seconds} seconds")
+        self.next_check = self.instructions + self.check_every
+        if self.max_instructions is not None:
+            self.next_check = min(self.next_check, self.max_instructions + 1)
+
+    def run(self, ast):
+        """Execute a list of statements within the budgets."""
+        self.start()
+        super().run(ast)
+
+    def evaluate_condition(self, condition):
+        self.instructions += 1
+        if self.instructions >= self.next_check:
+            self.check()
+        return _evaluate_condition(self, condition)
+
+    def evaluate_expression(self, expr):
+        if type(expr) is tuple and expr[0] == '*':
+            # Products are evaluated here, so their size is checked first.
+            x = self.evaluate_expression(expr[1])
+            y = self.evaluate_expression(expr[2])
+            if type(x) is int and type(y) is int:
+                self.check_product(x.bit_length() + y.bit_length())
+            return values.multiply(x, y)
+        return _evaluate_expression(self, expr)
+
+    def check_product(self, bits):
+        """Raise if a product of ints of this many bits in all would exceed a budget."""
+        if self.max_int_bits is not None and bits > self.max_int_bits:
+            raise IntegerBudgetExceeded(f"Exceeded the budget of {self.max_int_bits} bits for an integer")
+        if self.max_memory is not None and self.memory + bits // 8 > self.max_memory:
+            raise MemoryBudgetExceeded(f"Exceeded the budget of {self.max_memory} bytes of variables")
+        if bits >= CHECKED_PRODUCT_BITS:
+            self.check()
+
+    def assign_value(self, identifier, value):
+        size = sys.getsizeof if self.max_memory is None else self.size
+        previous = self.variables.get(identifier)
+        if previous is None:
+            change = sys.getsizeof(identifier) + size(value)
+        else:
+            change = size(value) - size(previous)
+        if self.max_memory is not None and self.memory + change > self.max_memory:
+            raise MemoryBudgetExceeded(f"Exceeded the budget of {self.max_memory} bytes of variables")
+        self.memory += change
+        self.variables[identifier] = value
+
+    def size(self, value):
+        """The size of a value, measured no further than the memory budget."""
+        if type(value) is values.Array:
+            return value_size(value, self.max_memory)
+        return sys.getsizeof(value)
+
+    def steps(self, ast):
+        """Run a program as a generator yielding every yield_every instructions."""
+        self.start()
+        self.clear_caches()
+        try:
+            for statement in ast:
+                yield from self._steps(statement)
+        finally:
+            self.output.flush()
+
+    def _steps(self, statement):
+        statement_type = statement[0]
+        if statement_type == 'while':
+            condition, body = statement[1], statement[2]
+            while self.evaluate_condition(condition):
+                for stmt in body:
+                    yield from self._steps(stmt)
+                if self.instructions >= self.next_yield:
+                    self.next_yield = self.instructions + self.yield_every
+                    yield
+        elif statement_type == 'if':
+            if self.evaluate_condition(statement[1]):
+                for stmt in statement[2]:
+                    if stmt is not None:
+                        yield from self._steps(stmt)
+        else:
+            self.execute(statement)
+
+
+def parse(program):
+    """Return the AST of a program given as source text or as an AST."""
+    if isinstance(program, str):
+        return parser.Parser(lexer.Lexer(program).stream(), program).parse()
+    return program
+
+
+class RuntimePool:
+    """Hands out reset SandboxedRuntimes sharing the same budgets.
+
+    Runtimes are created on demand and at most size idle ones are kept for
+    reuse. The pool is safe to use from several threads.
+    """
+
+    def __init__(self, size=8, **budgets):
+        self.size = size
+        self.budgets = budgets
+        self.idle = []
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Return an idle runtime, or a new one if none is idle."""
+        with self.lock:
+            if self.idle:
+                return self.idle.pop()
+        return SandboxedRuntime(**self.budgets)
+
+    def release(self, sandbox):
+        """Reset a runtime and keep it for reuse if the pool has room."""
+        sandbox.reset()
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(sandbox)
+
+    @contextlib.contextmanager
+    def runtime(self):
+        """Borrow a runtime for the duration of a with block."""
+        sandbox = self.acquire()
+        try:
+            yield sandbox
+        finally:
+            self.release(sandbox)
+
+    def run(self, program):
+        """Run a program given as source or AST and return its output."""
+        sandbox = self.acquire()
+        try:
+            sandbox.run(parse(program))
+            return sandbox.output.getvalue()
+        finally:
+            self.release(sandbox)
+
+    async def run_async(self, program):
+        """Run a program, yielding to the event loop as it goes, and return its output."""
+        with self.runtime() as sandbox:
+            for _ in sandbox.steps(parse(program)):
+                await asyncio.sleep(0)
+            return sandbox.output.getvalue()
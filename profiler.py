@@ -0,0 +1,195 @@
+# profiler.py
+#
+# A statement-level profiler for programs run by runtime.Runtime.
+#
+# Two cheap mechanisms are combined. Execution counts come from counters on
+# conditions: a block runs once per run of its enclosing statement at the top
+# level, and otherwise exactly as often as the condition guarding it holds.
+# The profiler runs programs on a subclass of the engine whose
+# evaluate_condition counts how often each condition holds, and statement
+# counts are worked out from those after the run. That costs one dictionary
+# update per loop iteration or if statement instead of one per statement.
+# If a run stops with an error, statements after the failing one in its
+# block are counted as if they had run.
+#
+# Timing is sampled: a background thread wakes up every interval, looks at
+# the interpreter's call stack and charges the elapsed wall and CPU time to
+# the Velox statements being executed. Nested statements appear as nested
+# execute frames, so each sample is a full Velox stack, outermost statement
+# first.
+#
+# Statements are identified by id() and mapped to source lines through the
+# positions side table of parser.Parser, which holds the statements so their
+# ids stay unique. The AST must be the one the parser produced, not an
+# optimized or cached copy.
+#
+# Results can be written as collapsed stacks, one "frame;frame;frame weight"
+# line per distinct stack with the weight in microseconds of wall time, which
+# flamegraph.pl, speedscope and similar tools read directly, and summarized
+# as a table of the hottest lines.
+
+import collections
+import sys
+import threading
+import time
+
+import runtime
+
+DEFAULT_INTERVAL = 0.005  # The default interpreter switch interval
+
+
+def thread_clock(thread_id):
+    """Return a function measuring a thread's CPU time, or process time."""
+    try:
+        clock_id = time.pthread_getcpuclockid(thread_id)
+    except (AttributeError, OSError):
+        return time.process_time
+    return lambda: time.clock_gettime(clock_id)
+
+
+class Profiler:
+    """Counts statement executions and samples where time is spent.
+
+    positions maps statement ids to (statement, source offset) pairs and
+    line_column turns an offset into a (line, column) pair, as
+    parser.Parser provides.
+    """
+
+    def __init__(self, positions, line_column, filename='<script>', interval=DEFAULT_INTERVAL):
+        self.positions = positions
+        self.line_column = line_column
+        self.filename = filename
+        self.interval = interval
+        self.passed = collections.defaultdict(int)
+        self.runs = []
+        self.stacks = collections.defaultdict(lambda: [0, 0.0, 0.0])  # samples, wall, cpu
+        self.samples = 0
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def profiled(self, base):
+        """Return a subclass of an engine class that counts for this profiler.
+
+        This is how tracing.attach hooks in too. Engines are created from
+        the subclass rather than switched to it, so they do not pay the
+        slower attribute lookups tracing.attach describes.
+        """
+        passed = self.passed
+
+        class Profiled(base):
+            def evaluate_condition(self, condition):
+                result = base.evaluate_condition(self, condition)
+                if result:
+                    passed[id(condition)] += 1
+                return result
+
+        Profiled.__name__ = Profiled.__qualname__ = f"Profiled{base.__name__}"
+        return Profiled
+
+    def start(self, thread_id=None):
+        """Start sampling a thread, by default the calling one."""
+        thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._sample, args=(thread_id,),
+                                        name='velox-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling."""
+        self._stopping.set()
+        self._thread.join()
+        self._thread = None
+
+    def run(self, ast, engine_class=runtime.Runtime, output_sink=None):
+        """Run a program with profiling on a new engine and return the engine."""
+        engine = self.profiled(engine_class)(output_sink)
+        self.runs.append(ast)
+        self.start()
+        try:
+            engine.run(ast)
+        finally:
+            self.stop()
+        return engine
+
+    def _sample(self, thread_id):
+        cpu_clock = thread_clock(thread_id)
+        execute_code = runtime.Runtime.execute.__code__
+        stacks = self.stacks
+        wall, cpu = time.perf_counter(), cpu_clock()
+        while not self._stopping.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            now_wall, now_cpu = time.perf_counter(), cpu_clock()
+            stack = []
+            while frame is not None:
+                if frame.f_code is execute_code:
+                    stack.append(id(frame.f_locals['statement']))
+                frame = frame.f_back
+            frame = None
+            if stack:
+                totals = stacks[tuple(reversed(stack))]
+                totals[0] += 1
+                totals[1] += now_wall - wall
+                totals[2] += now_cpu - cpu
+                self.samples += 1
+            wall, cpu = now_wall, now_cpu
+
+    def counts(self):
+        """Return how often each statement ran, keyed by statement id."""
+        counts = collections.defaultdict(int)
+        blocks = [(ast, 1) for ast in self.runs]
+        while blocks:
+            block, times = blocks.pop()
+            for statement in block:
+                if statement is None:
+                    continue
+                counts[id(statement)] += times
+                if statement[0] in ('if', 'while'):
+                    blocks.append((statement[2], self.passed.get(id(statement[1]), 0)))
+        return counts
+
+    def line(self, statement_id):
+        """Return the source line of a statement, or 0 if it is unknown."""
+        entry = self.positions.get(statement_id)
+        return self.line_column(entry[1])[0] if entry is not None else 0
+
+    def collapsed(self):
+        """Return the sampled stacks as collapsed-stack lines."""
+        lines = []
+        for stack, (samples, wall, cpu) in sorted(self.stacks.items()):
+            frames = ';'.join(f"{self.filename}:{self.line(statement)}" for statement in stack)
+            lines.append(f"{frames} {round(wall * 1e6)}")
+        return lines
+
+    def write_collapsed(self, path):
+        """Write the sampled stacks to a collapsed-stack file."""
+        with open(path, 'w') as file:
+            for line in self.collapsed():
+                file.write(f"{line}\n")
+
+    def hot_lines(self, limit=10):
+        """Return per-line statistics, hottest first.
+
+        Each row is (line, executions, self wall, total wall, total cpu) with
+        times in seconds. Self time is spent in the line's own statement,
+        total time includes the statements nested inside it.
+        """
+        rows = collections.defaultdict(lambda: [0, 0.0, 0.0, 0.0])
+        for statement, count in self.counts().items():
+            rows[self.line(statement)][0] += count
+        for stack, (samples, wall, cpu) in self.stacks.items():
+            rows[self.line(stack[-1])][1] += wall
+            for line in {self.line(statement) for statement in stack}:
+                rows[line][2] += wall
+                rows[line][3] += cpu
+        ranked = sorted(rows.items(), key=lambda row: (-row[1][1], -row[1][2], row[0]))
+        return [(line, *totals) for line, totals in ranked[:limit]]
+
+    def report(self, limit=10, file=None):
+        """Print the hottest lines as a table."""
+        file = file if file is not None else sys.stderr
+        print(f"{'line':>6} {'count':>10} {'self ms':>10} {'total ms':>10} {'cpu ms':>10}", file=file)
+        for line, count, self_wall, wall, cpu in self.hot_lines(limit):
+            location = f"{line}" if line else '?'
+            print(f"{location:>6} {count:>10} {self_wall * 1e3:10.1f} {wall * 1e3:10.1f} {cpu * 1e3:10.1f}",
+                  file=file)
+        print(f"{self.samples} samples at {self.interval * 1e3:g} ms intervals", file=file)
@@ -0,0 +1,171 @@
+# resolver.py
+#
+# Resolves variable names to slot indexes before a program runs.
+#
+# Every variable a piece of code can touch gets a fixed index in a SlotTable.
+# Engines then keep variables in a preallocated list and access them by
+# index, instead of hashing the name on every read and write. The bytecode
+# compiler resolves the variables of a whole program; the interpreter
+# resolves the parameters and declarations of each function, so a call frame
+# is a single list sized for the function.
+#
+# Interpreter functions are lexically scoped: a name a function does not
+# declare refers to the variable of that name in the function it is nested
+# in, and so on out to the globals. A function's SlotTable links to the
+# table of the function it is nested in, and lookup resolves a name to the
+# (depth, slot) of its variable, counting the frames to walk up from the
+# frame the function runs in. Functions without parameters or declarations
+# get no frame of their own and run in the frame they were declared in, so
+# a table without slots resolves names as its parent does.
+
+
+class Unbound(str):
+    """The value of a variable that has never been assigned.
+
+    Runtime evaluates unknown names to the name itself. A distinct string
+    object is used so engines can tell whether a variable was assigned and
+    needs to be written back.
+    """
+
+
+def is_temporary(name):
+    """Whether a variable is a temporary the optimizer introduced.
+
+    Program identifiers cannot start with a digit, and temporaries do, so
+    they never clash with a program's variables. Engines keep them out of
+    the variables a run leaves behind.
+    """
+    return name[:1].isdigit()
+
+
+class Undefined:
+    """Marks a slot whose variable has not been declared yet."""
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'UNDEFINED'
+
+
+UNDEFINED = Undefined()
+
+
+class SlotTable:
+    """Maps variable names to consecutive slot indexes.
+
+    parent is the table of the enclosing function, None at the top level.
+    template is a tuple of undefined slots to copy into new frames, made by
+    resolve_function once a function's variables are all resolved.
+    """
+
+    def __init__(self, names=(), parent=None):
+        self.slots = {}
+        self.names = []
+        self.parent = parent
+        self.scope = {}  # Names already looked up -> (depth, slot) or None
+        self.template = ()
+        for name in names:
+            self.resolve(name)
+
+    def resolve(self, name):
+        """Return the slot of a name, assigning the next one if it is new."""
+        slot = self.slots.get(name)
+        if slot is None:
+            slot = self.slots[name] = len(self.names)
+            self.names.append(name)
+        return slot
+
+    def empty(self):
+        """Return a list of undefined slots, one per variable."""
+        return [UNDEFINED] * len(self.names)
+
+    def lookup(self, name):
+        """Return the (depth, slot) of the variable a name refers to, or None for a global.
+
+        Depth 0 is the frame the table's function runs in: its own, or its
+        parent's if it has no slots.
+        """
+        try:
+            return self.scope[name]
+        except KeyError:
+            pass
+        where = None
+        depth = 0
+        table = self if self.names else self.parent
+        while table is not None:
+            slot = table.slots.get(name)
+            if slot is not None:
+                where = (depth, slot)
+                break
+            depth += 1
+            table = table.parent
+        self.scope[name] = where
+        return where
+
+    def __contains__(self, name):
+        return name in self.slots
+
+    def __len__(self):
+        return len(self.names)
+
+
+def resolve_program(ast, table=None):
+    """Resolve every variable read or assigned by a parser.Parser AST."""
+    table = table if table is not None else SlotTable()
+    for statement in ast:
+        if statement is None:
+            continue
+        statement_type = statement[0]
+        if statement_type == 'assign':
+            _resolve_expression(statement[2], table)
+            table.resolve(statement[1])
+        elif statement_type == 'print':
+            _resolve_expression(statement[1], table)
+        elif statement_type in ('if', 'while'):
+            _resolve_expression(statement[1], table)
+            resolve_program(statement[2], table)
+    return table
+
+
+def _resolve_expression(expr, table):
+    if isinstance(expr, str):
+        if not (expr.startswith('"') and expr.endswith('"')):
+            table.resolve(expr)
+    elif isinstance(expr, tuple):
+        if expr[0] == 'var':
+            table.resolve(expr[1])
+        elif expr[0] == 'array':
+            for element in expr[1]:
+                _resolve_expression(element, table)
+        elif expr[0] == 'len':
+            _resolve_expression(expr[1], table)
+        elif expr[0] not in ('num', 'str'):
+            _resolve_expression(expr[1], table)
+            _resolve_expression(expr[2], table)
+
+
+def resolve_function(params, body, parent=None):
+    """Resolve the local variables of an interpreter.Interpreter function.
+
+    A function's variables are its parameters followed by every name it
+    declares, in nested blocks too. parent is the SlotTable of the function
+    it is declared in, if any.
+    """
+    if parent is not None and not parent.names:
+        parent = parent.parent  # A function without slots has no frame to link to
+    table = SlotTable(params, parent)
+    _resolve_declarations(body, table)
+    table.template = tuple(table.empty())
+    return table
+
+
+def _resolve_declarations(statements, table):
+    for statement in statements:
+        statement_type = statement[0]
+        if statement_type in ('VAR_DECL', 'FUNCTION'):
+            table.resolve(statement[1])
+        elif statement_type in ('IF', 'WHILE'):
+            _resolve_declarations(statement[2], table)
+            if len(statement) > 3:
+                _resolve_declarations(statement[3], table)
+        elif statement_type == 'BLOCK':
+            _resolve_declarations(statement[1], table)
@@ -1,51 +1,104 @@
+import jit
+import output
+import specialize
+import tracing
+import values
+from resolver import is_temporary
+
 class Runtime:
-    """A simple interpreter runtime for executing AST nodes."""
+    """A simple interpreter runtime for executing AST nodes.
     
-    def __init__(self):
-        """Initialize the runtime environment."""
-        self.variables = {}
-        self.print_value = print  # Default to built-in print function
-        self.debug_mode = False
-        
-    def run(self, ast):
-        """Execute a list of statements from the AST."""
-        self._debug("Running AST")
-        for statement in ast:
-            self._debug(f"Executing statement: {statement}")
-            self.execute(statement)
-            
-    def execute(self, statement):
-        """Execute a single statement based on its type."""
-        statement_type = statement[0]
+    The methods below contain no tracing code; see tracing.py for how
+    trace events are collected.
+    """
+    
+    def __init__(self, output_sink=None, jit_threshold=None, fuse_loops=True):
+        """Initialize the runtime environment.
         
-        statement_handlers = {
+        With a jit_threshold, such as jit.HOT_LOOP, loops are compiled once
+        they have gone round that many times; the default None keeps every
+        loop interpreted. fuse_loops runs loops that only
+        step a number as one fused loop (see specialize.counted_loop);
+        turning it off keeps every loop on the general path.
+        """
+        self.variables = {}
+        self.output = output_sink if output_sink is not None else output.StreamSink()
+        self.print_value = self.output.print  # Buffered; flushed when a run ends
+        self.tracer = None
+        self.inline_caches = {}  # id() of a binary expression node -> its InlineCache
+        self.predicates = {}  # id() of a condition -> (condition, compiled predicate)
+        self.counted_loops = {}  # id() of a while body -> (body, counted loop or None)
+        self.fuse_loops = fuse_loops
+        self.jit_threshold = jit_threshold
+        self.traces = {}  # id() of a while body -> its jit.Trace
+        self.statement_handlers = {
             'print': self._handle_print,
             'assign': self._handle_assign,
             'if': self._handle_if,
             'while': self._handle_while
         }
         
-        if statement_type in statement_handlers:
-            statement_handlers[statement_type](statement)
+    def trace(self, tracer):
+        """Send trace events to tracer, a callable; None stops tracing."""
+        if tracer is None:
+            tracing.detach(self)
         else:
-            raise ValueError(f"Unknown statement type: {statement_type}")
+            tracing.attach(self, tracer)
+            
+    @property
+    def debug_mode(self):
+        """Whether trace events are printed as DEBUG lines."""
+        return isinstance(self.tracer, tracing.TextTracer)
+    
+    @debug_mode.setter
+    def debug_mode(self, enabled):
+        self.trace(tracing.TextTracer(self.output) if enabled else None)
+        
+    def run(self, ast):
+        """Execute a list of statements from the AST."""
+        self.clear_caches()
+        try:
+            for statement in ast:
+                self.execute(statement)
+        finally:
+            self.output.flush()
+            variables = self.variables
+            for name in [name for name in variables if is_temporary(name)]:
+                del variables[name]
+            
+    def clear_caches(self):
+        """Forget the inline caches, predicates, fused loops and traces.
+        
+        They are keyed by the id() of AST nodes and keep the nodes alive, so
+        run() clears them first: in a REPL they hold the nodes of the last
+        line entered, not of every line. They stay filled after a run, for
+        reports such as specialize.report and jit.report.
+        """
+        self.inline_caches.clear()
+        self.predicates.clear()
+        self.counted_loops.clear()
+        self.traces.clear()
+        
+    def execute(self, statement):
+        """Execute a single statement based on its type."""
+        handler = self.statement_handlers.get(statement[0])
+        if handler is None:
+            raise ValueError(f"Unknown statement type: {statement[0]}")
+        handler(statement)
             
     def _handle_print(self, statement):
         """Handle print statements."""
         value = self.evaluate_expression(statement[1])
-        self._debug(f"Printing value: {value}")
         self.print_value(value)
         
     def _handle_assign(self, statement):
         """Handle assignment statements."""
         identifier, expression = statement[1], statement[2]
-        self._debug(f"Assigning {identifier} = {expression}")
         self.assign_value(identifier, self.evaluate_expression(expression))
         
     def _handle_if(self, statement):
         """Handle if statements."""
         condition, true_statements = statement[1], statement[2]
-        self._debug(f"Evaluating if condition: {condition}")
         self.evaluate_if(condition, true_statements)
         
     def _handle_while(self, statement):
@@ -55,46 +108,102 @@ class Runtime:
         
     def assign_value(self, identifier, value):
         """Assign a value to a variable."""
-        self._debug(f"Assigning {identifier} = {value}")
         self.variables[identifier] = value
         
     def evaluate_while(self, condition, body):
         """Evaluate a while loop."""
-        while self.evaluate_condition(condition):
-            for stmt in body:
-                self.execute(stmt)
-                
+        cls = type(self)
+        if (cls.evaluate_condition is not Runtime.evaluate_condition or cls.execute is not Runtime.execute
+                or cls.assign_value is not Runtime.assign_value):
+            # A subclass observes every condition, statement or assignment.
+            while self.evaluate_condition(condition):
+                for stmt in body:
+                    self.execute(stmt)
+            return
+            
+        if self.fuse_loops:
+            entry = self.counted_loops.get(id(body))
+            if entry is None:
+                entry = self.counted_loops[id(body)] = (body, specialize.counted_loop(condition, body))
+            if entry[1] is not None and self.run_counted_loop(*entry[1]):
+                return
+            
+        predicate = self.predicate(condition)
+        execute = self.execute
+        if self.jit_threshold is None:
+            while predicate(self):
+                for stmt in body:
+                    execute(stmt)
+            return
+            
+        trace = self.traces.get(id(body))
+        if trace is None:
+            trace = self.traces[id(body)] = jit.Trace(condition, body, self.jit_threshold)
+        while True:
+            if trace.function is not None and self.run_trace(trace):
+                return
+            countdown = trace.countdown
+            while predicate(self):
+                for stmt in body:
+                    execute(stmt)
+                countdown -= 1
+                if not countdown:
+                    break  # The loop is hot
+            else:
+                trace.countdown = countdown
+                return
+            trace.record(self.variables)
+            
+    def run_trace(self, trace):
+        """Run a loop's compiled trace.
+        
+        Returns False if a guard failed, after finishing the iteration it
+        failed in, so the interpreter goes on with the loop.
+        """
+        trace.entries += 1
+        exit = trace.function(self.variables, self.print_value)
+        if exit is None:
+            return True
+        for statements, loop in trace.fail(exit):
+            for stmt in statements:
+                if stmt is not None:
+                    self.execute(stmt)
+            if loop is not None:
+                self.evaluate_while(*loop)
+        return False
+        
+    def run_counted_loop(self, name, compare, limit, step_operator, step):
+        """Run a loop that only steps a number, as one fused loop.
+        
+        Returns False, having done nothing, if the variable is not a number.
+        """
+        value = self.variables.get(name, name)
+        if type(value) not in values.NUMBER_TYPES:
+            return False
+        while compare(value, limit):
+            value = step_operator(value, step)
+        self.variables[name] = value
+        return True
+        
     def evaluate_if(self, condition, true_statements):
         """Evaluate an if statement."""
         result = self.evaluate_condition(condition)
-        self._debug(f"If condition result: {result}")
         
         if result:
             for stmt in true_statements:
                 if stmt is not None:
-                    self._debug(f"Executing if body statement: {stmt}")
                     self.execute(stmt)
                     
     def evaluate_condition(self, condition):
         """Evaluate a comparison condition."""
-        op, left, right = condition
-        left_value = self.evaluate_expression(left)
-        right_value = self.evaluate_expression(right)
-        
-        self._debug(f"Comparing {left_value} {op} {right_value}")
-        
-        operators = {
-            '==': lambda x, y: x == y,
-            '<': lambda x, y: x < y,
-            '>': lambda x, y: x > y,
-            '<=': lambda x, y: x <= y,
-            '>=': lambda x, y: x >= y,
-            '!=': lambda x, y: x != y
-        }
+        return self.predicate(condition)(self)
         
-        if op in operators:
-            return operators[op](left_value, right_value)
-        raise ValueError(f"Unknown operator: {op}")
+    def predicate(self, condition):
+        """Return the compiled predicate of a condition, compiling it on first use."""
+        entry = self.predicates.get(id(condition))
+        if entry is None:
+            entry = self.predicates[id(condition)] = (condition, specialize.compile_condition(condition))
+        return entry[1]
         
     def evaluate_expression(self, expr):
         """Evaluate an expression and return its value."""
@@ -104,26 +213,23 @@ class Runtime:
             return self.variables.get(expr, expr)
             
         if isinstance(expr, tuple):
-            operator, left, right = expr
-            left_value = self.evaluate_expression(left)
-            right_value = self.evaluate_expression(right)
-            
-            operators = {
-                '+': lambda x, y: str(x) + str(y) if isinstance(x, str) or isinstance(y, str) 
-                                                else float(x) + float(y),
-                '-': lambda x, y: float(x) - float(y),
-                '*': lambda x, y: float(x) * float(y),
-                '/': lambda x, y: float(x) / float(y),
-                '%': lambda x, y: float(x) % float(y)
-            }
-            
-            if operator in operators:
-                return operators[op](left_value, right_value)
-            raise ValueError(f"Unknown operator: {operator}")
+            node_type = expr[0]
+            if node_type == 'num':
+                return expr[1]
+            if node_type == 'str':
+                return expr[1]
+            if node_type == 'var':
+                return self.variables.get(expr[1], expr[1])
+            if node_type == 'array':
+                return values.make_array([self.evaluate_expression(element) for element in expr[1]])
+            if node_type == 'index':
+                return values.index(self.evaluate_expression(expr[1]), self.evaluate_expression(expr[2]))
+            if node_type == 'len':
+                return values.length(self.evaluate_expression(expr[1]))
+                
+            cache = self.inline_caches.get(id(expr))
+            if cache is None:
+                cache = self.inline_caches[id(expr)] = specialize.InlineCache(expr)
+            return cache.evaluate(self)
             
         return expr
-        
-    def _debug(self, message):
-        """Print debug messages if debug mode is enabled."""
-        if self.debug_mode:
-            print(f"DEBUG: {message}")
@@ -0,0 +1,85 @@
+# scheduler.py
+#
+# Runs many Velox programs concurrently on one asyncio event loop.
+#
+# Each program gets its own interpreter.Interpreter and runs as an asyncio
+# task through Interpreter.interpret_async. A program hands control back to
+# the loop every yield_every loop iterations and whenever it awaits a host
+# function, and the event loop resumes ready tasks in the order they became
+# ready, so programs take turns fairly: a long-running program delays the
+# others by at most one slice at a time. Programs are cheap, since a
+# suspended program is only its task and value stacks, so tens of thousands
+# can run at once in one process.
+
+import asyncio
+import time
+
+import interpreter
+import output
+
+
+class Program:
+    """A program running under a Scheduler."""
+    __slots__ = ('engine', 'task', 'started', 'finished', 'error')
+
+    def __init__(self, engine, task):
+        self.engine = engine
+        self.task = task
+        self.started = time.perf_counter()
+        self.finished = None
+        self.error = None
+
+    @property
+    def output(self):
+        """The program's captured output."""
+        return self.engine.output.getvalue()
+
+    @property
+    def latency(self):
+        """Seconds from when the program was started until it finished."""
+        return self.finished - self.started if self.finished is not None else None
+
+
+class Scheduler:
+    """Starts programs with a shared set of host functions.
+
+    host_functions maps names to Python callables, which may be coroutine
+    functions. Programs write to their own output.CaptureSink unless given
+    another sink.
+    """
+
+    def __init__(self, host_functions=None, yield_every=interpreter.DEFAULT_YIELD_EVERY):
+        self.host_functions = dict(host_functions or {})
+        self.yield_every = yield_every
+        self.programs = []
+
+    def spawn(self, ast, output_sink=None):
+        """Start running a program and return its Program.
+
+        Must be called while the event loop is running.
+        """
+        engine = interpreter.Interpreter(output_sink=output_sink if output_sink is not None
+                                         else output.CaptureSink())
+        for name, function in self.host_functions.items():
+            engine.define_host_function(name, function)
+        program = Program(engine, asyncio.ensure_future(engine.interpret_async(ast, self.yield_every)))
+        program.task.add_done_callback(lambda task: self._finished(program, task))
+        self.programs.append(program)
+        return program
+
+    def _finished(self, program, task):
+        program.finished = time.perf_counter()
+        if not task.cancelled():
+            program.error = task.exception()
+
+    async def join(self):
+        """Wait for every program started so far; return them in start order."""
+        programs, self.programs = self.programs, []
+        await asyncio.gather(*(program.task for program in programs), return_exceptions=True)
+        return programs
+
+    async def run(self, programs):
+        """Run a list of ASTs concurrently and return their Programs."""
+        for ast in programs:
+            self.spawn(ast)
+        return await self.join()
@@ -1,23 +1,105 @@
 # shell.py
 
+import argparse
+
+import cache
+import jit
 import lexer
+import optimizer
 import parser
+import profiler
 import runtime
+import specialize
+import transpiler
+
+def make_runtime(compiled=False):
+    if compiled:
+        return transpiler.CompiledRuntime()
+    return runtime.Runtime(jit_threshold=jit.HOT_LOOP)
+
+def parse(text):
+    lex = lexer.Lexer(text)
+    tokens = lex.stream()
+
+    pars = parser.Parser(tokens, text)
+    return pars.parse()
+
+def run_file(path, compiled=False, use_cache=True, optimize=0, cache_stats=False, jit_stats=False):
+    with open(path) as source:
+        text = source.read()
+
+    run_time = make_runtime(compiled)
+    if not use_cache:
+        run_time.run(optimizer.optimize(parse(text), optimize))
+    elif compiled:
+        run_time.run_code(cache.default_cache().python_code(text, path, optimize))
+    else:
+        run_time.run(optimizer.optimize(cache.default_cache().parse(text, path), optimize))
+    if cache_stats:
+        specialize.report(run_time.inline_caches.values())
+    if jit_stats:
+        jit.report(run_time.traces.values())
+
+def profile_file(path, output_path=None, top=10):
+    """Run a script under the profiler and report its hottest lines.
+
+    The program runs unoptimized on runtime.Runtime, so every statement
+    keeps the source position the parser recorded for it.
+    """
+    with open(path) as source:
+        text = source.read()
+
+    pars = parser.Parser(lexer.Lexer(text).stream(), text)
+    ast = pars.parse()
+    profile = profiler.Profiler(pars.positions, pars.line_column, path)
+    profile.run(ast)
+    profile.write_collapsed(output_path or f"{path}.collapsed")
+    profile.report(top)
 
-def repl():
-    run_time = runtime.Runtime()
+def repl(compiled=False, optimize=0):
+    run_time = make_runtime(compiled)
     
     while True:
         text = input('velox > ')
         if text.strip() == "": continue
 
-        lex = lexer.Lexer(text)
-        tokens = lex.tokenize()
+        run_time.run(optimizer.optimize(parse(text), optimize))
 
-        pars = parser.Parser(tokens)
-        ast = pars.parse()
+def main():
+    argument_parser = argparse.ArgumentParser(description='Velox shell')
+    argument_parser.add_argument('script', nargs='?', help='.vlx file to run (default: start the REPL)')
+    argument_parser.add_argument('--compile', action='store_true',
+                                 help='compile programs to Python code objects before running them')
+    argument_parser.add_argument('--no-cache', action='store_true',
+                                 help='do not read or write cached parse and compile results')
+    argument_parser.add_argument('-O', dest='optimize', action='count', default=0,
+                                 help='optimize programs before running them; -OO also hoists loop invariants')
+    argument_parser.add_argument('--profile', nargs='?', const='', metavar='PATH',
+                                 help='profile the script, writing collapsed stacks to PATH '
+                                      '(default: SCRIPT.collapsed) and the hottest lines to stderr')
+    argument_parser.add_argument('--top', type=int, default=10,
+                                 help='number of lines in the profile report (default: 10)')
+    argument_parser.add_argument('--cache-stats', action='store_true',
+                                 help='report the hit rate of the operator inline caches to stderr')
+    argument_parser.add_argument('--jit-stats', action='store_true',
+                                 help='report the compiled loop traces and their guard failures to stderr')
+    args = argument_parser.parse_args()
 
-        run_time.run(ast)
+    if args.profile is not None:
+        if not args.script:
+            argument_parser.error('--profile needs a script')
+        if args.compile or args.optimize:
+            argument_parser.error('--profile cannot be combined with --compile or -O')
+        profile_file(args.script, args.profile, args.top)
+    elif args.script:
+        if args.cache_stats and args.compile:
+            argument_parser.error('--cache-stats cannot be combined with --compile')
+        if args.jit_stats and args.compile:
+            argument_parser.error('--jit-stats cannot be combined with --compile')
+        run_file(args.script, compiled=args.compile, use_cache=not args.no_cache, optimize=args.optimize,
+                 cache_stats=args.cache_stats, jit_stats=args.jit_stats)
+    else:
+        repl(compiled=args.compile, optimize=args.optimize)
 
 if __name__ == "__main__":
-    repl()
+    main()
@@ -0,0 +1,212 @@
+# specialize.py
+#
+# Inline caches for the binary operators of runtime.Runtime, and compiled
+# conditions.
+#
+# Velox operators are generic: '+' concatenates when either side is a
+# string, other operands are converted to numbers, and every operator falls
+# back to element-wise arithmetic for arrays. Most operator sites only ever
+# see one pair of operand types, though, such as int + int in a loop
+# counter. Runtime keeps an InlineCache for each binary expression node
+# it evaluates. The cache records the operand types seen at that site and a
+# handler specialized for them, which Runtime calls directly for as long as
+# the types of both operands match, in the spirit of the specializing
+# adaptive interpreter of CPython 3.11. A cache also resolves its operand
+# nodes once: literal operands become constants and variable operands a
+# direct lookup, so only nested expressions go back through
+# Runtime.evaluate_expression.
+#
+# When the types do not match, the cache misses and specializes again for
+# the new types. A site whose types change MAX_CHANGES times is megamorphic
+# and uses the generic operator from then on. Specialized handlers give the
+# same results and raise the same errors as the generic operators in
+# values.py.
+#
+# Every cache counts its hits and misses; stats() totals them and report()
+# lists the sites that miss most.
+#
+# Conditions are compiled the same way: compile_condition turns a condition
+# into a predicate calling the operator module's comparison directly on its
+# resolved operands. counted_loop recognizes while loops whose body only
+# steps the variable their condition tests by a constant, such as
+# while (x < 10) { x = x + 1; }, which Runtime then runs as one fused
+# compare-and-step loop over Python numbers.
+
+import collections
+import operator
+import sys
+
+import values
+
+# Re-specializations after which a site gives up and stays generic.
+MAX_CHANGES = 4
+
+
+# Handlers for the operand types an operator is specialized for, by
+# (operator, left type, right type). Other types use the generic operator.
+# Arithmetic on two numbers, ints or floats, is Python's own.
+SPECIALIZED = {
+    (operator_name, left, right): function
+    for operator_name, function in values.NUMERIC_OPERATORS.items()
+    for left in values.NUMBER_TYPES
+    for right in values.NUMBER_TYPES
+}
+# Concatenation, which builds a values.Rope once the result is long.
+SPECIALIZED.update({
+    ('+', left, right): values.concatenate
+    for left in (str, values.Rope, int, float)
+    for right in (str, values.Rope, int, float)
+    if str in (left, right) or values.Rope in (left, right)
+})
+
+
+def operand_reader(node):
+    """Return a function reading the value of an operand node for a runtime."""
+    if isinstance(node, tuple):
+        if node[0] in ('num', 'str'):
+            value = node[1]
+            return lambda runtime: value
+        if node[0] == 'var':
+            name = node[1]
+            return lambda runtime: runtime.variables.get(name, name)
+    return lambda runtime: runtime.evaluate_expression(node)
+
+
+def unknown_operator(operator):
+    """Return a generic operator that raises, after its operands are evaluated."""
+    def generic(x, y):
+        raise ValueError(f"Unknown operator: {operator}")
+    return generic
+
+
+COMPARISONS = {
+    '==': operator.eq,
+    '<': operator.lt,
+    '>': operator.gt,
+    '<=': operator.le,
+    '>=': operator.ge,
+    '!=': operator.ne,
+}
+
+
+def compile_condition(condition):
+    """Return a predicate evaluating a comparison condition for a runtime."""
+    op, left, right = condition
+    compare = COMPARISONS.get(op)
+    if compare is None:
+        def unknown(runtime):
+            raise ValueError(f"Unknown operator: {op}")
+        return unknown
+    read_left = operand_reader(left)
+    if isinstance(right, tuple) and right[0] in ('num', 'str'):
+        constant = right[1]
+        if isinstance(left, tuple) and left[0] == 'var':
+            name = left[1]
+            return lambda runtime: compare(runtime.variables.get(name, name), constant)
+        return lambda runtime: compare(read_left(runtime), constant)
+    read_right = operand_reader(right)
+    return lambda runtime: compare(read_left(runtime), read_right(runtime))
+
+
+def counted_loop(condition, body):
+    """Describe a loop that only steps its condition's variable, or return None.
+
+    The description is (name, comparison, limit, step operator, step).
+    """
+    op, left, right = condition
+    if len(body) != 1 or op not in COMPARISONS or not is_number(right):
+        return None
+    if not (isinstance(left, tuple) and left[0] == 'var'):
+        return None
+    statement = body[0]
+    if statement is None or statement[0] != 'assign' or statement[1] != left[1]:
+        return None
+    value = statement[2]
+    if not (isinstance(value, tuple) and value[0] in ('+', '-') and value[1] == left and is_number(value[2])):
+        return None
+    return left[1], COMPARISONS[op], right[1], values.NUMERIC_OPERATORS[value[0]], value[2][1]
+
+
+def is_number(node):
+    """Whether an expression node is a number literal."""
+    return isinstance(node, tuple) and node[0] == 'num' and type(node[1]) in values.NUMBER_TYPES
+
+
+# Totals over a set of inline caches.
+Stats = collections.namedtuple('Stats', 'sites hits misses megamorphic')
+
+
+class InlineCache:
+    """The inline cache of one binary operator site.
+
+    Until the first evaluation, left_type and right_type are None, so the
+    first evaluation always misses and specializes the site.
+    """
+    __slots__ = ('node', 'operator', 'generic', 'read_left', 'read_right', 'left_type', 'right_type',
+                 'handler', 'hits', 'misses', 'changes')
+
+    def __init__(self, node):
+        operator, left, right = node
+        self.node = node  # Keeps the node alive, so its id() stays unique
+        self.operator = operator
+        self.generic = values.BINARY_OPERATORS.get(operator) or unknown_operator(operator)
+        self.read_left = operand_reader(left)
+        self.read_right = operand_reader(right)
+        self.left_type = None
+        self.right_type = None
+        self.handler = self.generic
+        self.hits = 0
+        self.misses = 0
+        self.changes = 0
+
+    def evaluate(self, runtime):
+        """Evaluate the operator's node for a runtime.Runtime."""
+        x = self.read_left(runtime)
+        y = self.read_right(runtime)
+        if type(x) is self.left_type and type(y) is self.right_type:
+            self.hits += 1
+            return self.handler(x, y)
+        return self.miss(x, y)
+
+    def miss(self, x, y):
+        """Apply the operator to operands that failed the type guard."""
+        self.misses += 1
+        if self.changes < MAX_CHANGES:
+            handler = SPECIALIZED.get((self.operator, type(x), type(y)))
+            if handler is not None:
+                self.changes += 1
+                self.left_type, self.right_type, self.handler = type(x), type(y), handler
+                return handler(x, y)
+        return self.generic(x, y)
+
+    @property
+    def state(self):
+        """'specialized' for types, 'megamorphic' or 'unspecialized'."""
+        if self.changes >= MAX_CHANGES:
+            return 'megamorphic'
+        if self.left_type is None:
+            return 'unspecialized'
+        return f"specialized for {self.left_type.__name__} {self.operator} {self.right_type.__name__}"
+
+
+def stats(caches):
+    """Total the counters of a collection of InlineCaches."""
+    caches = list(caches)
+    return Stats(len(caches), sum(cache.hits for cache in caches),
+                 sum(cache.misses for cache in caches),
+                 sum(cache.changes >= MAX_CHANGES for cache in caches))
+
+
+def report(caches, top=10, file=None):
+    """Print the hit rate of a set of caches and the sites missing most."""
+    file = file if file is not None else sys.stderr
+    caches = list(caches)
+    total = stats(caches)
+    evaluations = total.hits + total.misses
+    rate = total.hits / evaluations if evaluations else 0.0
+    print(f"{total.sites} operator sites, {evaluations} evaluations, {rate:.1%} hits, "
+          f"{total.megamorphic} megamorphic", file=file)
+    for cache in sorted(caches, key=lambda cache: cache.misses, reverse=True)[:top]:
+        if cache.misses:
+            print(f"  {cache.hits:>10} hits {cache.misses:>8} misses  {cache.operator!r}: {cache.state}",
+                  file=file)
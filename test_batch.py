@@ -0,0 +1,101 @@
+import os
+import sys
+
+import pytest
+
+import batch
+import cache
+
+SCRIPTS = {
+    'adds.vlx': ('print(1 + 2);\n', "3\n", None),
+    'divides.vlx': ('print("before");\nx = 1 / 0;\n', "before\n", "ZeroDivisionError: division by zero"),
+    'syntax.vlx': ('x = ;\nprint(5);\n',
+                   "Syntax error at token ('SEMICOLON', ';'): Unexpected token in expression: ('SEMICOLON', ';')\n5\n",
+                   None),
+    'loops.vlx': ('i = 0;\nwhile (i < 300) {\n  i = i + 1;\n}\nprint(i);\n', "300\n", None),
+}
+
+
+@pytest.fixture(autouse=True)
+def worker_state(monkeypatch):
+    # run_batch(workers=0) sets up this process as a worker.
+    monkeypatch.setattr(batch, '_worker', dict(batch._worker))
+
+
+@pytest.fixture
+def scripts(tmp_path):
+    paths = []
+    for name, (source, _, _) in SCRIPTS.items():
+        path = tmp_path / name
+        path.write_text(source)
+        paths.append(str(path))
+    return paths
+
+
+def outcomes(results):
+    return [(os.path.basename(result.path), result.output, result.error) for result in results]
+
+
+EXPECTED = [(name, printed, error) for name, (_, printed, error) in SCRIPTS.items()]
+
+
+def test_collect_scripts(tmp_path):
+    (tmp_path / 'b.vlx').write_text('')
+    (tmp_path / 'a.vlx').write_text('')
+    (tmp_path / 'notes.txt').write_text('')
+    (tmp_path / 'sub').mkdir()
+    (tmp_path / 'sub' / 'c.vlx').write_text('')
+    (tmp_path / cache.CACHE_DIRECTORY_NAME).mkdir()
+    (tmp_path / cache.CACHE_DIRECTORY_NAME / 'd.vlx').write_text('')
+    root = str(tmp_path)
+    assert batch.collect_scripts(root) == [os.path.join(root, 'a.vlx'), os.path.join(root, 'b.vlx'),
+                                           os.path.join(root, 'sub', 'c.vlx')]
+    manifest = tmp_path / 'scripts.txt'
+    manifest.write_text('# smoke tests\nb.vlx\n\n  sub/c.vlx  \n')
+    assert batch.collect_scripts(str(manifest)) == [os.path.join(root, 'b.vlx'), os.path.join(root, 'sub/c.vlx')]
+    assert batch.collect_scripts('missing.vlx') == ['missing.vlx']
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+@pytest.mark.parametrize('optimize', [0, 2])
+def test_in_process_batch(scripts, tmp_path, compiled, optimize):
+    results = list(batch.run_batch(scripts, workers=0, use_cache=False, compiled=compiled, optimize=optimize))
+    assert outcomes(results) == EXPECTED
+    assert all(result.seconds >= 0 for result in results)
+    assert not (tmp_path / cache.CACHE_DIRECTORY_NAME).exists()
+
+
+def test_missing_scripts_fail_alone(scripts):
+    results = list(batch.run_batch([scripts[0], 'missing.vlx', scripts[0]], workers=0, use_cache=False))
+    assert [result.error for result in results] == [
+        None, "FileNotFoundError: [Errno 2] No such file or directory: 'missing.vlx'", None]
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_batches_share_the_cache_directory(scripts, tmp_path, compiled):
+    directory = tmp_path / 'shared'
+    first = list(batch.run_batch(scripts, workers=0, cache_directory=str(directory), compiled=compiled))
+    written = sorted(os.listdir(directory))
+    # An AST, and Python code when compiled, for each script without a syntax error.
+    assert len(written) == (6 if compiled else 3)
+    second = list(batch.run_batch(scripts, workers=0, cache_directory=str(directory), compiled=compiled))
+    assert outcomes(first) == outcomes(second) == EXPECTED
+    assert sorted(os.listdir(directory)) == written
+
+
+def test_worker_processes_keep_the_order(scripts, tmp_path):
+    paths = scripts * 3
+    results = list(batch.run_batch(paths, workers=2, cache_directory=str(tmp_path / 'shared')))
+    assert [result.path for result in results] == paths
+    assert outcomes(results) == EXPECTED * 3
+
+
+def test_main_reports_failures(scripts, monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'argv', ['batch.py', '-j', '0', '--no-cache', *scripts])
+    with pytest.raises(SystemExit) as exit_info:
+        batch.main()
+    assert exit_info.value.code == 1
+    out, err = capsys.readouterr()
+    assert out.startswith(f"==> {scripts[0]} <==\n3\n==> {scripts[1]} <==\nbefore\n")
+    assert f"{scripts[1]}: ZeroDivisionError: division by zero\n" in err
+    assert err.splitlines()[-1].startswith("4 scripts, 1 failed, ")
@@ -0,0 +1,121 @@
+import os
+
+import pytest
+
+import cache
+import parser
+
+SOURCE = 'x = 1;\nwhile (x < 4) {\n  x = x * 2;\n}\nprint(x);\n'
+
+
+def entries(directory):
+    return sorted(os.listdir(directory))
+
+
+def test_parse_misses_then_hits(tmp_path, monkeypatch):
+    store = cache.Cache(str(tmp_path))
+    ast = store.parse(SOURCE)
+    assert len(entries(tmp_path)) == 1
+    monkeypatch.setattr(parser, 'Parser', None)  # A hit must not parse again
+    assert store.parse(SOURCE) == ast
+
+
+def test_entries_are_kept_next_to_scripts(tmp_path):
+    script = tmp_path / 'loop.vlx'
+    store = cache.Cache()
+    store.parse(SOURCE, str(script))
+    store.bytecode(SOURCE, str(script), optimize=1)
+    names = entries(tmp_path / cache.CACHE_DIRECTORY_NAME)
+    tag = cache.sys.implementation.cache_tag
+    assert names == sorted([f'loop.vlx.{tag}.ast', f'loop.vlx.{tag}.opt-1.bytecode'])
+    assert cache.Cache().get(SOURCE, 'ast') is None  # No path, nowhere to look
+
+
+def test_edited_source_invalidates_the_entry(tmp_path):
+    script = str(tmp_path / 'loop.vlx')
+    store = cache.Cache()
+    store.parse(SOURCE, script)
+    edited = SOURCE.replace('4', '5')
+    assert store.get(edited, 'ast', script) is None
+    assert store.parse(edited, script) != store.parse(SOURCE, script)
+
+
+def test_implementation_change_invalidates_the_entry(tmp_path, monkeypatch):
+    store = cache.Cache(str(tmp_path))
+    store.parse(SOURCE)
+    monkeypatch.setitem(cache._implementation_tags, 'ast', b'a newer parser')
+    assert store.get(SOURCE, 'ast') is None
+
+
+def test_optimization_levels_are_cached_apart(tmp_path):
+    store = cache.Cache(str(tmp_path))
+    store.bytecode(SOURCE)
+    assert store.get(SOURCE, 'bytecode', optimize=1) is None
+    store.bytecode(SOURCE, optimize=1)
+    assert store.get(SOURCE, 'bytecode', optimize=1) is not None
+    assert len(entries(tmp_path)) == 3  # The AST, then bytecode at -O0 and -O1
+
+
+def test_corrupt_or_foreign_entries_are_misses(tmp_path):
+    script = str(tmp_path / 'loop.vlx')
+    store = cache.Cache()
+    store.parse(SOURCE, script)
+    key = cache.cache_key(SOURCE, 'ast')
+    entry = store.entry_path(key, 'ast', script)
+    with open(entry, 'wb') as corrupt:
+        corrupt.write(cache.MAGIC + key + b'\xff')
+    assert store.get(SOURCE, 'ast', script) is None
+    with open(entry, 'wb') as foreign:
+        foreign.write(b'not a velox cache entry')
+    assert store.get(SOURCE, 'ast', script) is None
+    assert store.parse(SOURCE, script) == parser.Parser(cache.lexer.Lexer(SOURCE).stream(), SOURCE).parse()
+
+
+def test_put_replaces_entries_atomically(tmp_path, monkeypatch):
+    store = cache.Cache(str(tmp_path))
+    replaced = []
+    real_replace = os.replace
+
+    def replace(source, destination):
+        # The entry is complete before it is moved into place.
+        with open(source, 'rb') as temporary:
+            assert temporary.read().startswith(cache.MAGIC)
+        assert os.path.dirname(source) == os.path.dirname(destination)
+        replaced.append(destination)
+        real_replace(source, destination)
+    monkeypatch.setattr(cache.os, 'replace', replace)
+    store.put(SOURCE, 'ast', ['first'])
+    store.put(SOURCE, 'ast', ['second'])
+    assert len(replaced) == 2 and replaced[0] == replaced[1]
+    assert entries(tmp_path) == [os.path.basename(replaced[0])]
+    assert store.get(SOURCE, 'ast') == ['second']
+    assert os.stat(replaced[0]).st_mode & 0o777 == 0o644
+
+
+def test_failed_writes_leave_no_files(tmp_path, monkeypatch):
+    store = cache.Cache(str(tmp_path))
+
+    def replace(source, destination):
+        raise OSError("disk full")
+    monkeypatch.setattr(cache.os, 'replace', replace)
+    store.put(SOURCE, 'ast', ['value'])
+    assert entries(tmp_path) == []
+    store.put(SOURCE, 'ast', object())  # Not marshallable
+    assert entries(tmp_path) == []
+
+
+def test_sources_with_syntax_errors_are_not_cached(tmp_path, capsys):
+    store = cache.Cache(str(tmp_path))
+    store.bytecode('x = ;\nprint(1);\n')
+    assert entries(tmp_path) == []
+
+
+@pytest.mark.parametrize('kind', ['bytecode', 'python_code'])
+def test_compiled_artifacts_round_trip(tmp_path, kind):
+    store = cache.Cache(str(tmp_path))
+    built = getattr(store, kind)(SOURCE)
+    loaded = getattr(store, kind)(SOURCE)
+    if kind == 'bytecode':
+        assert (loaded.instructions, loaded.names) == (built.instructions, built.names)
+    else:
+        assert loaded.co_code == built.co_code and loaded.co_consts == built.co_consts
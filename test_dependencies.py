@@ -0,0 +1,69 @@
+import threading
+
+import pytest
+
+import dependencies
+import lexer
+import output
+import parser
+import runtime
+
+
+def parse(source):
+    return parser.Parser(lexer.Lexer(source).stream(), source).parse()
+
+
+def run(engine_class, source, **variables):
+    """Run source on a new engine; return (output, variables, exception type name)."""
+    engine = engine_class(output.CaptureSink())
+    engine.variables.update(variables)
+    error = None
+    try:
+        engine.run(parse(source))
+    except Exception as e:
+        error = type(e).__name__
+    return engine.output.getvalue(), engine.variables, error
+
+
+def run_with_timeout(engine_class, source, seconds=30, **variables):
+    """run(), failing the test if the engine has not returned after seconds."""
+    result = []
+    thread = threading.Thread(target=lambda: result.append(run(engine_class, source, **variables)), daemon=True)
+    thread.start()
+    thread.join(seconds)
+    assert result, f"{engine_class.__name__} did not return within {seconds} seconds"
+    return result[0]
+
+
+def test_waves_group_independent_statements():
+    ast = parse('a = 1; b = 2; c = a + b; while (d < 3) {\n d = d + 1;\n}\n')
+    assert dependencies.waves(ast) == [[0, 1, 3], [2]]
+
+
+def test_independent_loops_keep_program_order():
+    source = ('a = 0;\nwhile (a < 3) {\n print("a" + a);\n a = a + 1;\n}\n'
+              'b = 0;\nwhile (b < 2) {\n print("b" + b);\n b = b + 1;\n}\n')
+    assert run(dependencies.ParallelRuntime, source) == run(runtime.Runtime, source)
+
+
+def test_failure_does_not_wait_for_endless_loops():
+    source = 'x = "a" - 1;\nwhile (y < 5) {\n z = 1;\n}\nwhile (w < 5) {\n q = 1;\n}\n'
+    expected = run(runtime.Runtime, source, y=0, w=0)
+    assert expected[2] == 'ValueError'
+    assert run_with_timeout(dependencies.ParallelRuntime, source, y=0, w=0) == expected
+
+
+def test_failing_loop_stops_an_endless_loop_in_a_worker():
+    source = 'while (v < 1) {\n v = "a" - 1;\n}\nwhile (y < 5) {\n z = 1;\n}\nprint("after");\n'
+    expected = run(runtime.Runtime, source, v=0, y=0)
+    assert run_with_timeout(dependencies.ParallelRuntime, source, v=0, y=0) == expected
+    # The stopped pool is replaced on the next run.
+    assert run(dependencies.ParallelRuntime, 'while (n < 2) {\n n = n + 1;\n}\nm = 1;\n', n=0)[1] == {'n': 2, 'm': 1}
+
+
+@pytest.mark.parametrize('source', [
+    'a = 1;\nwhile (b < 2) {\n b = b + 1;\n}\nc = "x" - 1;\nd = 4;\n',
+    'print("first");\nwhile (b < 2) {\n b = b + 1;\n print(b);\n}\nwhile (e < 1) {\n e = e - "q";\n}\n',
+])
+def test_failure_leaves_the_state_runtime_would(source):
+    assert run(dependencies.ParallelRuntime, source, b=0, e=0) == run(runtime.Runtime, source, b=0, e=0)
@@ -0,0 +1,74 @@
+import contextlib
+import io
+import random
+
+import pytest
+
+import incremental
+import lexer
+import parser
+
+SOURCE = ('x = 1;\nprint("start");\ni = 0;\nwhile (i < 3) {\n  x = x + i * 2;\n  if (x > 4) {\n'
+          '    print(x);\n  }\n  i = i + 1;\n}\ns = "a" + x;\nprint(s);\n')
+
+# Pieces of text inserted by the random edits: whole statements, tokens,
+# fragments that break a statement, and characters the lexer rejects.
+INSERTIONS = ['y = 2;\n', 'print(y);', 'while (y < 1) {\n', '}', '{', ';', '\n', ' ', 'x', '+ 1', '(',
+              ')', '"', '"text"', 'if (x == 2) {\n print("two");\n}\n', '<=', '=', '1.5', 'print', '#', '']
+
+
+def full_parse(text):
+    """Return (tokens, statements, error messages) from lexing and parsing text from scratch."""
+    tokens = list(lexer.Lexer(text).stream())
+    pars = parser.Parser(iter(tokens), text)
+    with contextlib.redirect_stdout(io.StringIO()):
+        statements = pars.parse()
+    return tokens, statements, [str(error) for error in pars.errors]
+
+
+def check(document, text):
+    """Check document against a full parse of text; return whether text lexes."""
+    assert document.source == text
+    try:
+        tokens, statements, errors = full_parse(text)
+    except lexer.LexerError as e:
+        assert str(e) in [str(error) for error in document.errors]
+        return False
+    assert list(document.tokens()) == tokens
+    assert document.ast == statements
+    assert [str(error) for error in document.errors] == errors
+    return True
+
+
+def test_document_parses_like_parser():
+    check(incremental.Document(SOURCE), SOURCE)
+    check(incremental.Document(''), '')
+
+
+@pytest.mark.parametrize('seed', range(6))
+def test_random_edits_match_a_full_parse(seed):
+    generator = random.Random(seed)
+    text = SOURCE
+    document = incremental.Document(text)
+    for _ in range(100):
+        offset = generator.randint(0, len(text))
+        deleted = min(generator.choice([0, 0, 1, 2, 5, 20]), len(text) - offset)
+        inserted = generator.choice(INSERTIONS)
+        removed = text[offset:offset + deleted]
+        document.edit(offset, deleted, inserted)
+        text = text[:offset] + inserted + text[offset + deleted:]
+        if not check(document, text):
+            # Undo an edit the lexer rejects, so later edits are checked
+            # against a full parse rather than the same lexer error.
+            document.edit(offset, len(inserted), removed)
+            text = text[:offset] + removed + text[offset + len(inserted):]
+            check(document, text)
+
+
+def test_edit_reports_the_replaced_chunks():
+    document = incremental.Document('a = 1;\nb = 2;\nc = 3;\n')
+    index, removed, added = document.edit(len('a = 1;\nb = '), 1, '5')
+    assert [chunk.ast for chunk in added] == [('assign', 'b', ('num', 5))]
+    assert document.chunks[index:index + len(added)] == added and removed == 1
+    with pytest.raises(ValueError):
+        document.edit(len(document.source), 1, '')
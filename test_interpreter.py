@@ -0,0 +1,76 @@
+import sys
+
+import pytest
+
+import interpreter
+import output
+
+
+def name(identifier):
+    return ('IDENTIFIER', identifier)
+
+
+def number(value):
+    return ('NUMBER', str(value))
+
+
+def run(ast, **options):
+    sink = output.CaptureSink()
+    interpreter.Interpreter(output_sink=sink, **options).interpret(ast)
+    return sink.getvalue()
+
+
+def countdown(depth, nesting=0):
+    """A non-tail recursive function whose call is nesting expressions and blocks deep."""
+    call = ('CALL', 'down', [('BINARY', name('n'), '-', number(1))])
+    for _ in range(nesting):
+        call = ('BINARY', number(0), '+', call)
+    body = [('RETURN', ('BINARY', number(1), '+', call))]
+    for _ in range(nesting):
+        body = [('IF', number(1), body)]
+    return [
+        ('FUNCTION', 'down', ['n'], [('IF', ('BINARY', name('n'), '<', number(1)), [('RETURN', number(0))])] + body),
+        ('PRINT', ('CALL', 'down', [number(depth)])),
+    ]
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+@pytest.mark.parametrize('nesting', [0, 40])
+def test_recursion_depth_is_not_limited_by_the_python_stack(compiled, nesting):
+    depth = sys.getrecursionlimit() * 5
+    assert run(countdown(depth, nesting), compiled=compiled, memoize=False) == f"{float(depth)}\n"
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_expression_nesting_is_not_limited_by_the_python_stack(compiled):
+    expr = number(1)
+    for _ in range(sys.getrecursionlimit() * 5):
+        expr = ('BINARY', number(1), '-', expr)
+    assert run([('PRINT', expr)], compiled=compiled) == "1.0\n"
+
+
+def test_deep_compiled_calls_move_to_the_task_stack():
+    engine = interpreter.Interpreter(compiled=True, output_sink=output.CaptureSink(), memoize=False)
+    depths = []
+    engine.define_host_function('probe', lambda: depths.append(engine.compiled_frames))
+    engine.interpret([
+        ('FUNCTION', 'down', ['n'], [
+            ('VAR_DECL', 'ignored', ('CALL', 'probe', [])),
+            ('IF', ('BINARY', name('n'), '<', number(1)), [('RETURN', number(0))]),
+            ('RETURN', ('BINARY', number(1), '+', ('CALL', 'down', [('BINARY', name('n'), '-', number(1))]))),
+        ]),
+        ('VAR_DECL', 'x', ('CALL', 'down', [number(2000)])),
+    ])
+    assert len(depths) == 2001 and 0 < max(depths) <= interpreter.MAX_COMPILED_FRAMES
+    assert engine.compiled_frames == 0 and engine.globals.get('x') == 2000
+
+
+def test_compiled_frames_are_released_after_an_error():
+    engine = interpreter.Interpreter(compiled=True, output_sink=output.CaptureSink(), memoize=False)
+    failing = [('FUNCTION', 'fail', ['n'], [
+        ('IF', ('BINARY', name('n'), '<', number(1)), [('RETURN', ('BINARY', ('STRING', '"a"'), '-', number(1)))]),
+        ('RETURN', ('BINARY', number(1), '+', ('CALL', 'fail', [('BINARY', name('n'), '-', number(1))]))),
+    ]), ('PRINT', ('CALL', 'fail', [number(2000)]))]
+    with pytest.raises(RuntimeError):
+        engine.interpret(failing)
+    assert engine.compiled_frames == 0
@@ -0,0 +1,123 @@
+import pytest
+
+import interpreter
+import memo
+import output
+
+
+def name(identifier):
+    return ('IDENTIFIER', identifier)
+
+
+def number(value):
+    return ('NUMBER', str(value))
+
+
+def function(params, body):
+    return {'params': params, 'body': body}
+
+
+def call(callee, *arguments):
+    return ('CALL', callee, list(arguments))
+
+
+def test_lru_cache_evicts_the_least_recently_used():
+    cache = memo.LRUCache(2)
+    purity = memo.Purity((), True)
+    keys = [memo.call_key(purity, [float(n)]) for n in range(3)]
+    assert cache.lookup(keys[0]) is memo.MISSING
+    cache.store(keys[0], None)
+    cache.store(keys[1], 'one')
+    assert cache.lookup(keys[0]) is None  # None is a result, not a miss
+    cache.store(keys[2], 'two')
+    assert cache.lookup(keys[1]) is memo.MISSING
+    assert [cache.lookup(key) for key in (keys[0], keys[2])] == [None, 'two']
+    assert cache.stats() == memo.Stats(hits=3, misses=2, evictions=1, size=2, maxsize=2)
+    cache.clear()
+    assert cache.stats() == memo.Stats(0, 0, 0, 0, 2)
+
+
+def test_functions_whose_results_go_unused_stop_being_memoized(monkeypatch):
+    monkeypatch.setattr(memo, 'GIVE_UP', 3)
+    cache = memo.LRUCache(1)
+    wasteful, useful = memo.Purity((), True), memo.Purity((), True)
+    for n in range(3):
+        cache.store(memo.call_key(wasteful, [float(n)]), n)
+    assert wasteful.wasted == 2 and wasteful.memoized
+    key = memo.call_key(useful, [0.0])
+    cache.store(key, 0)
+    cache.lookup(key)
+    cache.store(memo.call_key(useful, [1.0]), 1)
+    assert wasteful.wasted == 3 and not wasteful.memoized
+    assert useful.wasted == 0 and useful.memoized
+
+
+def test_call_keys():
+    purity = memo.Purity((), True)
+    assert memo.call_key(purity, [1.0, "a"]) == (purity, 1.0, "a")
+    assert memo.call_key(purity, [True]) != memo.call_key(purity, [1.0])
+    assert memo.call_key(purity, [-0.0]) is None
+    assert memo.call_key(purity, [{'params': []}]) is None
+    assert memo.call_key(purity, [None]) == (purity, (type(None), None))
+
+
+def test_pure_functions():
+    fib = function(['n'], [
+        ('IF', ('BINARY', name('n'), '<', number(2)), [('RETURN', name('n'))]),
+        ('VAR_DECL', 'a', call('fib', ('BINARY', name('n'), '-', number(1)))),
+        ('RETURN', ('BINARY', name('a'), '+', call('fib', ('BINARY', name('n'), '-', number(2))))),
+    ])
+    purity = memo.analyze(fib, {'fib': fib})
+    assert purity.pure and purity.memoized and purity.dependencies == (('fib', fib),)
+    assert purity.current({'fib': fib}) and not purity.current({'fib': dict(fib)})
+
+
+@pytest.mark.parametrize('body', [
+    [('PRINT', name('n'))],
+    [('ASSIGN', 'total', name('n'))],
+    [('RETURN', name('total'))],
+    [('RETURN', call('host'))],
+    [('RETURN', call('later'))],
+    [('RETURN', call('printer'))],
+    [('FUNCTION', 'local', [], []), ('RETURN', call('local'))],
+    [('RETURN', call('n'))],
+], ids=['prints', 'assigns a global', 'reads a global', 'calls a host function', 'calls an unbound name',
+        'calls an impure function', 'calls a local function', 'calls a parameter'])
+def test_impure_functions(body):
+    globals_ = {'host': print, 'printer': function([], [('PRINT', number(1))])}
+    assert not memo.analyze(function(['n'], body), globals_).pure
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_interpreter_memoizes_pure_calls_only(compiled):
+    engine = interpreter.Interpreter(compiled=compiled, output_sink=output.CaptureSink(), memo_size=8)
+    engine.interpret([
+        ('FUNCTION', 'square', ['n'], [('RETURN', ('BINARY', name('n'), '*', name('n')))]),
+        ('FUNCTION', 'shout', ['n'], [('PRINT', name('n')), ('RETURN', name('n'))]),
+        ('VAR_DECL', 'i', number(0)),
+        ('WHILE', ('BINARY', name('i'), '<', number(20)), [
+            ('VAR_DECL', 'a', call('square', ('BINARY', name('i'), '%', number(3)))),
+            ('VAR_DECL', 'b', call('shout', number(7))),
+            ('ASSIGN', 'i', ('BINARY', name('i'), '+', number(1))),
+        ]),
+        ('PRINT', call('square', number(12))),
+    ])
+    assert engine.output.getvalue() == "7.0\n" * 20 + "144.0\n"
+    assert engine.memo_stats() == memo.Stats(hits=17, misses=4, evictions=0, size=4, maxsize=8)
+    unmemoized = interpreter.Interpreter(output_sink=output.CaptureSink(), memoize=False)
+    assert unmemoized.memo_stats() == memo.Stats(0, 0, 0, 0, 0)
+
+
+@pytest.mark.parametrize('compiled', [False, True])
+def test_memo_cache_stays_bounded(compiled):
+    engine = interpreter.Interpreter(compiled=compiled, output_sink=output.CaptureSink(), memo_size=16)
+    engine.interpret([
+        ('FUNCTION', 'double', ['n'], [('RETURN', ('BINARY', name('n'), '*', number(2)))]),
+        ('VAR_DECL', 'i', number(0)),
+        ('WHILE', ('BINARY', name('i'), '<', number(100)), [
+            ('ASSIGN', 'i', ('BINARY', call('double', name('i')), '-', name('i'))),
+            ('ASSIGN', 'i', ('BINARY', name('i'), '+', number(1))),
+        ]),
+    ])
+    stats = engine.memo_stats()
+    assert (stats.size, stats.evictions, stats.misses) == (16, 84, 100)
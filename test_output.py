@@ -0,0 +1,134 @@
+import asyncio
+import io
+
+import pytest
+
+import lexer
+import output
+import parser
+import runtime
+
+
+class CountingStream(io.StringIO):
+    """A text stream that counts the writes it receives."""
+
+    def __init__(self, isatty=False):
+        super().__init__()
+        self.writes = 0
+        self._isatty = isatty
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+    def isatty(self):
+        return self._isatty
+
+
+class Writer:
+    """The parts of asyncio.StreamWriter AsyncSink uses."""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.drained = 0
+        self.closed = False
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        self.drained += 1
+
+    def close(self):
+        self.closed = True
+
+
+def parse(source):
+    return parser.Parser(lexer.Lexer(source).stream(), source).parse()
+
+
+def test_sink_is_abstract():
+    with pytest.raises(TypeError):
+        output.Sink()
+
+    class ListSink(output.Sink):
+        def __init__(self):
+            self.texts = []
+
+        def write(self, text):
+            self.texts.append(text)
+
+    with ListSink() as sink:
+        sink.print(1.5)
+        sink.print("a")
+    assert sink.texts == ["1.5\n", "a\n"]
+
+
+def test_stream_sink_writes_in_blocks():
+    stream = CountingStream()
+    sink = output.StreamSink(stream, buffer_size=10)
+    sink.print("abc")
+    sink.print("def")
+    assert stream.writes == 0
+    sink.print("ghi")
+    assert (stream.getvalue(), stream.writes) == ("abc\ndef\nghi\n", 1)
+    sink.write("j")
+    sink.flush()
+    assert (stream.getvalue(), stream.writes) == ("abc\ndef\nghi\nj", 2)
+
+
+def test_stream_sink_writes_lines_to_a_terminal():
+    stream = CountingStream(isatty=True)
+    sink = output.StreamSink(stream)
+    sink.print("a")
+    sink.write("b")
+    assert stream.getvalue() == "a\n"
+    sink.write("c\n")
+    assert stream.getvalue() == "a\nbc\n"
+    assert not output.StreamSink(CountingStream(isatty=True), line_buffered=False)._flush_lines
+
+
+def test_stream_sink_follows_sys_stdout(monkeypatch):
+    sink = output.StreamSink()
+    first, second = io.StringIO(), io.StringIO()
+    monkeypatch.setattr('sys.stdout', first)
+    sink.print("one")
+    sink.flush()
+    monkeypatch.setattr('sys.stdout', second)
+    sink.print("two")
+    sink.flush()
+    assert (first.getvalue(), second.getvalue()) == ("one\n", "two\n")
+
+
+def test_capture_sink():
+    sink = output.CaptureSink()
+    sink.print("é")
+    sink.write("x")
+    view = sink.getbuffer()
+    assert bytes(view) == "é\nx".encode()
+    view.release()
+    assert sink.getvalue() == "é\nx"
+    sink.clear()
+    assert sink.getvalue() == ""
+
+
+def test_async_sink_buffers_until_drained():
+    writer = Writer()
+    sink = output.AsyncSink(writer, buffer_size=8)
+    sink.print("abc")
+    assert writer.data == b""
+    sink.print("defgh")
+    assert writer.data == b"abc\ndefgh\n"
+    sink.print("i")
+    asyncio.run(sink.drain())
+    assert (writer.data, writer.drained) == (b"abc\ndefgh\ni\n", 1)
+    sink.close()
+    assert writer.closed
+
+
+def test_runtime_flushes_when_a_run_fails():
+    stream = CountingStream()
+    engine = runtime.Runtime(output.StreamSink(stream))
+    with pytest.raises(ValueError):
+        engine.run(parse('print("before"); x = "a" - 1;'))
+    assert stream.getvalue() == "before\n"
@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+import pytest
+
+import pool
+import values
+
+SQUARING = 'x = 3;\nwhile (x > 1) {\n x = x * x;\n}\n'
+
+
+def run(sandbox, source):
+    sandbox.run(pool.parse(source))
+    return sandbox
+
+
+def test_squaring_stops_within_the_time_budget():
+    start = time.monotonic()
+    with pytest.raises(pool.BudgetExceeded):
+        run(pool.SandboxedRuntime(max_seconds=1), SQUARING)
+    assert time.monotonic() - start < 2
+
+
+def test_products_are_checked_before_they_are_computed():
+    sandbox = pool.SandboxedRuntime(max_int_bits=1000)
+    with pytest.raises(pool.IntegerBudgetExceeded):
+        run(sandbox, SQUARING)
+    assert sandbox.variables['x'].bit_length() <= 1000
+
+    sandbox = pool.SandboxedRuntime(max_memory=10 ** 5, max_int_bits=None)
+    with pytest.raises(pool.MemoryBudgetExceeded):
+        run(sandbox, SQUARING)
+    assert sandbox.variables['x'].bit_length() <= 8 * 10 ** 5
+
+
+def test_products_of_other_values_are_unchanged():
+    sandbox = run(pool.SandboxedRuntime(max_int_bits=64), 'a = 2.5 * 4; b = "3" * 2; c = [1, 2] * 3; d = 7 * 6;')
+    assert sandbox.variables == {'a': 10.0, 'b': 6.0, 'c': values.make_array([3, 6]), 'd': 42}
+
+
+def test_instruction_budget():
+    sandbox = pool.SandboxedRuntime(max_instructions=100, check_every=16)
+    with pytest.raises(pool.InstructionBudgetExceeded):
+        run(sandbox, 'i = 0;\nwhile (i < 1000) {\n i = i + 1;\n}\n')
+    assert sandbox.instructions == 101
+    assert run(pool.SandboxedRuntime(max_instructions=100), 'i = 0;\nwhile (i < 50) {\n i = i + 1;\n}\n').variables == {'i': 50}
+
+
+def test_time_budget():
+    start = time.monotonic()
+    with pytest.raises(pool.TimeBudgetExceeded):
+        run(pool.SandboxedRuntime(max_seconds=0.2), 'while (x != 5) {\n y = 1;\n}\n')
+    assert time.monotonic() - start < 1
+
+
+def test_memory_budget():
+    sandbox = pool.SandboxedRuntime(max_memory=10 ** 4)
+    with pytest.raises(pool.MemoryBudgetExceeded):
+        run(sandbox, 's = ""; i = 0;\nwhile (i < 100000) {\n s = s + "0123456789";\n i = i + 1;\n}\n')
+    assert sandbox.memory <= 10 ** 4
+
+    # Reassigning a variable gives back the memory of its old value.
+    sandbox = run(pool.SandboxedRuntime(max_memory=10 ** 4),
+                  'i = 0;\nwhile (i < 1000) {\n s = "0123456789012345678901234567890123456789" + i;\n i = i + 1;\n}\n')
+    assert sandbox.memory < 400
+
+
+def test_memory_budget_counts_nested_arrays():
+    source = ('a = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]; b = [a, a, a, a, a, a, a, a];\n'
+              'c = [b, b, b, b, b, b, b, b]; d = [c, c, c, c, c, c, c, c];')
+    with pytest.raises(pool.MemoryBudgetExceeded):
+        pool.RuntimePool(max_memory=2000).run(source)
+    assert pool.value_size(values.make_array([values.make_array([1, 2]), 3])) > 3 * pool.value_size(3.0)
+    assert pool.RuntimePool(max_memory=10 ** 6).run(source + ' print(len(d));') == '8\n'
+
+
+def test_pool_reuses_reset_runtimes():
+    runtimes = pool.RuntimePool(size=1)
+    first = runtimes.acquire()
+    second = runtimes.acquire()
+    assert first is not second
+    run(first, 'x = 1 + 2;\nwhile (x < 5) {\n x = x + 1;\n}\nprint(x);\n')
+    assert first.inline_caches and first.predicates
+    first.counted_loops[0] = first.traces[0] = None
+    runtimes.release(first)
+    runtimes.release(second)  # The pool is full
+    assert runtimes.idle == [first]
+    assert (first.variables, first.inline_caches, first.predicates, first.counted_loops, first.traces) == ({}, {}, {}, {}, {})
+    assert first.output.getvalue() == '' and first.memory == 0 and first.instructions == 0
+    with runtimes.runtime() as sandbox:
+        assert sandbox is first
+    assert runtimes.run('print("a" + 1);') == 'a1\n'
+
+
+def test_pool_releases_runtimes_that_fail():
+    runtimes = pool.RuntimePool(max_instructions=10)
+    with pytest.raises(pool.InstructionBudgetExceeded):
+        runtimes.run('while (x != 1) {\n print(x);\n}\n')
+    sandbox = runtimes.idle[0]
+    assert sandbox.variables == {} and sandbox.output.getvalue() == ''
+    assert runtimes.run('print(2);') == '2\n'
+
+
+def test_run_async_yields_to_the_event_loop():
+    runtimes = pool.RuntimePool(yield_every=100)
+    ticks = []
+
+    async def ticker():
+        while True:
+            ticks.append(None)
+            await asyncio.sleep(0)
+
+    async def main():
+        task = asyncio.ensure_future(ticker())
+        try:
+            return await runtimes.run_async('i = 0;\nwhile (i < 5000) {\n i = i + 1;\n}\nprint(i);\n')
+        finally:
+            task.cancel()
+
+    assert asyncio.run(main()) == '5000\n'
+    assert len(ticks) >= 5000 // 100 - 1
+
+
+def test_run_async_enforces_budgets():
+    with pytest.raises(pool.InstructionBudgetExceeded):
+        asyncio.run(pool.RuntimePool(max_instructions=10).run_async('while (x != 1) {\n y = 1;\n}\n'))
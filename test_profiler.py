@@ -0,0 +1,66 @@
+import re
+
+import pytest
+
+import lexer
+import output
+import parser
+import profiler
+
+SOURCE = ('i = 0;\n'
+          'while (i < 5) {\n'
+          '  i = i + 1;\n'
+          '  if (i > 3) {\n'
+          '    print(i);\n'
+          '  }\n'
+          '}\n')
+
+
+def parse(source):
+    pars = parser.Parser(lexer.Lexer(source).stream(), source)
+    return pars, pars.parse()
+
+
+def test_parser_records_statement_positions():
+    pars, ast = parse(SOURCE)
+    loop = ast[1]
+    assert pars.line_column(pars.offset_of(ast[0])) == (1, 1)
+    assert pars.line_column(pars.offset_of(loop)) == (2, 1)
+    assert pars.line_column(pars.offset_of(loop[2][1][2][0])) == (5, 5)
+    # An equal tuple that the parser did not produce has no position.
+    assert pars.offset_of(tuple(list(ast[0]))) is None
+    # The table keeps its statements alive, so their ids stay unique.
+    assert all(entry[0] is not None for entry in pars.positions.values())
+    assert len(pars.positions) == 5
+
+
+def test_counts_lines_from_conditions():
+    pars, ast = parse(SOURCE)
+    profile = profiler.Profiler(pars.positions, pars.line_column)
+    sink = output.CaptureSink()
+    profile.run(ast, output_sink=sink)
+    assert sink.getvalue() == "4\n5\n"
+    counts = {line: count for line, count, *_ in profile.hot_lines(limit=None)}
+    assert counts == {1: 1, 2: 1, 3: 5, 4: 5, 5: 2}
+
+
+def test_failed_run_counts_statements_after_the_failure():
+    source = 'a = 1;\nb = "x" - 1;\nc = 2;\n'
+    pars, ast = parse(source)
+    profile = profiler.Profiler(pars.positions, pars.line_column)
+    with pytest.raises(ValueError):
+        profile.run(ast, output_sink=output.CaptureSink())
+    assert sorted(line for line, *_ in profile.hot_lines()) == [1, 2, 3]
+
+
+def test_samples_are_written_as_collapsed_stacks(tmp_path):
+    source = 'i = 0;\nwhile (i < 300000) {\n  j = i * 2;\n  i = i + 1;\n}\n'
+    pars, ast = parse(source)
+    profile = profiler.Profiler(pars.positions, pars.line_column, 'loop.vlx', interval=0.001)
+    profile.run(ast, output_sink=output.CaptureSink())
+    assert profile.samples > 0
+    lines = profile.collapsed()
+    assert all(re.fullmatch(r'loop\.vlx:2(;loop\.vlx:[34])? \d+', line) for line in lines)
+    path = tmp_path / 'profile.collapsed'
+    profile.write_collapsed(path)
+    assert path.read_text().splitlines() == lines
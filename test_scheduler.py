@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+import interpreter
+import output
+import scheduler
+
+
+def name(identifier):
+    return ('IDENTIFIER', identifier)
+
+
+def number(value):
+    return ('NUMBER', str(value))
+
+
+def counting(label, times):
+    """A program that calls record(label) on each of times loop iterations."""
+    return [
+        ('VAR_DECL', 'i', number(0)),
+        ('WHILE', ('BINARY', name('i'), '<', number(times)), [
+            ('VAR_DECL', 'ignored', ('CALL', 'record', [('STRING', f'"{label}"')])),
+            ('ASSIGN', 'i', ('BINARY', name('i'), '+', number(1))),
+        ]),
+        ('PRINT', name('i')),
+    ]
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_programs_take_turns():
+    order = []
+    tasks = scheduler.Scheduler({'record': order.append}, yield_every=1)
+    programs = run(tasks.run([counting('a', 3), counting('b', 3)]))
+    assert order == ['a', 'b', 'a', 'b', 'a', 'b']
+    assert [program.output for program in programs] == ["3.0\n", "3.0\n"]
+    assert all(program.error is None and program.latency >= 0 for program in programs)
+
+
+def test_a_long_program_does_not_hold_up_a_short_one():
+    order = []
+    tasks = scheduler.Scheduler({'record': order.append}, yield_every=10)
+    run(tasks.run([counting('long', 1000), counting('short', 20)]))
+    assert order.index('short') < 20 and order[-1] == 'long'
+    assert order.count('short') == 20
+
+
+def test_host_functions_can_be_awaited():
+    async def double(value):
+        await asyncio.sleep(0)
+        return value * 2
+
+    tasks = scheduler.Scheduler({'double': double})
+    programs = run(tasks.run([[('PRINT', ('CALL', 'double', [number(21)]))]]))
+    assert programs[0].output == "42.0\n"
+
+
+def test_errors_stay_with_their_program():
+    async def fail():
+        raise ValueError("host failure")
+
+    tasks = scheduler.Scheduler({'fail': fail, 'record': lambda label: None})
+    programs = run(tasks.run([
+        [('PRINT', ('STRING', '"before"')), ('PRINT', ('CALL', 'fail', [])), ('PRINT', ('STRING', '"after"'))],
+        counting('ok', 5),
+    ]))
+    failed, ok = programs
+    assert failed.output == "before\n" and isinstance(failed.error, RuntimeError)
+    assert str(failed.error) == "Runtime error: host failure"
+    assert ok.output == "5.0\n" and ok.error is None
+
+
+def test_spawn_and_join():
+    async def main():
+        tasks = scheduler.Scheduler()
+        sink = output.CaptureSink()
+        first = tasks.spawn([('PRINT', number(1))], output_sink=sink)
+        second = tasks.spawn([('WHILE', number(1), [])])  # Never finishes on its own
+        assert first.latency is None
+        await asyncio.sleep(0)
+        second.task.cancel()
+        programs = await tasks.join()
+        assert tasks.programs == [] and await tasks.join() == []
+        return sink, programs
+
+    sink, (first, second) = run(main())
+    assert sink.getvalue() == "1.0\n" and first.output == "1.0\n"
+    assert second.task.cancelled() and second.error is None and second.latency is not None
+
+
+def test_awaitable_host_functions_need_interpret_async():
+    async def later():
+        return 1
+
+    engine = interpreter.Interpreter(output_sink=output.CaptureSink())
+    engine.define_host_function('later', later)
+    with pytest.raises(RuntimeError, match="use interpret_async"):
+        engine.interpret([('PRINT', ('CALL', 'later', []))])
@@ -0,0 +1,157 @@
+import io
+
+import pytest
+
+import lexer
+import output
+import parser
+import runtime
+import specialize
+import values
+
+
+def engine(**variables):
+    engine = runtime.Runtime(output.CaptureSink())
+    engine.variables.update(variables)
+    return engine
+
+
+def parse(source):
+    return parser.Parser(lexer.Lexer(source).stream(), source).parse()
+
+
+def outcome(function, *arguments):
+    """The result of a call, or the type and message of what it raised."""
+    try:
+        return function(*arguments)
+    except Exception as e:
+        return type(e), str(e)
+
+
+def test_first_evaluation_specializes_the_site():
+    cache = specialize.InlineCache(('+', ('var', 'x'), ('num', 1)))
+    assert cache.state == 'unspecialized'
+    assert cache.evaluate(engine(x=1)) == 2
+    assert cache.evaluate(engine(x=5)) == 6
+    assert (cache.hits, cache.misses, cache.state) == (1, 1, 'specialized for int + int')
+
+
+def test_site_respecializes_until_it_is_megamorphic():
+    cache = specialize.InlineCache(('+', ('var', 'x'), ('var', 'y')))
+    operands = [(1, 2), (1.5, 2), ("a", 2), (1, 2.5), (values.Rope(["b" * 300], 1, 300), "c"), (3, 4)]
+    for changes, (x, y) in enumerate(operands[:specialize.MAX_CHANGES], 1):
+        assert cache.evaluate(engine(x=x, y=y)) == values.add(x, y)
+        assert cache.changes == changes
+    assert cache.state == 'megamorphic'
+    handler = cache.handler
+    for x, y in operands:
+        assert cache.evaluate(engine(x=x, y=y)) == values.add(x, y)
+    assert cache.handler is handler and cache.changes == specialize.MAX_CHANGES
+    assert specialize.stats([cache]).megamorphic == 1
+
+
+@pytest.mark.parametrize('op, x, y', [
+    ('+', 1, 2), ('+', "a", 1.5), ('+', 10 ** 400, 0.5), ('+', "7", 1),
+    ('-', 3, 0.5), ('-', "a", 1), ('-', "3", 1),
+    ('*', 2 ** 70, 3), ('*', 1e308, 10),
+    ('/', 1, 0), ('/', 7, 2), ('/', 10 ** 400, 3), ('/', 1.0, 0.0),
+    ('%', 7, -3), ('%', 1.5, 0.0), ('%', -7.5, 2),
+    ('+', values.make_array([1, 2]), 1), ('/', values.make_array([1, 2]), values.make_array([1, 0])),
+])
+def test_results_and_errors_match_values(op, x, y):
+    cache = specialize.InlineCache((op, ('var', 'x'), ('var', 'y')))
+    expected = outcome(values.BINARY_OPERATORS[op], x, y)
+    assert outcome(cache.evaluate, engine(x=x, y=y)) == expected  # Specializes
+    assert outcome(cache.evaluate, engine(x=x, y=y)) == expected  # Hits
+
+
+def test_unknown_operator_raises_after_evaluating_operands():
+    cache = specialize.InlineCache(('^', ('var', 'x'), ('num', 1)))
+    with pytest.raises(ValueError, match=r"Unknown operator: \^"):
+        cache.evaluate(engine(x=1))
+
+
+@pytest.mark.parametrize('op', ['==', '<', '>', '<=', '>=', '!='])
+def test_compiled_conditions(op):
+    predicate = specialize.compile_condition((op, ('var', 'x'), ('num', 2)))
+    for x in (1, 2, 2.5):
+        assert predicate(engine(x=x)) == specialize.COMPARISONS[op](x, 2)
+    with pytest.raises(ValueError, match="Unknown operator"):
+        specialize.compile_condition(('<>', ('var', 'x'), ('num', 2)))(engine(x=1))
+
+
+def test_compiled_conditions_read_unbound_names_as_themselves():
+    assert specialize.compile_condition(('==', ('var', 'x'), ('str', 'x')))(engine()) is True
+    assert specialize.compile_condition(('!=', ('var', 'x'), ('num', 2)))(engine()) is True
+
+
+def test_counted_loops():
+    step = ('assign', 'i', ('+', ('var', 'i'), ('num', 2)))
+    assert specialize.counted_loop(('<', ('var', 'i'), ('num', 9)), [step])[::2] == ('i', 9, 2)
+    assert specialize.counted_loop(('<', ('var', 'j'), ('num', 9)), [step]) is None
+    assert specialize.counted_loop(('<', ('var', 'i'), ('num', 9)), [step, ('print', ('var', 'i'))]) is None
+    assert specialize.counted_loop(('<', ('var', 'i'), ('str', '9')), [step]) is None
+    assert specialize.counted_loop(('<', ('var', 'i'), ('num', 9)),
+                                   [('assign', 'i', ('*', ('var', 'i'), ('num', 2)))]) is None
+
+
+def test_runtime_keeps_caches_of_the_last_run_only():
+    source = 'i = 0; t = 0;\nwhile (i < 3) {\n t = t + i;\n i = i + 1;\n}\nj = 0;\nwhile (j < 5) {\n j = j + 1;\n}\n'
+    runner = engine()
+    first = parse(source)
+    runner.run(first)
+    assert runner.inline_caches and runner.predicates and runner.counted_loops
+    nodes = [cache.node for cache in runner.inline_caches.values()]
+    runner.run(parse(source))
+    assert not any(cache.node is node for cache in runner.inline_caches.values() for node in nodes)
+    assert len(runner.inline_caches) == len(nodes)
+
+
+def test_loops_are_fused_unless_disabled():
+    ast = parse('i = 0;\nwhile (i < 5) {\n i = i + 1;\n}\n')
+    fused, unfused = engine(), runtime.Runtime(output.CaptureSink(), fuse_loops=False)
+    fused.run(ast)
+    unfused.run(ast)
+    assert fused.variables == unfused.variables == {'i': 5}
+    assert fused.counted_loops and not fused.inline_caches
+    assert not unfused.counted_loops and unfused.inline_caches
+
+
+def test_runtime_keeps_one_cache_per_operator_site():
+    runner = runtime.Runtime(output.CaptureSink(), fuse_loops=False)
+    runner.run(parse('i = 0; s = "";\nwhile (i < 10) {\n s = s + i;\n i = i + 1;\n}\nprint(s);\n'))
+    assert runner.output.getvalue() == "0123456789\n"
+    caches = sorted(runner.inline_caches.values(), key=lambda cache: cache.node[1][1])
+    assert [(cache.hits, cache.misses, cache.state) for cache in caches] == [
+        (9, 1, 'specialized for int + int'), (9, 1, 'specialized for str + int')]
+    assert all(runner.inline_caches[id(cache.node)] is cache for cache in caches)
+    assert specialize.stats(caches) == specialize.Stats(2, 18, 2, 0)
+
+
+def test_polymorphic_site_in_a_loop():
+    source = ('i = 0;\nwhile (i < 8) {\n k = i % 3;\n if (k == 0) {\n  x = 0;\n }\n if (k == 1) {\n  x = 0.5;\n }\n'
+              ' if (k == 2) {\n  x = "3";\n }\n y = x * 2;\n i = i + 1;\n}\nprint(y);\n')
+    runner = runtime.Runtime(output.CaptureSink(), fuse_loops=False)
+    runner.run(parse(source))
+    site = next(cache for cache in runner.inline_caches.values() if cache.operator == '*')
+    # x * 2 sees int, float and str operands in turn. str * int has no
+    # specialized handler, so only int and float change the site; once it is
+    # megamorphic it keeps the float handler it last specialized for.
+    assert (site.hits, site.misses, site.changes, site.state) == (1, 7, specialize.MAX_CHANGES, 'megamorphic')
+    assert (site.left_type, site.right_type) == (float, int)
+    assert runner.output.getvalue() == "1.0\n"
+
+
+def test_report_lists_the_sites_missing_most():
+    sites = [specialize.InlineCache(('+', ('var', 'x'), ('num', n))) for n in range(3)]
+    for x in (1, "a", 1.5, 2):
+        sites[0].evaluate(engine(x=x))
+    for x in (1, 2, 3):
+        sites[1].evaluate(engine(x=x))
+    report = io.StringIO()
+    specialize.report(sites, top=1, file=report)
+    lines = report.getvalue().splitlines()
+    assert lines[0] == "3 operator sites, 7 evaluations, 28.6% hits, 1 megamorphic"
+    assert lines[1:] == ["           0 hits        4 misses  '+': megamorphic"]
+    specialize.report([], file=report)
+    assert report.getvalue().splitlines()[-1] == "0 operator sites, 0 evaluations, 0.0% hits, 0 megamorphic"
@@ -0,0 +1,92 @@
+import pytest
+
+import lexer
+import output
+import parser
+import runtime
+import tracing
+
+SOURCE = 'x = 0;\nwhile (x < 2) {\n  x = x + 1;\n}\nif (x == 2) {\n  print("two");\n}\n'
+
+
+def parse(source):
+    return parser.Parser(lexer.Lexer(source).stream(), source).parse()
+
+
+@pytest.mark.parametrize('fuse_loops', [True, False])
+def test_event_log_records_every_step(fuse_loops):
+    ast = parse(SOURCE)
+    engine = runtime.Runtime(output.CaptureSink(), fuse_loops=fuse_loops)
+    log = tracing.EventLog()
+    engine.trace(log)
+    engine.run(ast)
+    assert [(event.kind, event.values) for event in log] == [
+        ('run', ()),
+        ('statement', ()), ('assign', (0,)),
+        ('statement', ()), ('condition', (True,)),
+        ('statement', ()), ('assign', (1,)), ('condition', (True,)),
+        ('statement', ()), ('assign', (2,)), ('condition', (False,)),
+        ('statement', ()), ('condition', (True,)),
+        ('statement', ()), ('print', ('two',)),
+    ]
+    assert log[0].node is ast and log[1].node is ast[0] and log[1].node_id == id(ast[0])
+    assert log[2].node == 'x' and log[4].node is ast[1][1]
+    timestamps = [event.timestamp for event in log]
+    assert timestamps == sorted(timestamps)
+    assert engine.output.getvalue() == "two\n"
+
+
+def test_detach_restores_the_runtime():
+    engine = runtime.Runtime(output.CaptureSink())
+    own_print = engine.print_value
+    log = tracing.EventLog()
+    engine.trace(log)
+    assert type(engine).__name__ == 'TracedRuntime' and engine.tracer is log
+    engine.trace(None)
+    assert type(engine) is runtime.Runtime and engine.print_value == own_print and engine.tracer is None
+    engine.run(parse(SOURCE))
+    assert log == [] and engine.variables == {'x': 2}
+    engine.trace(None)  # Detaching an untraced runtime does nothing
+    assert type(engine) is runtime.Runtime
+
+
+def test_attaching_again_replaces_the_tracer():
+    class Counting(runtime.Runtime):
+        def execute(self, statement):
+            self.executed = getattr(self, 'executed', 0) + 1
+            super().execute(statement)
+    engine = Counting(output.CaptureSink())
+    first, second = tracing.EventLog(), tracing.EventLog()
+    engine.trace(first)
+    engine.trace(second)
+    assert type(engine).__bases__ == (Counting,)
+    engine.run(parse('a = 1;\nprint(a);\n'))
+    assert first == [] and [event.kind for event in second] == ['run', 'statement', 'assign', 'statement', 'print']
+    assert engine.executed == 2
+    engine.trace(None)
+    assert type(engine) is Counting
+
+
+def test_debug_mode_prints_trace_lines_to_the_output():
+    engine = runtime.Runtime(output.CaptureSink())
+    engine.debug_mode = True
+    assert engine.debug_mode
+    engine.run(parse('a = 1;\nif (a > 0) {\n  print(a);\n}\n'))
+    engine.debug_mode = False
+    assert not engine.debug_mode
+    assert engine.output.getvalue().splitlines() == [
+        "DEBUG: Running AST",
+        "DEBUG: Executing statement: ('assign', 'a', ('num', 1))",
+        "DEBUG: Assigning a = 1",
+        "DEBUG: Executing statement: ('if', ('>', ('var', 'a'), ('num', 0)), [('print', ('var', 'a'))])",
+        "DEBUG: Condition ('>', ('var', 'a'), ('num', 0)) is True",
+        "DEBUG: Executing statement: ('print', ('var', 'a'))",
+        "DEBUG: Printing value: 1",
+        "1",
+    ]
+
+
+def test_text_tracer_prefix():
+    sink = output.CaptureSink()
+    tracing.TextTracer(sink, prefix='> ')(tracing.TraceEvent('print', None, None, ("hi",), 0))
+    assert sink.getvalue() == "> Printing value: hi\n"
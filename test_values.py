@@ -0,0 +1,64 @@
+import pytest
+
+import values
+
+OPERATORS = ['+', '-', '*', '/', '%']
+
+
+def arrays(monkeypatch, use_numpy):
+    """Two numeric arrays, stored with NumPy or as lists."""
+    if not use_numpy:
+        monkeypatch.setattr(values, 'numpy', None)
+    return values.make_array([1, 2.5, -3]), values.make_array([4, 0.5, 2])
+
+
+def test_elementwise_without_arrays_raises_type_error():
+    with pytest.raises(TypeError, match=r"unsupported operand types for \*"):
+        values.elementwise('*', 1, None)
+    error = TypeError("original")
+    with pytest.raises(TypeError, match="original"):
+        values.elementwise('+', 1, None, error)
+    with pytest.raises(TypeError):
+        values.subtract(None, 1)
+
+
+@pytest.mark.parametrize('op', OPERATORS)
+def test_list_arrays(monkeypatch, op):
+    a, b = arrays(monkeypatch, use_numpy=False)
+    function = values.BINARY_OPERATORS[op]
+    assert isinstance(a.items, list)
+    assert function(a, b).tolist() == [function(x, y) for x, y in zip(a.tolist(), b.tolist())]
+    assert function(a, 2).tolist() == [function(x, 2) for x in a.tolist()]
+    assert function(2, b).tolist() == [function(2, y) for y in b.tolist()]
+
+
+def test_list_arrays_of_other_values(monkeypatch):
+    monkeypatch.setattr(values, 'numpy', None)
+    mixed = values.make_array(["3", 1])
+    assert not mixed.numeric
+    assert values.subtract(mixed, 1).tolist() == [2.0, 0.0]
+    with pytest.raises(ValueError, match="different lengths"):
+        values.add(mixed, values.make_array([1]))
+
+
+@pytest.mark.parametrize('op', OPERATORS)
+def test_numpy_arrays_match_list_arrays(monkeypatch, op):
+    numpy = pytest.importorskip('numpy')
+    a, b = arrays(monkeypatch, use_numpy=True)
+    assert isinstance(a.items, numpy.ndarray)
+    function = values.BINARY_OPERATORS[op]
+    vectorized = [function(a, b), function(a, 2), function(2, b)]
+    a, b = arrays(monkeypatch, use_numpy=False)
+    assert [array.tolist() for array in vectorized] == [function(a, b).tolist(), function(a, 2).tolist(),
+                                                        function(2, b).tolist()]
+
+
+@pytest.mark.parametrize('use_numpy', [False, True])
+@pytest.mark.parametrize('op', ['/', '%'])
+def test_division_by_a_zero_element_raises(monkeypatch, use_numpy, op):
+    if use_numpy:
+        pytest.importorskip('numpy')
+    a, _ = arrays(monkeypatch, use_numpy)
+    zeros = values.make_array([1, 0, 1])
+    with pytest.raises(ZeroDivisionError):
+        values.BINARY_OPERATORS[op](a, zeros)
@@ -0,0 +1,105 @@
+# tracing.py
+#
+# Execution tracing for runtime.Runtime.
+#
+# The runtime's methods contain no tracing code at all. Attaching a tracer
+# switches the runtime to a subclass whose methods report structured events
+# around the original ones, and detaching it switches the class back, so a
+# runtime that is not being traced runs exactly the same code as one that
+# never was. See attach() for what switching the class costs.
+#
+# A tracer is any callable taking a TraceEvent. EventLog collects events in
+# a list and TextTracer formats them as lines on an output sink.
+
+import time
+from collections import namedtuple
+
+# kind is one of 'run', 'statement', 'assign', 'condition' and 'print'.
+# node_id identifies the AST node the event is about (its id()), and values
+# holds the values involved: the assigned value, the result of a condition
+# or the printed value. timestamp is time.perf_counter_ns().
+TraceEvent = namedtuple('TraceEvent', 'kind node_id node values timestamp')
+
+def attach(runtime, tracer):
+    """Start sending a runtime's trace events to tracer."""
+    detach(runtime)
+    clock = time.perf_counter_ns
+    base = type(runtime)
+    print_value = runtime.print_value
+
+    # Overriding methods in a subclass keeps tracing code out of the
+    # runtime's own methods. The subclass has to be swapped in, since the
+    # runtime already exists. CPython 3.11 moves the attributes of an
+    # instance whose class changes into a regular dict, which makes a bare
+    # attribute lookup about twice as slow, and this lasts after detaching.
+    # Engines read their attributes into locals on hot paths, so whole runs
+    # show no measurable difference ("benchmark.py trace"). profiler.py uses
+    # the same kind of subclass, but creates its engines from it.
+    class Traced(base):
+        untraced_class = base
+        untraced_print = print_value
+
+        def run(self, ast):
+            tracer(TraceEvent('run', id(ast), ast, (), clock()))
+            base.run(self, ast)
+
+        def execute(self, statement):
+            tracer(TraceEvent('statement', id(statement), statement, (), clock()))
+            base.execute(self, statement)
+
+        def assign_value(self, identifier, value):
+            base.assign_value(self, identifier, value)
+            tracer(TraceEvent('assign', None, identifier, (value,), clock()))
+
+        def evaluate_condition(self, condition):
+            result = base.evaluate_condition(self, condition)
+            tracer(TraceEvent('condition', id(condition), condition, (result,), clock()))
+            return result
+
+    def traced_print_value(value):
+        tracer(TraceEvent('print', None, None, (value,), clock()))
+        print_value(value)
+
+    Traced.__name__ = Traced.__qualname__ = f"Traced{base.__name__}"
+    runtime.__class__ = Traced
+    runtime.print_value = traced_print_value
+    runtime.tracer = tracer
+
+
+def detach(runtime):
+    """Stop tracing a runtime and restore its own methods."""
+    if getattr(runtime, 'tracer', None) is None:
+        return
+    traced = type(runtime)
+    runtime.__class__ = traced.untraced_class
+    runtime.print_value = traced.untraced_print
+    runtime.tracer = None
+
+
+class EventLog(list):
+    """A tracer that keeps every event."""
+
+    def __call__(self, event):
+        self.append(event)
+
+
+class TextTracer:
+    """A tracer that writes one readable line per event to an output sink."""
+
+    def __init__(self, sink, prefix='DEBUG: '):
+        self.sink = sink
+        self.prefix = prefix
+
+    def __call__(self, event):
+        kind, node = event.kind, event.node
+        if kind == 'run':
+            message = "Running AST"
+        elif kind == 'statement':
+            message = f"Executing statement: {node}"
+        elif kind == 'assign':
+            message = f"Assigning {node} = {event.values[0]}"
+        elif kind == 'condition':
+            message = f"Condition {node} is {event.values[0]}"
+        else:
+            message = f"Printing value: {event.values[0]}"
+        self.sink.print(f"{self.prefix}{message}")
@@ -0,0 +1,249 @@
+# transpiler.py
+#
+# Translates Velox ASTs into Python source, compiles it once and runs the
+# resulting code object, so programs execute at CPython bytecode speed.
+#
+# The generated program is a single function: Velox variables become Python
+# locals (prefixed with 'v_' so they never clash with helpers), loaded from
+# the runtime's variable dict on entry and written back on exit. Operators
+# and array operations call the functions in values.py, which the program
+# function finds in its globals under the names in HELPERS.
+#
+# Each assigned variable also has a flag, prefixed with 'a_', that its
+# assignments set, and only flagged variables are written back. An unbound
+# variable holds its own name, so b = b leaves its value unchanged, and
+# only the flag shows that b must now be stored, as a plain str. The
+# optimizer's temporaries get no flag and are never written back.
+
+import builtins
+import functools
+import math
+import types
+
+import runtime
+import values
+import velox
+from resolver import Unbound, is_temporary
+
+PYTHON_FUNCTION_NAME = '_velox_main'
+
+COMPARE_OPERATORS = ('==', '<', '>', '<=', '>=', '!=')
+
+# The name generated code uses for each binary operator; '+' is passed to
+# the program function as an argument.
+OPERATOR_NAMES = {'+': '_add', '-': '_sub', '*': '_mul', '/': '_div', '%': '_mod'}
+
+HELPERS = {
+    '_sub': values.subtract,
+    '_mul': values.multiply,
+    '_div': values.divide,
+    '_mod': values.modulo,
+    '_array': values.make_array,
+    '_index': values.index,
+    '_len': values.length,
+}
+
+
+class Transpiler:
+    """Translates the tuple AST produced by parser.Parser into Python source."""
+
+    def transpile(self, ast):
+        """Return the Python source of a function executing the program."""
+        self.loaded = {}
+        self.assigned = {}
+        body = []
+        self.emit_block(body, ast, 2)  # Emits 'pass' for an empty program
+
+        lines = [f"def {PYTHON_FUNCTION_NAME}(_variables, _print, _add, _unbound):"]
+        for name in self.loaded:
+            lines.append(f"    v_{name} = _variables[{name!r}] if {name!r} in _variables else _unbound({name!r})")
+        written = [name for name in self.assigned if not is_temporary(name)]
+        if not written:
+            return '\n'.join(lines + [line[4:] for line in body]) + '\n'
+
+        for name in written:
+            lines.append(f"    a_{name} = False")
+        lines.append("    try:")
+        lines.extend(body or ['        pass'])
+        lines.append("    finally:")
+        for name in written:
+            lines.append(f"        if a_{name}:")
+            lines.append(f"            _variables[{name!r}] = v_{name} if type(v_{name}) is not _unbound else str(v_{name})")
+        return '\n'.join(lines) + '\n'
+
+    def emit_block(self, lines, statements, depth):
+        """Append the translation of a sequence of statements."""
+        start = len(lines)
+        for statement in statements:
+            if statement is not None:
+                self.emit_statement(lines, statement, depth)
+        if len(lines) == start:
+            lines.append('    ' * depth + 'pass')
+
+    def emit_statement(self, lines, statement, depth):
+        """Append the translation of a single statement."""
+        indent = '    ' * depth
+        statement_type = statement[0]
+
+        if statement_type == 'print':
+            lines.append(f"{indent}_print({self.expression(statement[1])})")
+        elif statement_type == 'assign':
+            value = self.expression(statement[2])
+            lines.append(f"{indent}{self.variable(statement[1], store=True)} = {value}")
+            if not is_temporary(statement[1]):
+                lines.append(f"{indent}a_{statement[1]} = True")
+        elif statement_type in ('if', 'while'):
+            lines.append(f"{indent}{statement_type} {self.condition(statement[1])}:")
+            self.emit_block(lines, statement[2], depth + 1)
+        else:
+            raise ValueError(f"Unknown statement type: {statement_type}")
+
+    def condition(self, condition):
+        """Translate a comparison condition."""
+        op, left, right = condition
+        if op not in COMPARE_OPERATORS:
+            raise ValueError(f"Unknown operator: {op}")
+        return f"{self.expression(left)} {op} {self.expression(right)}"
+
+    def expression(self, expr):
+        """Translate an expression."""
+        if isinstance(expr, str):
+            if expr.startswith('"') and expr.endswith('"'):
+                return repr(expr[1:-1])
+            return self.variable(expr)
+
+        if isinstance(expr, tuple):
+            node_type = expr[0]
+            if node_type == 'num':
+                value = expr[1]
+                if type(value) is int or math.isfinite(value):
+                    return repr(value)
+                return f"float({str(value)!r})"
+            if node_type == 'str':
+                return repr(expr[1])
+            if node_type == 'var':
+                return self.variable(expr[1])
+            if node_type == 'array':
+                return f"_array([{', '.join(self.expression(element) for element in expr[1])}])"
+            if node_type == 'index':
+                return f"_index({self.expression(expr[1])}, {self.expression(expr[2])})"
+            if node_type == 'len':
+                return f"_len({self.expression(expr[1])})"
+
+            operator, left, right = expr
+            left, right = self.expression(left), self.expression(right)
+            if operator in OPERATOR_NAMES:
+                return f"{OPERATOR_NAMES[operator]}({left}, {right})"
+            raise ValueError(f"Unknown operator: {operator}")
+
+        return repr(expr)
+
+    def variable(self, name, store=False):
+        """Translate a variable reference, recording its use."""
+        self.loaded[name] = True
+        if store:
+            self.assigned[name] = True
+        return f"v_{name}"
+
+
+class DataclassTranspiler:
+    """Translates the dataclass AST from velox.Parser into Python source."""
+
+    OPERATORS = {
+        velox.TokenType.PLUS: '+',
+        velox.TokenType.MINUS: '-',
+        velox.TokenType.MULTIPLY: '*',
+    }
+
+    def transpile(self, statements):
+        """Return the Python source of a function executing the program."""
+        # Programs are straight-line code, so whether a variable has been
+        # assigned at any point is known statically.
+        self.assigned = set()
+        lines = [f"def {PYTHON_FUNCTION_NAME}(_variables, _print, _lookup, _divide):"]
+        for statement in statements:
+            if isinstance(statement, velox.AssignmentNode):
+                value = self.expression(statement.value)
+                self.assigned.add(statement.name)
+                lines.append(f"    _variables[{statement.name!r}] = v_{statement.name} = {value}")
+            elif isinstance(statement, velox.PrintNode):
+                lines.append(f"    _print({self.expression(statement.expression)})")
+            else:
+                raise RuntimeError(f"Invalid statement type: {type(statement)}")
+        if len(lines) == 1:
+            lines.append('    pass')
+        return '\n'.join(lines) + '\n'
+
+    def expression(self, node):
+        """Translate an expression node."""
+        if isinstance(node, velox.NumberNode):
+            return repr(node.value)
+        if isinstance(node, velox.VariableNode):
+            if node.name in self.assigned:
+                return f"v_{node.name}"
+            return f"_lookup(_variables, {node.name!r})"
+        if isinstance(node, velox.BinOpNode):
+            left, right = self.expression(node.left), self.expression(node.right)
+            if node.operator == velox.TokenType.DIVIDE:
+                return f"_divide({left}, {right})"
+            if node.operator in self.OPERATORS:
+                return f"({left} {self.OPERATORS[node.operator]} {right})"
+        raise RuntimeError(f"Invalid node type: {type(node)}")
+
+
+@functools.lru_cache(maxsize=256)
+def compile_source(source, filename='<velox>'):
+    """Compile generated Python source into the program function's code object."""
+    namespace = {}
+    exec(compile(source, filename, 'exec'), namespace)
+    return namespace[PYTHON_FUNCTION_NAME].__code__
+
+
+def make_function(code):
+    """Build a callable program function from its code object."""
+    return types.FunctionType(code, {'__builtins__': builtins, **HELPERS})
+
+
+class CompiledRuntime(runtime.Runtime):
+    """A runtime.Runtime that executes programs as compiled Python code."""
+
+    def __init__(self, output_sink=None):
+        super().__init__(output_sink)
+        self.transpiler = Transpiler()
+
+    def run(self, ast):
+        """Compile and execute a list of statements from the AST."""
+        self.run_code(compile_source(self.transpiler.transpile(ast)))
+
+    def run_code(self, code):
+        """Execute a code object produced by compile_source."""
+        try:
+            make_function(code)(self.variables, self.print_value, values.add, Unbound)
+        finally:
+            self.output.flush()
+
+
+class CompiledDataclassRuntime(velox.Runtime):
+    """A velox.Runtime that executes programs as compiled Python code."""
+
+    def __init__(self):
+        super().__init__()
+        self.transpiler = DataclassTranspiler()
+        self.print_value = print
+
+    def run(self, statements):
+        """Compile and execute the program."""
+        code = compile_source(self.transpiler.transpile(statements))
+        make_function(code)(self.variables, self.print_value, _lookup, _divide)
+
+
+def _lookup(variables, name):
+    if name not in variables:
+        raise RuntimeError(f"Variable '{name}' is not defined")
+    return variables[name]
+
+
+def _divide(left, right):
+    if right == 0:
+        raise RuntimeError("Division by zero")
+    return left / right
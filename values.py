@@ -0,0 +1,315 @@
+# values.py
+#
+# Velox values and the operators on them, shared by every engine for the
+# tuple AST so they all behave the same.
+#
+# Numbers are Python ints and floats. Integer literals are ints, and
+# arithmetic on ints stays exact and in ints, except '/' which always gives
+# a float; mixing an int with a float gives a float, as in Python. Other
+# operands, such as strings of digits, are converted with float(). '+'
+# concatenates when either side is a string.
+#
+# Concatenating into a string of ROPE_LENGTH characters or more gives a
+# Rope, which stores the pieces appended to it instead of copying the whole
+# string for every '+', so loops like s = s + "..." take linear rather than
+# quadratic time. A Rope behaves like the string it spells and is joined
+# into one when it is printed, compared, indexed or converted.
+#
+# An Array is a sequence value written as a literal such as [1, 2, 3];
+# numbers in arrays are stored as floats. The arithmetic operators apply to
+# arrays element by element, with a number on either side used for every
+# element, and a whole array operation is done as a single call: a numeric
+# array is stored as a NumPy float64 array when NumPy is installed, so a + b
+# on columns of millions of floats runs as one vectorized NumPy operation
+# instead of an interpreted loop. Without NumPy, and for arrays holding
+# strings or other arrays, elements are kept in a list and the operation
+# runs element by element in Python.
+#
+# The scalar operators check for two numbers first. Otherwise they convert
+# their operands and only look for arrays when that raises TypeError, which
+# float() does for an Array, so programs without arrays pay nothing for them.
+
+import itertools
+import operator
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+NUMBER_TYPES = (int, float)
+
+# Concatenations at least this long build a Rope instead of a str.
+ROPE_LENGTH = 256
+
+
+class Rope:
+    """A string built by concatenation, stored as a list of pieces.
+
+    A rope is the first count pieces of its list, and the ropes appended to
+    it share the same list. Appending to the rope that ends the list
+    extends the list in place, so a chain of appends takes amortized O(1)
+    time each; appending to an earlier rope copies its pieces first. The
+    text is joined when first needed and kept.
+    """
+    __slots__ = ('pieces', 'count', 'length', 'text')
+
+    def __init__(self, pieces, count, length):
+        self.pieces = pieces
+        self.count = count
+        self.length = length
+        self.text = None
+
+    def append(self, suffix):
+        """Return a Rope of this text followed by the string suffix."""
+        pieces = self.pieces
+        if len(pieces) != self.count:
+            pieces = pieces[:self.count]
+        pieces.append(suffix)
+        return Rope(pieces, self.count + 1, self.length + len(suffix))
+
+    def __str__(self):
+        text = self.text
+        if text is None:
+            pieces = self.pieces
+            text = self.text = ''.join(pieces if len(pieces) == self.count else pieces[:self.count])
+        return text
+
+    def __len__(self):
+        return self.length
+
+    def __float__(self):
+        return float(str(self))
+
+    def __eq__(self, other):
+        return str(self) == (str(other) if type(other) is Rope else other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __lt__(self, other):
+        return str(self) < (str(other) if type(other) is Rope else other)
+
+    def __le__(self, other):
+        return str(self) <= (str(other) if type(other) is Rope else other)
+
+    def __gt__(self, other):
+        return str(self) > (str(other) if type(other) is Rope else other)
+
+    def __ge__(self, other):
+        return str(self) >= (str(other) if type(other) is Rope else other)
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + sys.getsizeof(self.pieces) + self.length
+
+    def __reduce__(self):
+        return (str, (str(self),))  # Sent to other processes as a plain string
+
+    def __repr__(self):
+        return repr(str(self))
+
+
+TEXT_TYPES = (str, Rope)
+
+
+class Array:
+    """An immutable sequence value.
+
+    numeric is whether every element is a number. The elements of a
+    numeric array are a NumPy float64 array when NumPy is installed;
+    otherwise they are a list.
+    """
+    __slots__ = ('items', 'numeric')
+
+    def __init__(self, items, numeric=False):
+        self.items = items
+        self.numeric = numeric
+
+    def tolist(self):
+        """Return the elements as a list of Velox values."""
+        items = self.items
+        return items if isinstance(items, list) else items.tolist()
+
+    def __len__(self):
+        return len(self.items)
+
+    def __eq__(self, other):
+        return isinstance(other, Array) and self.tolist() == other.tolist()
+
+    def __hash__(self):
+        return hash(tuple(self.tolist()))
+
+    def __sizeof__(self):
+        items = self.items
+        size = object.__sizeof__(self)
+        if isinstance(items, list):
+            return size + items.__sizeof__()
+        return size + items.nbytes
+
+    def __str__(self):
+        return f"[{', '.join(str(item) for item in self.tolist())}]"
+
+    __repr__ = __str__
+
+
+def make_array(elements):
+    """Return an Array of the given values."""
+    elements = [float(element) if type(element) is int else element for element in elements]
+    numeric = all(type(element) is float for element in elements)
+    if numeric and numpy is not None:
+        return Array(numpy.array(elements, dtype=numpy.float64), True)
+    return Array(elements, numeric)
+
+
+def number(value):
+    """An operand as a number: ints and floats as they are, others through float()."""
+    if type(value) is int or type(value) is float:
+        return value
+    return float(value)
+
+
+def index(target, position):
+    """The value of target[position], for an Array or a string."""
+    position = number(position)
+    offset = int(position)
+    if offset != position:
+        raise ValueError(f"Index must be a whole number, not {position}")
+    if isinstance(target, Array):
+        item = target.items[offset]
+        return item if isinstance(target.items, list) else float(item)
+    if isinstance(target, TEXT_TYPES):
+        return str(target)[offset]
+    raise TypeError(f"Cannot index {type(target).__name__} values")
+
+
+def length(value):
+    """The value of len(value), for an Array or a string."""
+    if isinstance(value, (Array, str, Rope)):
+        return len(value)
+    raise TypeError(f"len() of {type(value).__name__} values is not defined")
+
+
+def concatenate(x, y):
+    """The '+' operator when either operand is a string."""
+    if type(x) is Rope:
+        return x.append(str(y))
+    x, y = str(x), str(y)
+    if len(x) + len(y) < ROPE_LENGTH:
+        return x + y
+    return Rope([x, y], 2, len(x) + len(y))
+
+
+def add(x, y):
+    """The '+' operator."""
+    if type(x) in NUMBER_TYPES and type(y) in NUMBER_TYPES:
+        return x + y
+    if isinstance(x, TEXT_TYPES) or isinstance(y, TEXT_TYPES):
+        return concatenate(x, y)
+    try:
+        return number(x) + number(y)
+    except TypeError as error:
+        return elementwise('+', x, y, error)
+
+
+def subtract(x, y):
+    """The '-' operator."""
+    if type(x) in NUMBER_TYPES and type(y) in NUMBER_TYPES:
+        return x - y
+    try:
+        return number(x) - number(y)
+    except TypeError as error:
+        return elementwise('-', x, y, error)
+
+
+def multiply(x, y):
+    """The '*' operator."""
+    if type(x) in NUMBER_TYPES and type(y) in NUMBER_TYPES:
+        return x * y
+    try:
+        return number(x) * number(y)
+    except TypeError as error:
+        return elementwise('*', x, y, error)
+
+
+def divide(x, y):
+    """The '/' operator."""
+    if type(x) in NUMBER_TYPES and type(y) in NUMBER_TYPES:
+        return x / y
+    try:
+        return number(x) / number(y)
+    except TypeError as error:
+        return elementwise('/', x, y, error)
+
+
+def modulo(x, y):
+    """The '%' operator."""
+    if type(x) in NUMBER_TYPES and type(y) in NUMBER_TYPES:
+        return x % y
+    try:
+        return number(x) % number(y)
+    except TypeError as error:
+        return elementwise('%', x, y, error)
+
+
+BINARY_OPERATORS = {
+    '+': add,
+    '-': subtract,
+    '*': multiply,
+    '/': divide,
+    '%': modulo,
+}
+
+# The operators on two numbers, ints or floats.
+NUMERIC_OPERATORS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '%': operator.mod,
+}
+
+if numpy is not None:
+    VECTOR_OPERATORS = {
+        '+': numpy.add,
+        '-': numpy.subtract,
+        '*': numpy.multiply,
+        '/': numpy.true_divide,
+        '%': numpy.remainder,  # Takes the sign of the divisor, like Python's %
+    }
+
+# The errors float division raises, where NumPy would produce inf or nan.
+ZERO_DIVISION_MESSAGES = {'/': 'float division by zero', '%': 'float modulo'}
+
+
+def elementwise(op, x, y, error=None):
+    """Apply an operator to arrays, or to an array and a single value.
+
+    The scalar operators call this when arithmetic on x and y raised
+    error, a TypeError, and it is raised again if neither is an Array.
+    """
+    x_array, y_array = isinstance(x, Array), isinstance(y, Array)
+    if not (x_array or y_array):
+        raise error if error is not None else TypeError(f"unsupported operand types for {op}")
+    if x_array and y_array and len(x) != len(y):
+        raise ValueError(f"Arrays of different lengths: {len(x)} and {len(y)}")
+
+    if (x.numeric if x_array else type(x) in NUMBER_TYPES) and (y.numeric if y_array else type(y) in NUMBER_TYPES):
+        left = x.items if x_array else x
+        right = y.items if y_array else y
+        if numpy is not None:
+            if op in ZERO_DIVISION_MESSAGES and not numpy.all(right):
+                raise ZeroDivisionError(ZERO_DIVISION_MESSAGES[op])
+            return Array(VECTOR_OPERATORS[op](left, right), True)
+        function = NUMERIC_OPERATORS[op]
+        left = left if x_array else itertools.repeat(left)
+        right = right if y_array else itertools.repeat(right)
+        return Array(list(map(function, left, right)), True)
+
+    function = BINARY_OPERATORS[op]
+    left = x.tolist() if x_array else itertools.repeat(x)
+    right = y.tolist() if y_array else itertools.repeat(y)
+    return make_array(map(function, left, right))
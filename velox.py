@@ -1,7 +1,9 @@
 # lexer.py
+from array import array
+from collections.abc import Sequence
 from dataclasses import dataclass
 from enum import Enum, auto
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
 class TokenType(Enum):
     NUMBER = auto()
@@ -16,6 +18,19 @@ class TokenType(Enum):
     RPAREN = auto()
     EOF = auto()
 
+# TokenType members indexed by their value, for decoding stored kinds.
+TOKEN_TYPES_BY_VALUE = (None,) + tuple(TokenType)
+
+SINGLE_CHARACTER_TOKENS = {
+    '+': TokenType.PLUS.value,
+    '-': TokenType.MINUS.value,
+    '*': TokenType.MULTIPLY.value,
+    '/': TokenType.DIVIDE.value,
+    '=': TokenType.ASSIGN.value,
+    '(': TokenType.LPAREN.value,
+    ')': TokenType.RPAREN.value,
+}
+
 @dataclass
 class Token:
     type: TokenType
@@ -26,6 +41,83 @@ class Token:
     def __str__(self):
         return f"Token({self.type}, '{self.value}', line={self.line}, col={self.column})"
 
+class TokenBuffer(Sequence):
+    """Compact struct-of-arrays storage for tokens.
+
+    Each token costs one byte for its kind and four bytes each for its start
+    and end offsets, line and column. It is a read-only sequence: indexing
+    returns a TokenView, which reads like a Token and only slices the value
+    out of the source on access, and slicing returns a list of them. Use
+    list() for a mutable list of tokens.
+    """
+    __slots__ = ('source', 'kinds', 'starts', 'ends', 'lines', 'columns')
+
+    def __init__(self, source: str):
+        self.source = source
+        self.kinds = array('B')
+        self.starts = array('I')
+        self.ends = array('I')
+        self.lines = array('I')
+        self.columns = array('I')
+
+    def append(self, kind: TokenType, start: int, end: int, line: int, column: int) -> None:
+        self.kinds.append(kind.value)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lines.append(line)
+        self.columns.append(column)
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [TokenView(self, i) for i in range(*index.indices(len(self.kinds)))]
+        if index < 0:
+            index += len(self.kinds)
+        if not 0 <= index < len(self.kinds):
+            raise IndexError("token index out of range")
+        return TokenView(self, index)
+
+    def __iter__(self) -> Iterator['TokenView']:
+        for index in range(len(self.kinds)):
+            yield TokenView(self, index)
+
+class TokenView:
+    """A lightweight, Token-compatible view of one token in a TokenBuffer."""
+    __slots__ = ('buffer', 'index')
+
+    def __init__(self, buffer: TokenBuffer, index: int):
+        self.buffer = buffer
+        self.index = index
+
+    @property
+    def type(self) -> TokenType:
+        return TOKEN_TYPES_BY_VALUE[self.buffer.kinds[self.index]]
+
+    @property
+    def value(self) -> Optional[str]:
+        buffer = self.buffer
+        if buffer.kinds[self.index] == TokenType.EOF.value:
+            return None
+        return buffer.source[buffer.starts[self.index]:buffer.ends[self.index]]
+
+    @property
+    def line(self) -> int:
+        return self.buffer.lines[self.index]
+
+    @property
+    def column(self) -> int:
+        return self.buffer.columns[self.index]
+
+    def __eq__(self, other):
+        if isinstance(other, (Token, TokenView)):
+            return (self.type, self.value, self.line, self.column) == (other.type, other.value, other.line, other.column)
+        return NotImplemented
+
+    def __str__(self):
+        return f"Token({self.type}, '{self.value}', line={self.line}, col={self.column})"
+
 class Lexer:
     def __init__(self, source: str):
         self.source = source
@@ -45,6 +137,12 @@ class Lexer:
             
         self.current_char = self.source[self.position] if self.position < len(self.source) else None
 
+    def skip_to(self, position: int):
+        """Move forward to a position on the current line."""
+        self.column += position - self.position
+        self.position = position
+        self.current_char = self.source[position] if position < len(self.source) else None
+
     def skip_whitespace(self):
         """Skip whitespace characters."""
         while self.current_char and self.current_char.isspace():
@@ -52,69 +150,79 @@ class Lexer:
 
     def read_number(self) -> Token:
         """Read a numeric token."""
-        result = ''
-        start_column = self.column
-        
-        while self.current_char and (self.current_char.isdigit() or self.current_char == '.'):
-            result += self.current_char
-            self.advance()
-            
-        return Token(TokenType.NUMBER, result, self.line, start_column)
+        return self.add_token(TokenType.NUMBER, self.position, self.number_end(self.position))
 
     def read_identifier(self) -> Token:
         """Read an identifier or keyword token."""
-        result = ''
-        start_column = self.column
-        
-        while self.current_char and (self.current_char.isalnum() or self.current_char == '_'):
-            result += self.current_char
-            self.advance()
-            
-        if result == 'print':
-            return Token(TokenType.PRINT, result, self.line, start_column)
-        return Token(TokenType.IDENTIFIER, result, self.line, start_column)
+        start = self.position
+        end = self.identifier_end(start)
+        if self.source[start:end] == 'print':
+            return self.add_token(TokenType.PRINT, start, end)
+        return self.add_token(TokenType.IDENTIFIER, start, end)
+
+    def number_end(self, position: int) -> int:
+        """Return the offset just past the number starting at position."""
+        source = self.source
+        while position < len(source) and (source[position].isdigit() or source[position] == '.'):
+            position += 1
+        return position
 
-    def tokenize(self) -> List[Token]:
-        """Convert source code into a list of tokens."""
-        tokens = []
+    def identifier_end(self, position: int) -> int:
+        """Return the offset just past the identifier starting at position."""
+        source = self.source
+        while position < len(source) and (source[position].isalnum() or source[position] == '_'):
+            position += 1
+        return position
+
+    def add_token(self, kind: TokenType, start: int, end: int) -> Token:
+        """Return the token spanning start:end and move past it."""
+        token = Token(kind, self.source[start:end], self.line, self.column)
+        self.skip_to(end)
+        return token
+
+    def tokenize(self) -> TokenBuffer:
+        """Convert the rest of the source code into a new buffer of tokens.
+
+        The buffer is a sequence of TokenViews rather than a list of Tokens;
+        the parser and anything else that indexes or iterates the tokens
+        works with either.
+        """
+        source, tokens = self.source, TokenBuffer(self.source)
+        number_end, identifier_end = self.number_end, self.identifier_end
+        number, identifier, print_ = TokenType.NUMBER.value, TokenType.IDENTIFIER.value, TokenType.PRINT.value
+        position, line = self.position, self.line
+        line_start = position - self.column + 1  # Offset of column 1 on the current line
         
-        while self.current_char is not None:
-            if self.current_char.isspace():
-                self.skip_whitespace()
-                continue
-                
-            if self.current_char.isdigit():
-                tokens.append(self.read_number())
+        while position < len(source):
+            char = source[position]
+            if char.isspace():
+                if char == '\n':
+                    line += 1
+                    line_start = position + 1
+                position += 1
                 continue
                 
-            if self.current_char.isalpha():
-                tokens.append(self.read_identifier())
-                continue
-                
-            # Single-character tokens
-            current_char = self.current_char
-            current_column = self.column
-            
-            if current_char == '+':
-                tokens.append(Token(TokenType.PLUS, '+', self.line, current_column))
-            elif current_char == '-':
-                tokens.append(Token(TokenType.MINUS, '-', self.line, current_column))
-            elif current_char == '*':
-                tokens.append(Token(TokenType.MULTIPLY, '*', self.line, current_column))
-            elif current_char == '/':
-                tokens.append(Token(TokenType.DIVIDE, '/', self.line, current_column))
-            elif current_char == '=':
-                tokens.append(Token(TokenType.ASSIGN, '=', self.line, current_column))
-            elif current_char == '(':
-                tokens.append(Token(TokenType.LPAREN, '(', self.line, current_column))
-            elif current_char == ')':
-                tokens.append(Token(TokenType.RPAREN, ')', self.line, current_column))
+            if char.isdigit():
+                kind, end = number, number_end(position)
+            elif char.isalpha():
+                end = identifier_end(position)
+                kind = print_ if source[position:end] == 'print' else identifier
             else:
-                raise SyntaxError(f"Invalid character '{current_char}' at line {self.line}, column {current_column}")
+                # Single-character tokens
+                kind, end = SINGLE_CHARACTER_TOKENS.get(char), position + 1
+                if kind is None:
+                    raise SyntaxError(f"Invalid character '{char}' at line {line}, column {position - line_start + 1}")
                 
-            self.advance()
+            tokens.kinds.append(kind)
+            tokens.starts.append(position)
+            tokens.ends.append(end)
+            tokens.lines.append(line)
+            tokens.columns.append(position - line_start + 1)
+            position = end
             
-        tokens.append(Token(TokenType.EOF, None, self.line, self.column))
+        self.position, self.line, self.column = position, line, position - line_start + 1
+        self.current_char = None
+        tokens.append(TokenType.EOF, position, position, line, self.column)
         return tokens
 
 # parser.py
@@ -145,7 +253,7 @@ class PrintNode:
     expression: Union['NumberNode', 'VariableNode', 'BinOpNode']
 
 class Parser:
-    def __init__(self, tokens: List[Token]):
+    def __init__(self, tokens: Sequence[Token]):
         self.tokens = tokens
         self.current = 0
 
@@ -0,0 +1,114 @@
+# vm.py
+
+import operator
+
+import output
+import values
+from compiler import (
+    Code, Compiler, BINARY_OPERATORS,
+    LOAD_CONST, LOAD_FAST, STORE_FAST, BINARY_OP, COMPARE_OP,
+    JUMP, POP_JUMP_IF_FALSE, POP_JUMP_IF_TRUE, PRINT,
+    BUILD_ARRAY, INDEX, LEN,
+)
+from resolver import Unbound, is_temporary
+
+# Indexed by the BINARY_OP / COMPARE_OP argument, in the same order as
+# compiler.BINARY_OPERATORS and compiler.COMPARE_OPERATORS.
+BINARY_FUNCTIONS = tuple(values.BINARY_OPERATORS[op] for op in BINARY_OPERATORS)
+COMPARE_FUNCTIONS = (
+    operator.eq, operator.lt, operator.gt,
+    operator.le, operator.ge, operator.ne,
+)
+
+
+class VM:
+    """A stack based virtual machine that executes compiled bytecode.
+
+    Produces the same results as runtime.Runtime for the same AST.
+    Variables live in a list of slots while code runs; self.variables is
+    only read when execution starts and updated when it ends, leaving
+    out the optimizer's temporaries.
+    """
+
+    def __init__(self, output_sink=None):
+        """Initialize the virtual machine."""
+        self.variables = {}
+        self.output = output_sink if output_sink is not None else output.StreamSink()
+        self.print_value = self.output.print  # Buffered; flushed when a run ends
+        self.compiler = Compiler()
+
+    def run(self, ast):
+        """Compile and execute a list of statements from the AST."""
+        if not isinstance(ast, Code):
+            ast = self.compiler.compile(ast)
+        try:
+            self.execute(ast)
+        finally:
+            self.output.flush()
+
+    def execute(self, code):
+        """Execute a Code object."""
+        variables = self.variables
+        names = code.names
+        slots = [variables[name] if name in variables else Unbound(name) for name in names]
+        # Whether each slot was stored to. A variable that was unbound holds
+        # its own name, and b = b stores the same value back.
+        assigned = [False] * len(names)
+        try:
+            self.dispatch(code.instructions, slots, assigned)
+        finally:
+            for slot, name in enumerate(names):
+                if assigned[slot] and not is_temporary(name):
+                    value = slots[slot]
+                    variables[name] = value if type(value) is not Unbound else str(value)
+
+    def dispatch(self, instructions, slots, assigned):
+        """Run instructions against a list of variable slots, flagging the slots stored to."""
+        end = len(instructions)
+        print_value = self.print_value
+        binary_functions = BINARY_FUNCTIONS
+        compare_functions = COMPARE_FUNCTIONS
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+
+        while pc < end:
+            opcode = instructions[pc]
+            arg = instructions[pc + 1]
+            pc += 2
+
+            if opcode == LOAD_FAST:
+                push(slots[arg])
+            elif opcode == LOAD_CONST:
+                push(arg)
+            elif opcode == STORE_FAST:
+                slots[arg] = pop()
+                assigned[arg] = True
+            elif opcode == BINARY_OP:
+                right = pop()
+                stack[-1] = binary_functions[arg](stack[-1], right)
+            elif opcode == COMPARE_OP:
+                right = pop()
+                stack[-1] = compare_functions[arg](stack[-1], right)
+            elif opcode == POP_JUMP_IF_TRUE:
+                if pop():
+                    pc = arg
+            elif opcode == POP_JUMP_IF_FALSE:
+                if not pop():
+                    pc = arg
+            elif opcode == JUMP:
+                pc = arg
+            elif opcode == PRINT:
+                print_value(pop())
+            elif opcode == BUILD_ARRAY:
+                elements = stack[len(stack) - arg:]
+                del stack[len(stack) - arg:]
+                push(values.make_array(elements))
+            elif opcode == INDEX:
+                position = pop()
+                stack[-1] = values.index(stack[-1], position)
+            elif opcode == LEN:
+                stack[-1] = values.length(stack[-1])
+            else:
+                raise ValueError(f"Unknown opcode: {opcode}")